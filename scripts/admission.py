@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# Per-model admission control.
+#
+# Each model gets a concurrency cap and a bounded wait queue. Requests beyond the
+# queue, or that wait past their deadline, are turned away with a 429 and a
+# Retry-After hint instead of piling up inside vLLM.
+#
+# Within a priority the queue is weighted-fair across callers (API keys): each
+# request is tagged with a virtual finish time, its caller's previous finish
+# time (or the current virtual time, if later) plus cost / weight, and the
+# lowest tag goes next. A caller with a deep backlog only gets slots nobody else
+# is waiting for, and a full queue sheds the newest request of whichever caller
+# holds the most of it rather than turning away a light caller.
+#
+# With several router workers (router_workers.py) each process has its own
+# controller: it is guaranteed its even share of a model's slots and queue, and
+# may also use the slots and queue places the other workers aren't using, as of
+# their last published counts.
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+
+DEFAULT_ADMISSION_SETTINGS = {
+    "max_concurrency": int(os.environ.get("ROUTER_MAX_CONCURRENCY", "16")),
+    "max_queue": int(os.environ.get("ROUTER_MAX_QUEUE", "64")),
+    "queue_timeout": float(os.environ.get("ROUTER_QUEUE_TIMEOUT", "30")),
+}
+
+# X-Priority header values; lower sorts first
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class Rejected(Exception):
+    """The request was not admitted; `retry_after` is a hint in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ModelAdmission:
+    def __init__(self, name, settings, workers=1, peer_load=None):
+        self.name = name
+        self.settings = settings
+        self.workers = workers
+        # (active, queued) of the other workers for a model name
+        self.peer_load = peer_load
+        self.active = 0
+        self.queued = 0
+        self._heap = []
+        self._seq = itertools.count()
+        # Weighted fair queuing: virtual time, last finish tag and queued entries per caller
+        self._vtime = 0.0
+        self._finish = {}
+        self._waiting = {}
+        self._weights = {}
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        # Moving average of how long a request holds its slot, for Retry-After
+        self.service_time = 1.0
+
+    def _shared(self, setting, index):
+        """A limit as it applies to this process: all of it, or with several
+        workers its share plus whatever the other workers leave unused."""
+        limit = self.settings[setting]
+        if self.workers <= 1 or self.peer_load is None:
+            return limit
+        return max(math.ceil(limit / self.workers), limit - self.peer_load(self.name)[index])
+
+    def concurrency(self):
+        return self._shared("max_concurrency", 0)
+
+    def queue_limit(self):
+        return self._shared("max_queue", 1)
+
+    def retry_after(self):
+        slots = max(1, self.settings["max_concurrency"])
+        return max(1, math.ceil(self.service_time * (self.queued + 1) / slots))
+
+    def _record_wait(self, waited):
+        self.admitted += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def _tags(self, key, weight, cost):
+        """(start, finish) virtual times for a request from caller `key`."""
+        if len(self._finish) > 1024:
+            # Tags at or behind the virtual time no longer matter
+            self._finish = {k: f for k, f in self._finish.items() if f > self._vtime or k in self._waiting}
+        start = max(self._vtime, self._finish.get(key, 0.0))
+        finish = self._finish[key] = start + cost / max(weight, 1e-9)
+        return start, finish
+
+    def _forget(self, entry):
+        """Takes a queued entry out of the per-caller accounting (the heap drops it lazily)."""
+        key = entry[4]
+        self.queued -= 1
+        waiting = self._waiting[key]
+        waiting.remove(entry)
+        if not waiting:
+            del self._waiting[key]
+            del self._weights[key]
+
+    def _make_room(self, key, weight):
+        """Sheds the newest request of the caller holding the largest weighted share of
+        a full queue, if that is more than `key` would hold with one more. Returns True
+        if a place was freed."""
+        share = (len(self._waiting.get(key, ())) + 1) / max(weight, 1e-9)
+        victim = max(self._waiting, key=lambda k: len(self._waiting[k]) / max(self._weights[k], 1e-9))
+        if victim == key or len(self._waiting[victim]) / max(self._weights[victim], 1e-9) <= share:
+            return False
+        entry = self._waiting[victim][-1]
+        self._forget(entry)
+        self.rejected += 1
+        entry[3].set_exception(Rejected(f"Model '{self.name}' is at capacity", self.retry_after()))
+        return True
+
+    async def acquire(self, priority=1, timeout=None, key=None, weight=1.0, cost=1.0):
+        """Waits for a slot; returns the time spent queued. Raises Rejected.
+
+        `key` identifies the caller for fair queuing, `weight` is its share and
+        `cost` the request's size (e.g. estimated tokens).
+        """
+        start, finish = self._tags(key, weight, cost)
+        if self.active < self.concurrency() and not self.queued:
+            self._vtime = start
+            self.active += 1
+            self._record_wait(0.0)
+            return 0.0
+        if self.queued >= self.queue_limit() and not (self._waiting and self._make_room(key, weight)):
+            self._finish[key] -= finish - start
+            self.rejected += 1
+            raise Rejected(f"Model '{self.name}' is at capacity", self.retry_after())
+
+        timeout = self.settings["queue_timeout"] if timeout is None else min(timeout, self.settings["queue_timeout"])
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, finish, next(self._seq), future, key, start]
+        heapq.heappush(self._heap, entry)
+        self._waiting.setdefault(key, []).append(entry)
+        self._weights[key] = weight
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except Rejected:
+            # Shed to make room for a lighter caller (see _make_room)
+            raise
+        except asyncio.TimeoutError:
+            self._forget(entry)
+            self.timed_out += 1
+            raise Rejected(f"Timed out after {timeout:.0f}s waiting for '{self.name}'", self.retry_after()) from None
+        except asyncio.CancelledError:
+            # Client went away while queued; if a slot was handed over meanwhile, pass it on
+            if future.done() and not future.cancelled():
+                if future.exception() is None:
+                    self.release()
+            else:
+                self._forget(entry)
+            raise
+        waited = time.monotonic() - started
+        self._record_wait(waited)
+        return waited
+
+    def release(self, held=None):
+        """Frees a slot (handing it straight to the next waiter, if any)."""
+        if held is not None:
+            self.service_time = 0.8 * self.service_time + 0.2 * held
+        # Other workers may have taken slots since this one was handed out
+        if self.active <= self.concurrency() and self._hand_over():
+            return
+        self.active -= 1
+
+    def rebalance(self):
+        """Admits waiters into slots the other workers have since left free."""
+        while self.active < self.concurrency() and self._hand_over():
+            self.active += 1
+
+    def _hand_over(self):
+        """Gives the current slot to the next live waiter; False if there is none."""
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            future = entry[3]
+            if not future.done():
+                self._forget(entry)
+                self._vtime = entry[5]
+                future.set_result(None)
+                return True
+        return False
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_avg_ms": round(1000 * self.wait_total / self.admitted, 3) if self.admitted else 0.0,
+            "wait_max_ms": round(1000 * self.wait_max, 3),
+            "queued_by_key": {str(key): len(entries) for key, entries in self._waiting.items()},
+            "limits": self.settings,
+        }
+
+
+class AdmissionController:
+    """One ModelAdmission per model, with per-model overrides of the defaults."""
+
+    def __init__(self, defaults=None, workers=1, peer_load=None):
+        self.defaults = dict(defaults or DEFAULT_ADMISSION_SETTINGS)
+        self.models = {}
+        # Router workers sharing the limits, and what the others use per model
+        self.workers = workers
+        self.peer_load = peer_load
+
+    def get(self, name, overrides=None):
+        admission = self.models.get(name)
+        if admission is None:
+            settings = dict(self.defaults)
+            settings.update(overrides or {})
+            admission = self.models[name] = ModelAdmission(name, settings, self.workers, self.peer_load)
+        return admission
+
+    def discard(self, name):
+        """Forgets a model's controller, so the next get() applies new overrides.
+
+        Requests holding or waiting for a slot keep using the old one."""
+        self.models.pop(name, None)
+
+    def rebalance(self):
+        for admission in self.models.values():
+            admission.rebalance()
+
+    def stats(self):
+        return {name: admission.stats() for name, admission in self.models.items()}
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# Per-API-key identity, fair-share weight and rate limits.
+#
+# A caller is identified by its bearer token: a key listed in ROUTER_API_KEYS (a
+# JSON file of {"<token>": {"name": "batch", "weight": 0.25, ...}}) gets its own
+# name and settings; any other token is tracked under a hash of it, and requests
+# without one share the "anonymous" identity. Each caller has two token buckets,
+# requests per minute and tokens per minute (0 = unlimited), each holding up to
+# a minute's worth. A request is charged its estimated tokens (prompt bytes / 4
+# plus max_tokens) when it is admitted, and the difference is settled from the
+# backend's reported usage when it finishes.
+#
+# With several router workers each keeps its own buckets, and also takes from
+# them what the other workers' callers took (as of their last published
+# totals), so a caller's limits hold across all workers.
+import hashlib
+import json
+import math
+import os
+import time
+
+from admission import Rejected
+
+DEFAULT_KEY_SETTINGS = {
+    # Share of a busy model's queue relative to other callers
+    "weight": float(os.environ.get("ROUTER_KEY_WEIGHT", "1")),
+    "requests_per_minute": float(os.environ.get("ROUTER_KEY_RPM", "0")),
+    "tokens_per_minute": float(os.environ.get("ROUTER_KEY_TPM", "0")),
+}
+API_KEYS_FILE = os.environ.get("ROUTER_API_KEYS")
+
+# Completion budget assumed for requests that don't set max_tokens
+DEFAULT_MAX_TOKENS = int(os.environ.get("ROUTER_DEFAULT_MAX_TOKENS", "512"))
+
+ANONYMOUS = "anonymous"
+
+
+def estimate_tokens(prompt_bytes, payload):
+    """Rough token cost of a request before it runs: prompt length plus max_tokens."""
+    max_tokens = payload.get("max_tokens") or payload.get("max_completion_tokens") or DEFAULT_MAX_TOKENS
+    try:
+        max_tokens = int(max_tokens)
+    except (TypeError, ValueError):
+        max_tokens = DEFAULT_MAX_TOKENS
+    return prompt_bytes // 4 + max(0, max_tokens)
+
+
+class TokenBucket:
+    """Refills at `per_minute` / 60 per second, up to a minute's worth."""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` can be taken (a request larger than the bucket
+        only needs it full, and leaves it in debt)."""
+        self._refill()
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= amount
+
+    def give(self, amount):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class ClientLimits:
+    """Rate limits and counters of one caller."""
+
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = settings
+        self.weight = settings["weight"]
+        self.requests = TokenBucket(settings["requests_per_minute"]) if settings["requests_per_minute"] > 0 else None
+        self.tokens = TokenBucket(settings["tokens_per_minute"]) if settings["tokens_per_minute"] > 0 else None
+        self.admitted = 0
+        self.rejected = 0
+        self.tokens_charged = 0
+        self.tokens_used = 0
+        # Net requests and tokens taken from the buckets, published to other workers
+        self.taken = [0, 0]
+
+    def _take(self, requests, tokens):
+        for bucket, amount in ((self.requests, requests), (self.tokens, tokens)):
+            if bucket is None or not amount:
+                continue
+            if amount > 0:
+                bucket.take(amount)
+            else:
+                bucket.give(-amount)
+
+    def charge(self, estimate):
+        """Takes one request and `estimate` tokens from the buckets. Raises Rejected."""
+        waits = []
+        if self.requests is not None:
+            waits.append((self.requests.wait_time(1), "requests"))
+        if self.tokens is not None:
+            waits.append((self.tokens.wait_time(estimate), "tokens"))
+        wait, kind = max(waits, default=(0.0, None))
+        if wait > 0:
+            self.rejected += 1
+            raise Rejected(f"Rate limit exceeded for '{self.name}' ({kind} per minute)", max(1, math.ceil(wait)))
+        self._take(1, estimate)
+        self.taken[0] += 1
+        self.taken[1] += estimate
+        self.admitted += 1
+        self.tokens_charged += estimate
+
+    def refund(self, estimate):
+        """Undoes a charge for a request that will be charged again when it is retried."""
+        self._take(-1, -estimate)
+        self.taken[0] -= 1
+        self.taken[1] -= estimate
+        self.admitted -= 1
+        self.tokens_charged -= estimate
+
+    def settle(self, estimate, used):
+        """Corrects a charge once the real token count is known (refunding what
+        wasn't used, or taking the overrun). `used` None leaves the estimate."""
+        if used is None:
+            used = estimate
+        self.tokens_used += used
+        self._take(0, used - estimate)
+        self.taken[1] += used - estimate
+
+    def stats(self):
+        return {
+            "weight": self.weight,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "tokens_charged": self.tokens_charged,
+            "tokens_used": self.tokens_used,
+            "requests_available": None if self.requests is None else math.floor(self.requests.level),
+            "tokens_available": None if self.tokens is None else math.floor(self.tokens.level),
+            "limits": self.settings,
+        }
+
+
+class ClientRegistry:
+    """Maps Authorization headers to callers and keeps one ClientLimits per caller."""
+
+    def __init__(self, keys=None, defaults=None):
+        self.defaults = dict(defaults or DEFAULT_KEY_SETTINGS)
+        # token -> caller name, and caller name -> settings overrides
+        self.names = {}
+        self.overrides = {}
+        for token, entry in (keys or {}).items():
+            name = entry.get("name") or _hashed(token)
+            self.names[token] = name
+            self.overrides[name] = {k: v for k, v in entry.items() if k in self.defaults}
+        self.clients = {}
+        # Last totals seen from each other worker: (worker, pid) -> {name: [requests, tokens]}
+        self.peer_taken = {}
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def identify(self, authorization):
+        """Caller name for an Authorization header value (or None)."""
+        if not authorization or not authorization.strip():
+            return ANONYMOUS
+        scheme, _, token = authorization.strip().partition(" ")
+        token = token.strip() if scheme.lower() == "bearer" else authorization.strip()
+        return self.names.get(token) or _hashed(token)
+
+    def get(self, name):
+        client = self.clients.get(name)
+        if client is None:
+            settings = dict(self.defaults)
+            settings.update(self.overrides.get(name, {}))
+            client = self.clients[name] = ClientLimits(name, settings)
+        return client
+
+    def absorb(self, peer, taken):
+        """Charges callers what another worker (`peer`, e.g. (id, pid)) took since its last totals."""
+        seen = self.peer_taken.setdefault(peer, {})
+        for name, (requests, tokens) in taken.items():
+            before = seen.get(name, (0, 0))
+            self.get(name)._take(requests - before[0], tokens - before[1])
+            seen[name] = (requests, tokens)
+
+    def taken(self):
+        return {name: client.taken for name, client in self.clients.items()}
+
+    def stats(self):
+        return {name: client.stats() for name, client in self.clients.items()}
+
+
+def _hashed(token):
+    # Unlisted keys are told apart without keeping or reporting the token itself
+    return "key-" + hashlib.sha256(token.encode()).hexdigest()[:12]
+
+
+def usage_tokens(observer):
+    """Tokens a finished request actually used, from the usage the backend reported.
+
+    0 if the backend never answered successfully, None if it didn't report usage.
+    """
+    if observer is None or observer.status is None or observer.status >= 400:
+        return 0
+    if observer.prompt_tokens is None or observer.completion_tokens is None:
+        return None
+    return observer.prompt_tokens + observer.completion_tokens
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# Raw-ASGI front end of the router.
+#
+# Proxied requests never go through FastAPI's request/middleware machinery:
+# headers are filtered once, on the raw (bytes, bytes) pairs of the ASGI scope,
+# and a large request body (e.g. a base64 image for llava) is streamed upstream
+# as it arrives instead of being read whole into router memory. Only the
+# router's own endpoints (/v1/models, /metrics, /admin/...) reach the app.
+import json
+import re
+
+# Bodies up to this size are read whole so they can be parsed (model, cache key,
+# prefix affinity); larger ones are streamed upstream after their first chunks
+DEFAULT_MAX_BUFFERED_BODY = 1024 * 1024
+
+# Request headers the router itself looks at (they are forwarded as well);
+# authorization identifies the caller for fair sharing and rate limits
+CONTROL_HEADERS = {
+    b"content-length", b"cache-control", b"x-priority", b"x-queue-timeout", b"x-cache-bypass", b"authorization",
+}
+# Request headers never forwarded: httpx sets its own host, length and framing
+HOP_HEADERS = {b"host", b"content-length", b"transfer-encoding", b"connection"}
+
+# First "model" string field anywhere in the raw JSON - usually the top-level one,
+# but a nested object's "model" earlier in the body wins. Quotes inside strings
+# are escaped, so prompt text can't produce a match
+MODEL_RE = re.compile(rb'"model"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+class ClientDisconnected(Exception):
+    """The client went away while its request body was still being read."""
+
+
+def valid_authorization(value):
+    """False for an empty Authorization header or a "Bearer" with no token."""
+    return value.strip() not in (b"", b"Bearer")
+
+
+def sanitize_headers(raw):
+    """Drops malformed Authorization headers, which FastAPI and LiteLLM reject."""
+    return [(name, value) for name, value in raw if name != b"authorization" or valid_authorization(value)]
+
+
+def split_headers(raw):
+    """One pass over the raw headers: (headers to forward, {control header: value})."""
+    forward = []
+    control = {}
+    for name, value in raw:
+        if name == b"authorization" and not valid_authorization(value):
+            continue
+        if name in CONTROL_HEADERS:
+            control[name.decode()] = value.decode("latin1")
+        if name not in HOP_HEADERS:
+            forward.append((name, value))
+    return forward, control
+
+
+def sniff_model(prefix):
+    """Returns the "model" field found in the start of a JSON body, or None."""
+    match = MODEL_RE.search(prefix)
+    if match is None:
+        return None
+    try:
+        # The value is still JSON-escaped (e.g. "org\/model" or "\u0071wen")
+        return json.loads(b'"' + match.group(1) + b'"')
+    except ValueError:
+        return None
+
+
+async def read_body(receive, limit):
+    """Reads request body messages until the body ends or more than `limit` bytes
+    have been read. Returns (data, more), `more` being True if the body continues."""
+    parts = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ClientDisconnected()
+        chunk = message.get("body", b"")
+        if chunk:
+            parts.append(chunk)
+            size += len(chunk)
+        if not message.get("more_body", False):
+            return b"".join(parts), False
+        if size > limit:
+            return b"".join(parts), True
+
+
+class BodyStream:
+    """A request body streamed upstream: the part already read, then the rest as it arrives."""
+
+    def __init__(self, prefix, receive):
+        self.prefix = prefix
+        self.receive = receive
+
+    async def __aiter__(self):
+        yield self.prefix
+        while True:
+            message = await self.receive()
+            if message["type"] == "http.disconnect":
+                raise ClientDisconnected()
+            chunk = message.get("body", b"")
+            if chunk:
+                yield chunk
+            if not message.get("more_body", False):
+                return
+
+
+class ProxyRequest:
+    """What the proxy path needs from an incoming request, read straight off the ASGI scope."""
+
+    __slots__ = ("method", "path", "headers", "control", "content", "streamed", "started", "trace")
+
+    def __init__(self, method, path, headers, control, content, streamed, started):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.control = control
+        # bytes, or a BodyStream when `streamed`
+        self.content = content
+        self.streamed = streamed
+        self.started = started
+        # request_tracing.Trace, if the request is traced
+        self.trace = None
+
+
+async def read_request(scope, receive, started, max_buffered=DEFAULT_MAX_BUFFERED_BODY, trace=None):
+    """Builds a ProxyRequest, reading the body whole if it is at most `max_buffered`
+    bytes. Otherwise only enough of it to find the "model" field is read (up to
+    `max_buffered`), and the rest is left to stream upstream. `trace`, if given,
+    gets a "read_body" phase once the headers are filtered."""
+    headers, control = split_headers(scope["headers"])
+    if trace is not None:
+        trace.phase("read_body")
+    path = scope["path"]
+    if scope.get("query_string"):
+        path += "?" + scope["query_string"].decode("latin1")
+
+    try:
+        declared = int(control.get("content-length", ""))
+    except ValueError:
+        declared = None
+    big = declared is not None and declared > max_buffered
+    content, more = await read_body(receive, 0 if big else max_buffered)
+    while more and len(content) <= max_buffered and sniff_model(content) is None:
+        chunk, more = await read_body(receive, 0)
+        content += chunk
+    if not more:
+        return ProxyRequest(scope["method"], path, headers, control, content, False, started)
+
+    if declared is not None:
+        # Lets the backend see the length up front rather than a chunked body
+        headers.append((b"content-length", str(declared).encode()))
+    return ProxyRequest(scope["method"], path, headers, control, BodyStream(content, receive), True, started)
+
+
+class ProxyMiddleware:
+    """Passes requests for the app's own routes to the app (with sanitized headers)
+    and every other HTTP request to `proxy(scope, receive, send)`."""
+
+    def __init__(self, app, proxy, routes):
+        self.app = app
+        self.proxy = proxy
+        self.routes = routes
+        self.paths = None
+        self.patterns = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.paths is None:
+            # Routes are all registered by the time the first request arrives
+            self.paths = {route.path for route in self.routes if "{" not in route.path}
+            self.patterns = [route.path_regex for route in self.routes if "{" in route.path]
+        if scope["path"] in self.paths or any(pattern.match(scope["path"]) for pattern in self.patterns):
+            scope = dict(scope, headers=sanitize_headers(scope["headers"]))
+            await self.app(scope, receive, send)
+            return
+        await self.proxy(scope, receive, send)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# Background health/metadata poller for the model backends.
+#
+# Keeps an in-memory snapshot of every backend's state and /v1/models payload so
+# the router can answer /v1/models from memory and fail fast on backends that are
+# known to be down, instead of fanning out to every port on every request.
+import asyncio
+import random
+import time
+
+import httpx
+
+UP = "up"
+WARMING = "warming"
+DOWN = "down"
+UNKNOWN = "unknown"
+
+TIMEOUTS = (asyncio.TimeoutError, httpx.TimeoutException)
+
+
+class BackendState:
+    def __init__(self, name):
+        self.name = name
+        self.state = UNKNOWN
+        self.models = []
+        self.last_checked = 0.0
+        self.last_change = 0.0
+        # When a poll last succeeded (0.0 if none has)
+        self.last_ok = 0.0
+        self.failures = 0
+        self.latency = None
+
+    def as_dict(self):
+        return {
+            "state": self.state,
+            "last_checked": self.last_checked,
+            "last_change": self.last_change,
+            "failures": self.failures,
+            "latency_ms": round(self.latency * 1000, 3) if self.latency is not None else None,
+        }
+
+
+class HealthMonitor:
+    """Polls every backend on a jittered interval and keeps the latest snapshot.
+
+    `fetch(name)` must return the backend's parsed /v1/models payload, or raise.
+    `names()` returns the backends to poll, so the set can change at runtime.
+    If `warm_up(name, model_card, down_since)` is given, a backend coming back
+    from DOWN stays WARMING until it returns, and only then becomes UP.
+    A backend is DOWN after `down_after` failed polls in a row; before that a
+    timeout makes it UNKNOWN and other errors leave its state as it was.
+    """
+
+    def __init__(self, fetch, names, interval=2.0, jitter=0.2, ttl=None, warm_up=None, down_after=3):
+        self.fetch = fetch
+        self.names = names
+        self.warm_up = warm_up
+        self.down_after = down_after
+        self.interval = interval
+        self.jitter = jitter
+        # A snapshot older than this is no longer trusted (e.g. the poller stalled)
+        self.ttl = ttl if ttl is not None else interval * 3
+        self.backends = {}
+        # Bumped whenever anything observable changes, so callers can cache
+        # whatever they derive from the snapshot
+        self.version = 0
+        self._task = None
+        self._warming = {}
+
+    def get(self, name):
+        backend = self.backends.get(name)
+        if backend is None:
+            backend = self.backends[name] = BackendState(name)
+        return backend
+
+    def _set(self, backend, state, models):
+        if backend.state != state or backend.models != models:
+            backend.state = state
+            backend.models = models
+            backend.last_change = time.time()
+            self.version += 1
+
+    async def refresh(self, name):
+        backend = self.get(name)
+        started = time.perf_counter()
+        try:
+            payload = await self.fetch(name)
+            models = payload.get("data", [])
+        except Exception as e:
+            backend.failures += 1
+            backend.latency = None
+            if backend.failures >= self.down_after:
+                self._set(backend, DOWN, [])
+            elif isinstance(e, TIMEOUTS):
+                # A busy backend can miss one poll; don't fail its requests fast for that
+                self._set(backend, UNKNOWN, backend.models)
+        else:
+            backend.failures = 0
+            backend.latency = time.perf_counter() - started
+            backend.last_ok = time.time()
+            if backend.state == WARMING:
+                pass  # _warm() makes it UP once the warm-up is done
+            elif backend.state == DOWN and self.warm_up is not None:
+                down_since = backend.last_change
+                self._set(backend, WARMING, models)
+                self._warming[name] = asyncio.ensure_future(self._warm(backend, down_since))
+            else:
+                self._set(backend, UP, models)
+        backend.last_checked = time.time()
+        return backend
+
+    async def _warm(self, backend, down_since):
+        try:
+            await self.warm_up(backend.name, backend.models[0] if backend.models else {}, down_since)
+        except Exception as e:
+            print(f"Warm-up of {backend.name} failed: {e}")
+        finally:
+            self._warming.pop(backend.name, None)
+        # It may have gone down again while warming
+        if backend.state == WARMING:
+            self._set(backend, UP, backend.models)
+
+    async def refresh_all(self):
+        await asyncio.gather(*(self.refresh(name) for name in self.names()))
+
+    async def _run(self):
+        while True:
+            await self.refresh_all()
+            # Jitter so polls from several routers don't synchronise
+            delay = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+            await asyncio.sleep(delay)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._warming.values()):
+            task.cancel()
+
+    def forget(self, name):
+        """Drops a backend that is no longer polled (e.g. removed from the registry)."""
+        if self.backends.pop(name, None) is not None:
+            self.version += 1
+        task = self._warming.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+    def state(self, name):
+        backend = self.backends.get(name)
+        if backend is None or time.time() - backend.last_checked > self.ttl:
+            return UNKNOWN
+        return backend.state
+
+    def is_down(self, name):
+        return self.state(name) == DOWN
+
+    def snapshot(self):
+        return {name: backend.as_dict() for name, backend in self.backends.items()}
+
+    def export(self):
+        """Every backend's state and models, for absorb() in another process."""
+        return {
+            name: dict(backend.as_dict(), models=backend.models, last_ok=backend.last_ok)
+            for name, backend in self.backends.items()
+        }
+
+    def absorb(self, states):
+        """Takes over backend states polled by another process (see export())."""
+        for name, state in states.items():
+            backend = self.get(name)
+            self._set(backend, state["state"], state["models"])
+            backend.last_change = state["last_change"]
+            backend.last_checked = state["last_checked"]
+            backend.last_ok = state["last_ok"]
+            backend.failures = state["failures"]
+            backend.latency = state["latency_ms"] / 1000 if state["latency_ms"] is not None else None
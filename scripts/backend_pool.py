@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# Per-backend upstream connection pools for the federated router.
+#
+# Each backend (a model port, or LiteLLM) gets its own httpx.AsyncClient so a hot
+# model can't starve the others of connections, and a cold model's idle sockets
+# expire on their own. Limits come from the ROUTER_POOL_* environment variables and
+# can be overridden per model with a "pool" entry in MODELS, e.g.
+#
+#   "qwen-0.5": {..., "pool": {"max_connections": 128, "max_keepalive": 32}}
+import asyncio
+import os
+import time
+import httpx
+
+DEFAULT_POOL_SETTINGS = {
+    "max_connections": int(os.environ.get("ROUTER_POOL_MAX_CONNECTIONS", "64")),
+    "max_keepalive": int(os.environ.get("ROUTER_POOL_MAX_KEEPALIVE", "16")),
+    "keepalive_expiry": float(os.environ.get("ROUTER_POOL_KEEPALIVE_EXPIRY", "15")),
+    "http2": os.environ.get("ROUTER_HTTP2", "0") == "1",
+}
+
+# Generations can take minutes; only connecting should fail fast
+UPSTREAM_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+try:
+    import h2  # noqa: F401 - only needed for http2=True
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class BackendPool:
+    """A keep-alive connection pool to a single upstream, with live stats."""
+
+    def __init__(self, name, base_url, settings):
+        self.name = name
+        self.base_url = base_url
+        self.settings = settings
+        http2 = settings["http2"] and HTTP2_AVAILABLE
+        if settings["http2"] and not HTTP2_AVAILABLE:
+            print(f"HTTP/2 requested for {name} but 'h2' is not installed, using HTTP/1.1")
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=http2,
+            timeout=UPSTREAM_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings["max_connections"],
+                max_keepalive_connections=settings["max_keepalive"],
+                keepalive_expiry=settings["keepalive_expiry"],
+            ),
+        )
+        self.waiting = 0
+        self.requests = 0
+        self.connects = 0
+        self.connect_time_total = 0.0
+        self.connect_time_max = 0.0
+
+    def _make_trace(self):
+        # httpcore calls this for every step of a request. A request stops "waiting"
+        # once it starts writing headers, i.e. once it owns a connection.
+        state = {"waiting": True, "connect_started": None}
+
+        async def trace(event_name, info):
+            if event_name == "connection.connect_tcp.started":
+                state["connect_started"] = time.perf_counter()
+            elif event_name == "connection.connect_tcp.complete" and state["connect_started"]:
+                elapsed = time.perf_counter() - state["connect_started"]
+                self.connects += 1
+                self.connect_time_total += elapsed
+                self.connect_time_max = max(self.connect_time_max, elapsed)
+            elif event_name.endswith("send_request_headers.started") and state["waiting"]:
+                state["waiting"] = False
+                self.waiting -= 1
+
+        return trace, state
+
+    def build_request(self, method, url, **kwargs):
+        return self.client.build_request(method, url, **kwargs)
+
+    async def send(self, request, stream=False):
+        trace, state = self._make_trace()
+        request.extensions["trace"] = trace
+        self.requests += 1
+        self.waiting += 1
+        try:
+            return await self.client.send(request, stream=stream)
+        finally:
+            if state["waiting"]:
+                self.waiting -= 1
+
+    async def get(self, url, **kwargs):
+        return await self.send(self.build_request("GET", url, **kwargs))
+
+    def busy(self):
+        return self.waiting > 0 or any(not c.is_idle() for c in self.client._transport._pool.connections)
+
+    async def close_when_idle(self, poll=1.0, timeout=UPSTREAM_TIMEOUT.read):
+        """Closes the pool once no request is using it (or after `timeout` seconds)."""
+        deadline = time.monotonic() + timeout
+        while self.busy() and time.monotonic() < deadline:
+            await asyncio.sleep(poll)
+        await self.aclose()
+
+    def stats(self):
+        connections = self.client._transport._pool.connections
+        idle = sum(1 for c in connections if c.is_idle())
+        return {
+            "base_url": self.base_url,
+            "in_use": len(connections) - idle,
+            "idle": idle,
+            "waiting": self.waiting,
+            "requests": self.requests,
+            "connects": self.connects,
+            "connect_time_avg_ms": round(1000 * self.connect_time_total / self.connects, 3) if self.connects else 0.0,
+            "connect_time_max_ms": round(1000 * self.connect_time_max, 3),
+            "limits": self.settings,
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class PoolManager:
+    """Lazily creates one BackendPool per upstream."""
+
+    def __init__(self, defaults=None):
+        self.defaults = dict(defaults or DEFAULT_POOL_SETTINGS)
+        self.pools = {}
+        # Discarded pools still finishing their requests
+        self.retiring = set()
+
+    def get(self, name, base_url, overrides=None):
+        pool = self.pools.get(name)
+        if pool is None:
+            settings = dict(self.defaults)
+            settings.update(overrides or {})
+            pool = BackendPool(name, base_url, settings)
+            self.pools[name] = pool
+        return pool
+
+    def discard(self, name):
+        """Forgets a backend's pool, so the next get() applies new overrides.
+
+        The old pool is closed once the requests still using it are done."""
+        pool = self.pools.pop(name, None)
+        if pool is not None:
+            self.retiring.add(pool)
+            task = asyncio.ensure_future(pool.close_when_idle())
+            task.add_done_callback(lambda _: self.retiring.discard(pool))
+
+    def stats(self):
+        return {name: pool.stats() for name, pool in self.pools.items()}
+
+    async def aclose(self):
+        for pool in list(self.pools.values()) + list(self.retiring):
+            await pool.aclose()
+        self.pools.clear()
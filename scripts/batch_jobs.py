@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# Offline batch jobs (OpenAI-style /v1/batches) run inside the router.
+#
+# A job is a JSONL file of requests ({"custom_id", "method", "url", "body"} per
+# line), uploaded through /v1/files or referenced by a local path. It runs in the
+# background at low priority, and each result is appended to the job's output
+# (or error) JSONL as soon as its request finishes. Those files double as the
+# checkpoint: a job interrupted by a restart resumes with the requests whose
+# custom_id isn't in them yet.
+#
+# Concurrency adapts to the target model: it grows while the model has free
+# slots, shrinks while other callers are queued for it, and halves when the
+# router answers 429 or 503.
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+BATCH_DIR = Path(os.environ.get("ROUTER_BATCH_DIR", str(PROJECT_ROOT / "run" / "batches")))
+MAX_CONCURRENCY = int(os.environ.get("ROUTER_BATCH_MAX_CONCURRENCY", "32"))
+# Attempts per request when the router answers 429/502/503/504 or fails to connect
+MAX_ATTEMPTS = int(os.environ.get("ROUTER_BATCH_ATTEMPTS", "5"))
+# Seconds between rewrites of a running job's batch.json
+CHECKPOINT_INTERVAL = 2.0
+
+ENDPOINTS = ("/v1/chat/completions", "/v1/completions", "/v1/embeddings")
+RETRY_STATUSES = {429, 502, 503, 504}
+FINAL = ("completed", "failed", "cancelled")
+FILE_ID_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+# Validation problems reported per job
+MAX_PROBLEMS = 20
+
+
+class BatchError(ValueError):
+    """A batch or file that can't be created, with the problems found."""
+
+    def __init__(self, message, problems=None):
+        super().__init__(message)
+        self.problems = problems or []
+
+
+def validate_input(path, endpoint):
+    """Checks every line of a batch input file; returns the number of requests."""
+    problems = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                problems.append({"line": number, "message": "not valid JSON"})
+                continue
+            if not isinstance(entry, dict):
+                problems.append({"line": number, "message": "must be an object"})
+                continue
+            custom_id = entry.get("custom_id")
+            if not isinstance(custom_id, str) or not custom_id:
+                problems.append({"line": number, "message": "missing custom_id"})
+            elif custom_id in seen:
+                problems.append({"line": number, "message": f"duplicate custom_id {custom_id!r}"})
+            seen.add(custom_id)
+            if entry.get("method", "POST") != "POST":
+                problems.append({"line": number, "message": "method must be POST"})
+            if entry.get("url") != endpoint:
+                problems.append({"line": number, "message": f"url must be the batch's endpoint {endpoint}"})
+            if not isinstance(entry.get("body"), dict):
+                problems.append({"line": number, "message": "missing body"})
+            if len(problems) >= MAX_PROBLEMS:
+                break
+    if problems:
+        raise BatchError(f"{path} has invalid requests", problems)
+    if not seen:
+        raise BatchError(f"{path} has no requests")
+    return len(seen)
+
+
+def finished_ids(path):
+    """custom_ids of the results in an output file, dropping a torn last line."""
+    if not path.exists():
+        return set()
+    data = path.read_bytes()
+    end = data.rfind(b"\n") + 1
+    if end < len(data):
+        # Written partly when the router stopped: that request runs again
+        with open(path, "r+b") as f:
+            f.truncate(end)
+    return {json.loads(line)["custom_id"] for line in data[:end].splitlines() if line.strip()}
+
+
+class Concurrency:
+    """Additive-increase, multiplicative-decrease limit on a job's requests in flight.
+
+    Until the first sign of contention the limit doubles every round trip (slow
+    start), after that it grows by one per round trip.
+    """
+
+    def __init__(self, maximum=MAX_CONCURRENCY, initial=2):
+        self.maximum = max(1, maximum)
+        self.limit = float(min(initial, self.maximum))
+        self.slow_start = True
+        self.decreased_at = 0.0
+
+    def success(self, free_slots):
+        if free_slots > 0:
+            step = 1.0 if self.slow_start else 1 / self.limit
+            self.limit = min(self.maximum, self.limit + step)
+        elif free_slots < 0:
+            self.slow_start = False
+            self.limit = max(1.0, self.limit - 1 / self.limit)
+
+    def overloaded(self):
+        self.slow_start = False
+        now = time.monotonic()
+        # One halving per second, not one per request caught in the same overload
+        if now - self.decreased_at >= 1.0:
+            self.limit = max(1.0, self.limit / 2)
+            self.decreased_at = now
+
+
+def raise_failed(tasks):
+    """Re-raises the first exception of finished request tasks, so it fails the job."""
+    for task in tasks:
+        if task.exception() is not None:
+            raise task.exception()
+
+
+async def cancel_all(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class BatchJob:
+    """A batch's state (persisted as batch.json) and its progress while running."""
+
+    def __init__(self, directory, state):
+        self.directory = directory
+        self.state = state
+        self.task = None
+        self.concurrency = Concurrency()
+        self.in_flight = 0
+        self.started = None
+        self.done_at_start = 0
+        self.saved_at = 0.0
+
+    @property
+    def id(self):
+        return self.state["id"]
+
+    @property
+    def output_path(self):
+        return self.directory / "output.jsonl"
+
+    @property
+    def errors_path(self):
+        return self.directory / "errors.jsonl"
+
+    def done(self):
+        counts = self.state["request_counts"]
+        return counts["completed"] + counts["failed"]
+
+    def save(self):
+        self.saved_at = time.monotonic()
+        path = self.directory / "batch.json"
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.state, f, indent=1)
+        tmp.replace(path)
+
+    def checkpoint(self):
+        if time.monotonic() - self.saved_at >= CHECKPOINT_INTERVAL:
+            self.save()
+
+    def progress(self):
+        total = self.state["request_counts"]["total"]
+        done = self.done()
+        elapsed = time.monotonic() - self.started if self.started is not None else 0.0
+        rate = (done - self.done_at_start) / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, total - done)
+        return {
+            "fraction": round(done / total, 4) if total else 0.0,
+            "requests_per_second": round(rate, 3),
+            "eta_seconds": round(remaining / rate, 1) if rate > 0 else None,
+            "in_flight": self.in_flight,
+            "concurrency": round(self.concurrency.limit, 2),
+        }
+
+    def describe(self):
+        info = {k: v for k, v in self.state.items() if k not in ("input_path", "client")}
+        if self.state["status"] == "in_progress":
+            info["progress"] = self.progress()
+        return info
+
+
+class BatchManager:
+    """Creates, runs, resumes and cancels batch jobs.
+
+    `send(client, url, body)` makes one request as caller `client` and returns
+    (status, headers, content); `capacity(model)` is the number of free slots of
+    a model (negative when requests are queued for it).
+    """
+
+    def __init__(self, send, capacity=None, directory=None):
+        self.send = send
+        self.capacity = capacity or (lambda model: 0)
+        self.directory = Path(directory or BATCH_DIR)
+        self.jobs = {}
+        self.stopping = False
+
+    @property
+    def files_dir(self):
+        return self.directory / "files"
+
+    def store_file(self, data, filename=None):
+        """Saves an uploaded batch input file and returns its OpenAI file object."""
+        file_id = "file-" + uuid.uuid4().hex[:24]
+        self.files_dir.mkdir(parents=True, exist_ok=True)
+        (self.files_dir / f"{file_id}.jsonl").write_bytes(data)
+        return {
+            "id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+            "filename": filename or f"{file_id}.jsonl", "purpose": "batch",
+        }
+
+    def file_path(self, file_id):
+        """Path of an uploaded file or of a batch's "<batch id>-output"/"-errors" file."""
+        if not FILE_ID_RE.match(file_id):
+            raise KeyError(file_id)
+        if file_id.startswith("batch_"):
+            batch_id, _, kind = file_id.rpartition("-")
+            if kind not in ("output", "errors") or batch_id not in self.jobs:
+                raise KeyError(file_id)
+            path = self.directory / batch_id / f"{kind}.jsonl"
+        else:
+            path = self.files_dir / f"{file_id}.jsonl"
+        if not path.exists():
+            raise KeyError(file_id)
+        return path
+
+    def create(self, input_file, endpoint, client=None, model=None, metadata=None):
+        """Starts a batch over an uploaded file id or a local JSONL path."""
+        if endpoint not in ENDPOINTS:
+            raise BatchError(f"Unsupported endpoint {endpoint!r} (one of {', '.join(ENDPOINTS)})")
+        try:
+            input_path = self.file_path(input_file)
+        except KeyError:
+            input_path = Path(input_file).expanduser()
+            if not input_path.is_absolute() or not input_path.is_file():
+                raise BatchError(f"No uploaded file or local file {input_file!r}") from None
+        batch_id = "batch_" + uuid.uuid4().hex[:24]
+        directory = self.directory / batch_id
+        directory.mkdir(parents=True)
+        job = BatchJob(directory, {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": endpoint,
+            "input_file_id": input_file,
+            "input_path": str(input_path),
+            "output_file_id": f"{batch_id}-output",
+            "error_file_id": f"{batch_id}-errors",
+            "model": model,
+            "client": client,
+            "metadata": metadata,
+            "status": "validating",
+            "errors": None,
+            "created_at": int(time.time()),
+            "in_progress_at": None,
+            "completed_at": None,
+            "failed_at": None,
+            "cancelled_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        })
+        job.save()
+        self.jobs[batch_id] = job
+        self._start(job)
+        return job
+
+    def get(self, batch_id):
+        return self.jobs[batch_id]
+
+    def cancel(self, batch_id):
+        job = self.jobs[batch_id]
+        if job.state["status"] not in FINAL:
+            job.state["status"] = "cancelling"
+            job.save()
+            if job.task is not None:
+                job.task.cancel()
+        return job
+
+    def resume(self):
+        """Loads the jobs on disk and restarts the unfinished ones."""
+        for path in sorted(self.directory.glob("batch_*/batch.json")):
+            try:
+                state = json.loads(path.read_text())
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Skipping batch {path.parent.name}: {e}")
+                continue
+            job = self.jobs[state["id"]] = BatchJob(path.parent, state)
+            if state["status"] == "cancelling":
+                self._finish(job, "cancelled")
+            elif state["status"] not in FINAL:
+                print(f"Resuming batch {job.id} ({job.done()}/{state['request_counts']['total']} done)")
+                self._start(job)
+
+    async def stop(self):
+        """Stops the running jobs where they are; they resume on the next start."""
+        self.stopping = True
+        tasks = [job.task for job in self.jobs.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        return [job.describe() for job in sorted(self.jobs.values(), key=lambda job: job.state["created_at"])]
+
+    def _start(self, job):
+        job.task = asyncio.create_task(self._run(job))
+
+    def _finish(self, job, status, errors=None):
+        job.state["status"] = status
+        job.state[f"{status}_at"] = int(time.time())
+        if errors is not None:
+            job.state["errors"] = errors
+        job.save()
+
+    async def _run(self, job):
+        pending = set()
+        try:
+            if job.state["status"] == "validating":
+                total = await asyncio.to_thread(validate_input, job.state["input_path"], job.state["endpoint"])
+                job.state["request_counts"]["total"] = total
+                job.state["status"] = "in_progress"
+                job.state["in_progress_at"] = int(time.time())
+            done = await asyncio.to_thread(finished_ids, job.output_path)
+            failed = await asyncio.to_thread(finished_ids, job.errors_path)
+            job.state["request_counts"].update(completed=len(done), failed=len(failed))
+            done |= failed
+            job.save()
+            job.started = time.monotonic()
+            job.done_at_start = job.done()
+            with open(job.state["input_path"], encoding="utf-8") as requests, \
+                    open(job.output_path, "a") as output, open(job.errors_path, "a") as errors:
+                for line in requests:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if entry["custom_id"] in done:
+                        continue
+                    while len(pending) >= int(job.concurrency.limit):
+                        finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        raise_failed(finished)
+                    pending.add(asyncio.create_task(self._request(job, entry, output, errors)))
+                    job.checkpoint()
+                if pending:
+                    finished, pending = await asyncio.wait(pending)
+                    raise_failed(finished)
+            self._finish(job, "completed")
+        except asyncio.CancelledError:
+            await cancel_all(pending)
+            if job.state["status"] == "cancelling" or not self.stopping:
+                self._finish(job, "cancelled")
+            else:
+                job.save()
+            raise
+        except BatchError as e:
+            await cancel_all(pending)
+            self._finish(job, "failed", {"object": "list", "message": str(e), "data": e.problems})
+        except Exception as e:
+            # Unreadable input, unwritable output files, or a request that broke unexpectedly
+            await cancel_all(pending)
+            self._finish(job, "failed", {"object": "list", "message": str(e) or type(e).__name__, "data": []})
+        finally:
+            job.task = None
+
+    async def _request(self, job, entry, output, errors):
+        body = {k: v for k, v in entry["body"].items() if k not in ("stream", "stream_options")}
+        if job.state.get("model"):
+            body["model"] = job.state["model"]
+        job.in_flight += 1
+        try:
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                try:
+                    status, headers, content = await self.send(job.state.get("client"), entry["url"], body)
+                except Exception as e:
+                    status, headers, content = 502, {}, json.dumps({"error": str(e)}).encode()
+                if status not in RETRY_STATUSES:
+                    job.concurrency.success(self.capacity(body.get("model")))
+                    break
+                if status in (429, 503):
+                    job.concurrency.overloaded()
+                if attempt < MAX_ATTEMPTS:
+                    try:
+                        delay = float(headers.get("retry-after", ""))
+                    except ValueError:
+                        delay = 2.0 ** attempt
+                    await asyncio.sleep(min(delay, 60.0))
+        finally:
+            job.in_flight -= 1
+
+        try:
+            response_body = json.loads(content)
+        except ValueError:
+            response_body = content.decode("utf-8", "replace")
+        record = {
+            "id": "batch_req_" + uuid.uuid4().hex[:24],
+            "custom_id": entry["custom_id"],
+            "response": {"status_code": status, "body": response_body},
+            "error": None,
+        }
+        counts = job.state["request_counts"]
+        if 200 <= status < 300:
+            target = output
+            counts["completed"] += 1
+        else:
+            message = response_body.get("error") if isinstance(response_body, dict) else response_body
+            record["error"] = {"code": str(status), "message": message if isinstance(message, str) else json.dumps(message)}
+            target = errors
+            counts["failed"] += 1
+        target.write(json.dumps(record) + "\n")
+        target.flush()
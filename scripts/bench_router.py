@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# Router load benchmark against simulated vLLM backends.
+#
+# Starts fake backends (fake_backend.py) on the MODELS ports and the router on
+# its own port, then drives the same streaming load at several concurrency levels
+# straight at a backend and through the router. Reports the latency the router
+# adds (p50/p99 of time to first token and total), throughput, and router
+# CPU/RSS, and saves everything as JSON so runs can be compared across commits.
+#
+# Usage:
+#   python scripts/bench_router.py --concurrency 1,8,32 --requests 200
+#   python scripts/bench_router.py --compare bench_results/<earlier>.json
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+try:
+    from model_defs import MODELS
+except ImportError:
+    sys.path.append(str(Path(__file__).parent))
+    from model_defs import MODELS
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = SCRIPTS_DIR.parent
+RESULTS_DIR = PROJECT_ROOT / "bench_results"
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def process_usage(pid):
+    """Returns (cpu_seconds, rss_bytes) of a process."""
+    stat = Path(f"/proc/{pid}/stat")
+    if stat.exists():
+        fields = stat.read_text().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        cpu = (int(fields[11]) + int(fields[12])) / ticks
+        rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+        return cpu, rss
+    # macOS: no /proc, ps reports cputime as [[dd-]hh:]mm:ss.cc
+    output = subprocess.check_output(["ps", "-o", "time=,rss=", "-p", str(pid)]).decode().split()
+    seconds = 0.0
+    for part in output[0].replace("-", ":").split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds, int(output[1]) * 1024
+
+
+async def wait_for_port(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url, timeout=1.0)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up")
+
+
+async def run_load(base_url, models, concurrency, requests, max_tokens):
+    """Sends `requests` streaming chat completions with `concurrency` workers."""
+    ttfts, totals = [], []
+    tokens = 0
+    errors = 0
+    counter = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+        async def worker():
+            nonlocal tokens, errors
+            for i in counter:
+                body = {
+                    "model": models[i % len(models)],
+                    "stream": True,
+                    "max_tokens": max_tokens,
+                    "messages": [{"role": "user", "content": f"benchmark request {i}"}],
+                }
+                started = time.perf_counter()
+                first = None
+                try:
+                    async with client.stream("POST", "/v1/chat/completions", json=body) as resp:
+                        if resp.status_code != 200:
+                            errors += 1
+                            await resp.aread()
+                            continue
+                        async for chunk in resp.aiter_raw():
+                            if first is None:
+                                first = time.perf_counter()
+                            tokens += chunk.count(b"data: ")
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                finished = time.perf_counter()
+                ttfts.append(first - started)
+                totals.append(finished - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "requests": requests,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(totals) / elapsed, 2),
+        "tokens_per_s": round(tokens / elapsed, 1),
+        "ttft_p50_ms": ms(percentile(ttfts, 50)),
+        "ttft_p99_ms": ms(percentile(ttfts, 99)),
+        "total_p50_ms": ms(percentile(totals, 50)),
+        "total_p99_ms": ms(percentile(totals, 99)),
+    }
+
+
+async def sample_rss(pid, stop, samples):
+    while not stop.is_set():
+        samples.append(process_usage(pid)[1])
+        try:
+            await asyncio.wait_for(stop.wait(), 0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def benchmark(args):
+    models = args.models.split(",")
+    router_url = f"http://127.0.0.1:{args.router_port}"
+    env = dict(os.environ, ROUTER_PORT=str(args.router_port), ROUTER_WARMUP="off", PYTHONUNBUFFERED="1")
+    backends = subprocess.Popen(
+        [sys.executable, str(SCRIPTS_DIR / "fake_backend.py"), "--models", args.models,
+         "--ttft", str(args.ttft), "--tokens-per-second", str(args.tokens_per_second)],
+        stdout=subprocess.DEVNULL,
+    )
+    router = subprocess.Popen(
+        [sys.executable, str(SCRIPTS_DIR / "federated_router.py")],
+        cwd=str(SCRIPTS_DIR), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    results = []
+    try:
+        for name in models:
+            await wait_for_port(f"http://127.0.0.1:{MODELS[name]['port']}/health")
+        await wait_for_port(f"{router_url}/v1/models")
+
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            # Direct: one backend, so only a single model is exercised
+            direct_url = f"http://127.0.0.1:{MODELS[models[0]]['port']}"
+            direct = await run_load(direct_url, models[:1], concurrency, args.requests, args.max_tokens)
+
+            cpu_before = process_usage(router.pid)[0]
+            stop, rss_samples = asyncio.Event(), []
+            sampler = asyncio.ensure_future(sample_rss(router.pid, stop, rss_samples))
+            routed = await run_load(router_url, models[:1], concurrency, args.requests, args.max_tokens)
+            stop.set()
+            await sampler
+            cpu = process_usage(router.pid)[0] - cpu_before
+            routed["router_cpu_s"] = round(cpu, 3)
+            routed["router_cpu_per_request_ms"] = round(1000 * cpu / args.requests, 3)
+            routed["router_rss_max_mb"] = round(max(rss_samples) / 1024 ** 2, 1) if rss_samples else None
+
+            added = {
+                key: round(routed[key] - direct[key], 3)
+                for key in ("ttft_p50_ms", "ttft_p99_ms", "total_p50_ms", "total_p99_ms")
+                if routed[key] is not None and direct[key] is not None
+            }
+            results.append({"concurrency": concurrency, "direct": direct, "router": routed, "added": added})
+            print(
+                f"c={concurrency:<4} added ttft p50/p99 {added.get('ttft_p50_ms')}/{added.get('ttft_p99_ms')} ms, "
+                f"total p50/p99 {added.get('total_p50_ms')}/{added.get('total_p99_ms')} ms, "
+                f"router {routed['requests_per_s']} req/s (direct {direct['requests_per_s']}), "
+                f"cpu {routed['router_cpu_per_request_ms']} ms/req, rss {routed['router_rss_max_mb']} MB, "
+                f"errors {routed['errors']}"
+            )
+    finally:
+        for proc in (router, backends):
+            proc.terminate()
+            proc.wait()
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "models": models,
+            "requests": args.requests,
+            "max_tokens": args.max_tokens,
+            "ttft": args.ttft,
+            "tokens_per_second": args.tokens_per_second,
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline):
+    """Prints the change in added latency relative to an earlier report."""
+    print(f"Compared with {baseline['commit']} ({baseline['timestamp']}):")
+    earlier = {r["concurrency"]: r for r in baseline["results"]}
+    for result in report["results"]:
+        before = earlier.get(result["concurrency"])
+        if before is None:
+            continue
+        deltas = ", ".join(
+            f"{key} {result['added'][key] - before['added'][key]:+.3f} ms"
+            for key in result["added"] if key in before["added"]
+        )
+        print(f"c={result['concurrency']:<4} {deltas}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark router overhead against simulated backends")
+    parser.add_argument("--models", default="smollm2-135m", help="Comma separated models to simulate")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level and target")
+    parser.add_argument("--max-tokens", type=int, default=32)
+    parser.add_argument("--ttft", type=float, default=0.02)
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--router-port", type=int, default=8600)
+    parser.add_argument("--output", help="Where to write the JSON report (default: bench_results/)")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    report = asyncio.run(benchmark(args))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"router-{report['commit']}-{int(time.time())}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Saved {output}")
+
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# Per-backend circuit breakers.
+#
+# A stopped or wedged backend otherwise costs every request a connect timeout
+# (or worse). After `failure_threshold` consecutive connect failures or timeouts
+# a backend's breaker opens and requests fail fast; once `reset_timeout` has
+# passed, a single request is let through as a probe (half-open) and its outcome
+# closes the breaker again or re-opens it.
+import math
+import os
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEFAULT_BREAKER_SETTINGS = {
+    "failure_threshold": int(os.environ.get("ROUTER_BREAKER_FAILURES", "5")),
+    "reset_timeout": float(os.environ.get("ROUTER_BREAKER_RESET", "10")),
+}
+
+
+class CircuitBreaker:
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = settings
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_started = None
+        self.failures = 0
+        self.rejected = 0
+        self.trips = 0
+
+    def available(self):
+        """Whether a request may be sent now (without changing state)."""
+        now = time.monotonic()
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return now >= self.opened_at + self.settings["reset_timeout"]
+        # Half-open: one probe at a time, unless it has been stuck for a while
+        return now >= self.probe_started + self.settings["reset_timeout"]
+
+    def attempt(self):
+        """Call right before sending; turns an open breaker whose reset timeout has passed into a probe."""
+        if self.state != CLOSED:
+            self.state = HALF_OPEN
+            self.probe_started = time.monotonic()
+
+    def success(self):
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            print(f"Circuit for {self.name} closed")
+            self.state = CLOSED
+
+    def failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.settings["failure_threshold"]:
+            if self.state == CLOSED:
+                self.trips += 1
+                print(f"Circuit for {self.name} opened after {self.consecutive_failures} consecutive failures")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def cancelled(self):
+        """The attempt ended without telling us anything (e.g. a cancelled hedge)."""
+        if self.state == HALF_OPEN:
+            # Let the next request probe straight away
+            self.state = OPEN
+
+    def retry_after(self):
+        if self.state == CLOSED:
+            return 0
+        started = self.opened_at if self.state == OPEN else self.probe_started
+        return max(1, math.ceil(started + self.settings["reset_timeout"] - time.monotonic()))
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "retry_after": self.retry_after(),
+        }
+
+
+class BreakerRegistry:
+    """One CircuitBreaker per backend address, with per-model overrides of the defaults."""
+
+    def __init__(self, defaults=None):
+        self.defaults = dict(defaults or DEFAULT_BREAKER_SETTINGS)
+        self.breakers = {}
+
+    def get(self, name, overrides=None):
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            settings = dict(self.defaults)
+            settings.update(overrides or {})
+            breaker = self.breakers[name] = CircuitBreaker(name, settings)
+        return breaker
+
+    def discard(self, name):
+        """Forgets a backend's breaker, so the next get() starts closed with new overrides."""
+        self.breakers.pop(name, None)
+
+    def stats(self):
+        return {name: breaker.stats() for name, breaker in self.breakers.items()}
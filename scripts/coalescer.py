@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# Single-flight coalescing of identical in-flight requests.
+#
+# When a deterministic request matches one that is already being generated, it
+# attaches to that upstream stream instead of starting its own generation. Chunks
+# are fanned out to every subscriber as they arrive; a subscriber that joins late
+# first catches up on the chunks it missed.
+import asyncio
+
+
+class Flight:
+    """One upstream generation shared by any number of subscribers."""
+
+    def __init__(self, key, on_finish):
+        self.key = key
+        self.on_finish = on_finish
+        self.ready = asyncio.Event()
+        self.status_code = None
+        self.content_type = None
+        self.error = None
+        self.chunks = []
+        self.done = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._pump = None
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def start(self, status_code, content_type, body):
+        """Starts pumping `body` (an async iterator of upstream chunks) to subscribers."""
+        self.status_code = status_code
+        self.content_type = content_type
+        self._pump = asyncio.ensure_future(self._run(body))
+        self.ready.set()
+
+    def fail(self, error):
+        self.error = error
+        self.done = True
+        self.ready.set()
+        self.on_finish(self)
+
+    async def _run(self, body):
+        try:
+            async for chunk in body:
+                self.chunks.append(chunk)
+                self._notify()
+        finally:
+            # Closing the body runs relay()'s cleanup, closing the upstream too
+            await body.aclose()
+            self.done = True
+            self._notify()
+            self.on_finish(self)
+
+    async def subscribe(self):
+        self.subscribers += 1
+        position = 0
+        try:
+            while True:
+                if position < len(self.chunks):
+                    chunk = self.chunks[position]
+                    position += 1
+                    yield chunk
+                elif self.done:
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done and self._pump is not None:
+                # Everyone went away: stop the generation like a lone client would
+                self._pump.cancel()
+
+
+class Coalescer:
+    def __init__(self):
+        self.flights = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key):
+        """Returns (flight, is_leader). The leader must start() or fail() the flight."""
+        flight = self.flights.get(key)
+        if flight is not None:
+            self.followers += 1
+            return flight, False
+        flight = self.flights[key] = Flight(key, self._finished)
+        self.leaders += 1
+        return flight, True
+
+    def _finished(self, flight):
+        if self.flights.get(flight.key) is flight:
+            del self.flights[flight.key]
+
+    def stats(self):
+        return {
+            "in_flight": len(self.flights),
+            "subscribers": sum(flight.subscribers for flight in self.flights.values()),
+            "leaders": self.leaders,
+            "coalesced": self.followers,
+        }
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Micro-batching of single-input /v1/embeddings requests.
+#
+# Requests for the same model (and the same encoding options) that arrive
+# within a short window are sent upstream as one request with a list of inputs,
+# and the response's "data" is split back up: each caller gets its own embedding
+# at index 0, and a share of the usage proportional to the length of its input.
+# A window that closes with a single request lets it go upstream unchanged.
+import asyncio
+import json
+import time
+
+# Returned to a request that should be sent upstream on its own
+ALONE = object()
+
+
+class PendingEmbedding:
+    """One caller's input waiting in a batch; `future` gets its response."""
+
+    def __init__(self, text, context=None):
+        self.text = text
+        self.context = context
+        self.queued_at = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+
+    def resolve(self, result):
+        if not self.future.done():
+            self.future.set_result(result)
+
+
+def single_input(payload):
+    """The text of a request that embeds exactly one string (else None)."""
+    value = payload.get("input")
+    if isinstance(value, list) and len(value) == 1:
+        value = value[0]
+    return value if isinstance(value, str) else None
+
+
+def batch_key(payload):
+    """Requests can share a batch if they differ only in their input."""
+    options = {k: v for k, v in payload.items() if k != "input"}
+    try:
+        return json.dumps(options, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+
+
+def split_response(body, texts):
+    """Per-caller response bodies from a multi-input embeddings response."""
+    data = sorted(body["data"], key=lambda item: item["index"])
+    if len(data) != len(texts):
+        raise ValueError(f"expected {len(texts)} embeddings, got {len(data)}")
+    usage = body.get("usage") or {}
+    prompt = usage.get("prompt_tokens")
+    # Usage is only reported for the whole batch: shared out by input length
+    weights = [max(1, len(text)) for text in texts]
+    shares = None
+    if isinstance(prompt, int):
+        shares = [prompt * weight // sum(weights) for weight in weights]
+        shares[-1] += prompt - sum(shares)
+    results = []
+    for i, item in enumerate(data):
+        result = dict(body, data=[dict(item, index=0)])
+        if shares is not None:
+            result["usage"] = {"prompt_tokens": shares[i], "total_tokens": shares[i]}
+        results.append(result)
+    return results
+
+
+class EmbeddingBatcher:
+    """Groups PendingEmbeddings by key and hands each batch to `send(key, items)`.
+
+    A batch is sent when it reaches `max_batch` inputs or `window` seconds after
+    its first input arrived. `send` must resolve every item.
+    """
+
+    def __init__(self, send, window=0.005, max_batch=64):
+        self.send = send
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.open = {}
+        self.batches = 0
+        self.batched = 0
+        self.alone = 0
+        self.retried = 0
+        self.largest = 0
+        self.wait_total = 0.0
+
+    async def submit(self, key, item):
+        """Queues an item and waits for its response (or ALONE)."""
+        batch = self.open.get(key)
+        if batch is None:
+            batch = self.open[key] = []
+            asyncio.get_running_loop().call_later(self.window, self._close, key, batch)
+        batch.append(item)
+        if len(batch) >= self.max_batch:
+            self._close(key, batch)
+        return await item.future
+
+    def _close(self, key, batch):
+        if self.open.get(key) is not batch:
+            # Already sent because it filled up
+            return
+        del self.open[key]
+        now = time.monotonic()
+        self.wait_total += sum(now - item.queued_at for item in batch)
+        if len(batch) == 1:
+            self.alone += 1
+            batch[0].resolve(ALONE)
+            return
+        self.batches += 1
+        self.batched += len(batch)
+        self.largest = max(self.largest, len(batch))
+        asyncio.ensure_future(self._send(key, batch))
+
+    async def _send(self, key, batch):
+        try:
+            await self.send(key, batch)
+        finally:
+            # Whatever send() left unresolved goes upstream on its own
+            for item in batch:
+                if not item.future.done():
+                    self.retried += 1
+                    item.resolve(ALONE)
+
+    def stats(self):
+        requests = self.batched + self.alone
+        upstream = self.batches + self.alone + self.retried
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "open_batches": len(self.open),
+            "requests": requests,
+            "upstream_requests": upstream,
+            "batches": self.batches,
+            "sent_alone": self.alone,
+            "retried_alone": self.retried,
+            "batch_size_avg": round(self.batched / self.batches, 2) if self.batches else 0.0,
+            "batch_size_max": self.largest,
+            "window_wait_avg_ms": round(1000 * self.wait_total / requests, 3) if requests else 0.0,
+            # Requests per upstream call: the reduction in backend requests
+            "throughput_gain": round(requests / upstream, 2) if upstream else 1.0,
+        }
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# Simulated OpenAI-compatible vLLM backends for benchmarking and testing the router.
+#
+# A bare asyncio HTTP/1.1 server (keep-alive, chunked SSE) so the fake backend
+# itself is never the bottleneck being measured. Each token is emitted after a
+# configurable time to first token and at a configurable rate.
+#
+# Usage:
+#   python scripts/fake_backend.py --models smollm2-135m,qwen-0.5 --ttft 0.05 --tokens-per-second 200
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+try:
+    from model_defs import MODELS
+except ImportError:
+    import sys
+    from pathlib import Path
+    sys.path.append(str(Path(__file__).parent))
+    from model_defs import MODELS
+
+
+class FakeBackend:
+    def __init__(self, name, port, ttft=0.05, tokens_per_second=100.0, default_tokens=32, host="127.0.0.1"):
+        self.name = name
+        self.port = port
+        self.host = host
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.default_tokens = default_tokens
+        self.requests = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        return self
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                lines = head.decode("latin1").split("\r\n")
+                method, path, _ = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0"))
+                body = await reader.readexactly(length) if length else b""
+                self.requests += 1
+                await self._respond(method, path.split("?", 1)[0], body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    return
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, method, path, body, writer):
+        if method == "GET" and path in ("/health", "/v1/models"):
+            payload = {"object": "list", "data": [
+                {"id": f"models/{self.name}", "object": "model", "owned_by": "vllm", "max_model_len": 4096}
+            ]}
+            await self._send_json(writer, 200, payload)
+            return
+        if method != "POST" or path not in ("/v1/chat/completions", "/v1/completions"):
+            await self._send_json(writer, 404, {"error": f"No route for {method} {path}"})
+            return
+
+        request = json.loads(body or b"{}")
+        tokens = int(request.get("max_tokens") or self.default_tokens)
+        chat = path == "/v1/chat/completions"
+        completion_id = f"cmpl-{uuid.uuid4().hex}"
+        await asyncio.sleep(self.ttft)
+        if not request.get("stream"):
+            await asyncio.sleep(max(0, tokens - 1) / self.tokens_per_second)
+            text = "tok " * tokens
+            choice = {"index": 0, "message": {"role": "assistant", "content": text}} if chat else {"index": 0, "text": text}
+            await self._send_json(writer, 200, {
+                "id": completion_id,
+                "object": "chat.completion" if chat else "text_completion",
+                "model": self.name,
+                "choices": [dict(choice, finish_reason="length")],
+                "usage": {"prompt_tokens": 8, "completion_tokens": tokens, "total_tokens": 8 + tokens},
+            })
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\nCache-Control: no-cache\r\n\r\n"
+        )
+        interval = 1.0 / self.tokens_per_second
+        next_at = time.perf_counter()
+        for i in range(tokens):
+            delta = {"delta": {"content": "tok "}} if chat else {"text": "tok "}
+            event = {"id": completion_id, "model": self.name, "choices": [dict(delta, index=0)]}
+            await self._send_chunk(writer, b"data: " + json.dumps(event).encode() + b"\n\n")
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            if delay > 0 and i < tokens - 1:
+                await asyncio.sleep(delay)
+        usage = {"id": completion_id, "model": self.name, "choices": [],
+                 "usage": {"prompt_tokens": 8, "completion_tokens": tokens, "total_tokens": 8 + tokens}}
+        await self._send_chunk(writer, b"data: " + json.dumps(usage).encode() + b"\n\ndata: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _send_chunk(self, writer, data):
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+        await writer.drain()
+
+    async def _send_json(self, writer, status, payload):
+        data = json.dumps(payload).encode()
+        reason = {200: "OK", 404: "Not Found"}.get(status, "Error")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+
+
+async def start_backends(names, **settings):
+    """Starts a FakeBackend on the MODELS port of each named model."""
+    return [await FakeBackend(name, MODELS[name]["port"], **settings).start() for name in names]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run simulated vLLM backends on the MODELS ports")
+    parser.add_argument("--models", default="smollm2-135m,qwen-0.5", help="Comma separated model names")
+    parser.add_argument("--ttft", type=float, default=0.05, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--tokens", type=int, default=32, help="Tokens per response when max_tokens is unset")
+    args = parser.parse_args()
+
+    async def run():
+        backends = await start_backends(
+            args.models.split(","), ttft=args.ttft,
+            tokens_per_second=args.tokens_per_second, default_tokens=args.tokens,
+        )
+        for backend in backends:
+            print(f"Fake {backend.name} on port {backend.port}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
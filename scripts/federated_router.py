@@ -2,206 +2,1275 @@
 import uvicorn
 import httpx
 import asyncio
-import subprocess
 import os
 import signal
-import sys
+import json
+import hashlib
+import threading
+import time
 from fastapi import FastAPI, Request, Response
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from contextlib import asynccontextmanager
 from pathlib import Path
-from model_defs import MODELS
+from model_defs import AUTO_MODELS, MODELS, RegistryError, diff_models, load_models, parse_size
+from model_selector import NoModelAvailable, select_model
+from model_registry import RegistryWatcher, RoutingTable
+from backend_pool import PoolManager
+from backend_health import HealthMonitor, UP, WARMING, UNKNOWN, DOWN
+from proxy_stream import StreamStats, UpstreamStreamingResponse, abandon, prepend, relay
+from model_scheduler import InsufficientMemory, ModelScheduler, RemoteScheduler, SchedulerUnavailable
+from model_sizing import size_model
+from readiness import DEFAULT_FULL_CONTEXT_CAP, Readiness, wait_until_ready
+from admission import AdmissionController, Rejected, PRIORITIES
+from api_keys import API_KEYS_FILE, ClientLimits, ClientRegistry, estimate_tokens, usage_tokens
+from response_cache import CachedResponse, ResponseCache, cache_key
+from coalescer import Coalescer
+from embedding_batcher import ALONE, EmbeddingBatcher, PendingEmbedding, batch_key, single_input, split_response
+from load_balancer import LEAST_OUTSTANDING
+from router_metrics import RouterMetrics, render_gauge
+from circuit_breaker import BreakerRegistry
+from hedging import Hedger
+from asgi_proxy import ClientDisconnected, ProxyMiddleware, ProxyRequest, read_request, sniff_model
+from batch_jobs import BatchError, BatchManager
+# ROUTER_MODE and ROUTER_LITELLM_FALLBACK (see litellm_process.py)
+import litellm_process
+from litellm_process import LITELLM_PORT, start_litellm, stop_litellm
+from request_tracing import TRACE_ENABLED, TRACE_OTLP, OtlpExporter, Tracer, otlp_payload
+from sampling_profiler import SamplingProfiler
+from worker_state import COORDINATOR, WORKER_ID, WORKERS, Coordinator, CoordinatorForwarding, WorkerState, serve
 
 # Configuration
-LITELLM_PORT = 8080
-ROUTER_PORT = 8000
+ROUTER_PORT = int(os.environ.get("ROUTER_PORT", "8000"))
 LITELLM_HOST = "http://localhost"
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 
+# How requests are spread over a model's replicas: "least_outstanding" or
+# "prefix_affinity" (override per model with a "balance" entry in MODELS)
+BALANCE_MODE = os.environ.get("ROUTER_BALANCE", LEAST_OUTSTANDING)
+
+# How often (seconds, jittered) the backends are polled for health and metadata
+HEALTH_INTERVAL = float(os.environ.get("ROUTER_HEALTH_INTERVAL", "2.0"))
+# Failed polls in a row before a backend is marked down
+HEALTH_DOWN_AFTER = int(os.environ.get("ROUTER_HEALTH_DOWN_AFTER", "3"))
+
+# How often (seconds) the registry file (models.json) is checked for changes
+REGISTRY_INTERVAL = float(os.environ.get("ROUTER_REGISTRY_INTERVAL", "2.0"))
+
+# On-demand activation: when a memory budget is set (e.g. "30 GB"), a request for
+# a stopped model starts it, evicting least recently used idle models to make room.
+# Models in ROUTER_PINNED_MODELS (comma separated) are never evicted.
+MEMORY_BUDGET = os.environ.get("ROUTER_MEMORY_BUDGET")
+PINNED_MODELS = [m for m in os.environ.get("ROUTER_PINNED_MODELS", "").split(",") if m]
+MODEL_READY_TIMEOUT = float(os.environ.get("ROUTER_MODEL_READY_TIMEOUT", "300"))
+VLLM_CTL = PROJECT_ROOT / "vllm-ctl"
+
+# Warm-up prompts sent to a backend that comes (back) up before it is routable:
+# comma separated steps from "short" (one token) and "full" (fills the context
+# window, capped at ROUTER_WARMUP_CONTEXT_CAP tokens), or "off"
+WARMUP_STEPS = [s for s in os.environ.get("ROUTER_WARMUP", "short").split(",") if s and s != "off"]
+WARMUP_CONTEXT_CAP = int(os.environ.get("ROUTER_WARMUP_CONTEXT_CAP", str(DEFAULT_FULL_CONTEXT_CAP)))
+LITELLM_READY_TIMEOUT = 60.0
+
+# Opt-in cache of temperature-0 completions: an in-memory LRU of ROUTER_CACHE_BYTES,
+# plus an on-disk sqlite tier when ROUTER_CACHE_DB is set
+CACHE_ENABLED = os.environ.get("ROUTER_CACHE", "0") == "1"
+CACHE_BYTES = os.environ.get("ROUTER_CACHE_BYTES", "256 MB")
+CACHE_DB = os.environ.get("ROUTER_CACHE_DB")
+CACHE_DISK_BYTES = os.environ.get("ROUTER_CACHE_DISK_BYTES", "2 GB")
+
+# Identical temperature-0 requests in flight at the same time share one generation
+COALESCE_ENABLED = os.environ.get("ROUTER_COALESCE", "1") == "1"
+
+# Single-input /v1/embeddings requests for the same model arriving within
+# ROUTER_EMBED_WINDOW_MS of each other go upstream as one multi-input request
+EMBED_BATCH_ENABLED = os.environ.get("ROUTER_EMBED_BATCH", "1") == "1"
+EMBED_WINDOW = float(os.environ.get("ROUTER_EMBED_WINDOW_MS", "5")) / 1000
+EMBED_MAX_BATCH = int(os.environ.get("ROUTER_EMBED_MAX_BATCH", "64"))
+
+# Opt-in (or per model with a "hedge" entry in MODELS): a streaming request with no
+# first token by the model's ROUTER_HEDGE_PERCENTILE TTFT is also sent to a spare
+# replica or the model's "fallback" model, and the slower of the two is cancelled
+HEDGE_ENABLED = os.environ.get("ROUTER_HEDGE", "0") == "1"
+
+# vLLM sends the headers of a streaming response as soon as it accepts the request;
+# a backend that doesn't within this many seconds is treated as wedged
+STREAM_HEADERS_TIMEOUT = float(os.environ.get("ROUTER_STREAM_HEADERS_TIMEOUT", "30"))
+
+# Request bodies larger than this are streamed to the backend instead of being
+# read whole; they can't be cached, coalesced or routed by prompt prefix
+MAX_BUFFERED_BODY = parse_size(os.environ.get("ROUTER_MAX_BUFFERED_BODY", "1 MB"))
+
+# With several router workers these endpoints are served by the coordinator
+# (worker 0) only, which runs the batch jobs, the model scheduler and the backend warm-ups
+COORDINATOR_PATHS = ("/v1/files", "/v1/batches", "/admin/scheduler", "/admin/readiness")
+# Seconds a relayed request may take; batch input files can be large, so their
+# uploads and downloads get much longer than the default
+COORDINATOR_TIMEOUTS = {"/v1/files": 600.0}
+
 # Global state for the subprocess
-litellm_process = None
+litellm = None
+
+async def litellm_alive():
+    resp = await backend_pool("litellm").get("/health/liveliness", timeout=1.0)
+    return resp.status_code == 200
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global litellm_process
-    print(f"Starting LiteLLM on port {LITELLM_PORT}...")
-    
-    # Ensure config exists
-    config_path = PROJECT_ROOT / "router_config.yaml"
-    if not config_path.exists():
-        # Fallback generation? Or assume it exists.
-        # Ideally we run generate_router_config.py first.
-        subprocess.check_call([sys.executable, str(PROJECT_ROOT / "scripts/generate_router_config.py")])
-
-    # Start LiteLLM
-    cmd = [
-        "litellm",
-        "--config", str(config_path),
-        "--port", str(LITELLM_PORT)
-    ]
-    
-    # Use same environment
-    env = os.environ.copy()
-    
-    litellm_process = subprocess.Popen(cmd, env=env)
-    
-    # wait a bit for it to start?
-    await asyncio.sleep(2)
+    global litellm
+    if litellm_process.enabled():
+        # Router workers share the one router_workers.py started
+        if WORKERS == 1:
+            litellm = start_litellm()
+        waited = await wait_until_ready(litellm_alive, LITELLM_READY_TIMEOUT)
+        print(f"LiteLLM ready after {waited:.1f}s")
+    else:
+        print("Direct dispatch enabled, LiteLLM disabled")
+
+    if WORKER_ID == COORDINATOR:
+        # Take a first snapshot so /v1/models is populated before we accept traffic
+        await health.refresh_all()
+        health.start()
+    registry.start()
+    if WORKER_ID == COORDINATOR:
+        batches.resume()
+    if shared is not None:
+        shared.start()
+    if tracer is not None and tracer.exporter is not None:
+        tracer.exporter.start()
     
     yield
     
     # Shutdown
-    print("Shutting down LiteLLM...")
-    if litellm_process:
-        litellm_process.terminate()
-        try:
-            litellm_process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            litellm_process.kill()
+    if tracer is not None and tracer.exporter is not None:
+        await tracer.exporter.stop()
+    if shared is not None:
+        await shared.stop()
+    if coordinator is not None:
+        await coordinator.aclose()
+    await batches.stop()
+    await registry.stop()
+    await health.stop()
+    if response_cache is not None:
+        response_cache.close()
+    if litellm is not None:
+        stop_litellm(litellm)
+    await pools.aclose()
 
 app = FastAPI(lifespan=lifespan)
-client = httpx.AsyncClient()
 
-# Middleware to fix malformed Authorization headers BEFORE FastAPI sees them
-@app.middleware("http")
-async def fix_auth_header_middleware(request: Request, call_next):
-    # Get the scope (ASGI spec)
-    scope = request.scope
-    
-    # Filter headers at ASGI level
-    if "headers" in scope:
-        cleaned_headers = []
-        for header_name, header_value in scope["headers"]:
-            # Decode header name and value
-            name = header_name.decode("latin1").lower()
-            value = header_value.decode("latin1")
-            
-            # Skip malformed Authorization headers
-            if name == "authorization":
-                # Skip if empty or just "Bearer " with no token
-                value_stripped = value.strip()
-                if not value_stripped or value_stripped == "Bearer" or (value_stripped.startswith("Bearer ") and not value_stripped[7:].strip()):
-                    continue
-            
-            # Keep all other headers
-            cleaned_headers.append((header_name, header_value))
-        
-        scope["headers"] = cleaned_headers
+# One keep-alive pool per upstream (model backend or LiteLLM)
+pools = PoolManager()
+stream_stats = StreamStats()
+metrics = RouterMetrics()
+# Per-request phase timings, kept for slow, failed and sampled requests (ROUTER_TRACE,
+# ROUTER_TRACE_SLOW_MS, ROUTER_TRACE_SAMPLE) and sent to ROUTER_TRACE_OTLP if set
+tracer = None
+if TRACE_ENABLED:
+    tracer = Tracer(exporter=OtlpExporter(TRACE_OTLP) if TRACE_OTLP else None)
+# Set while /admin/profile is sampling
+profiling = False
+# With several router workers (router_workers.py): this worker's counters are
+# published for the others, and theirs feed its limits and /metrics
+shared = None
+coordinator = None
+if WORKERS > 1:
+    shared = WorkerState(lambda: worker_snapshot(), lambda peers: absorb_peers(peers))
+    if WORKER_ID != COORDINATOR:
+        coordinator = Coordinator()
+# Per-model concurrency cap + bounded priority queue (ROUTER_MAX_CONCURRENCY,
+# ROUTER_MAX_QUEUE, ROUTER_QUEUE_TIMEOUT, or an "admission" entry in MODELS),
+# shared between router workers
+admission = AdmissionController(workers=WORKERS, peer_load=lambda name: (
+    shared.peer_sum("admission_active", name), shared.peer_sum("admission_queued", name)))
+# Callers by API key: fair-share weight in the admission queues and token-bucket
+# rate limits (ROUTER_API_KEYS, ROUTER_KEY_WEIGHT, ROUTER_KEY_RPM, ROUTER_KEY_TPM)
+clients = ClientRegistry.from_file(API_KEYS_FILE) if API_KEYS_FILE else ClientRegistry()
+coalescer = Coalescer() if COALESCE_ENABLED else None
+# Batched embedding requests are charged per caller, then sent under this identity
+embedder = None
+if EMBED_BATCH_ENABLED:
+    embedder = EmbeddingBatcher(lambda key, items: send_embedding_batch(key, items), EMBED_WINDOW, EMBED_MAX_BATCH)
+embedding_client = ClientLimits("embedding-batches", dict(clients.defaults, requests_per_minute=0, tokens_per_minute=0))
+# Per-backend circuit breakers (ROUTER_BREAKER_FAILURES, ROUTER_BREAKER_RESET, or a
+# "breaker" entry in MODELS) and TTFT tracking for hedged requests
+breakers = BreakerRegistry()
+hedger = Hedger()
+response_cache = None
+if CACHE_ENABLED:
+    response_cache = ResponseCache(parse_size(CACHE_BYTES), CACHE_DB, parse_size(CACHE_DISK_BYTES))
+
+# Every model's replicas, and which model each backend address belongs to. Replaced
+# as a whole when the registry changes; a request keeps the table it started with
+# (passed around as `routes`), helpers called without one use the live table.
+table = RoutingTable(MODELS, BALANCE_MODE)
+
+def backend_pool(address, routes=None):
+    """Returns the connection pool for a backend address ("host:port"), or for LiteLLM."""
+    if address == "litellm":
+        return pools.get("litellm", f"{LITELLM_HOST}:{LITELLM_PORT}")
+    config = (routes or table).config(address)
+    return pools.get(address, f"http://{address}", config.get("pool"))
+
+async def fetch_backend_models(address):
+    """Fetches a backend's own /v1/models payload (used by the health poller)."""
+    resp = await backend_pool(address).get("/v1/models", timeout=0.5)
+    resp.raise_for_status()
+    return resp.json()
+
+def model_entry(name, config, model):
+    # vLLM returns the full model path as the ID, but clients call us with the
+    # service name (e.g. 'yi-1.5'), so we MUST return 'id': 'yi-1.5'.
+    new_entry = model.copy()
+    new_entry["id"] = name # Force the friendly name
+    new_entry["backend_model"] = model["id"] # Keep original
+    new_entry["port"] = config.get("port")
     
-    response = await call_next(request)
-    return response
+    # Add extra metadata from our defs
+    if "est_ram" in config:
+        new_entry["est_ram"] = config["est_ram"]
+    if "params" in config:
+        new_entry["params"] = config["params"]
+    for field in ("context", "category", "cost"):
+        if field in config:
+            new_entry[field] = config[field]
+    return new_entry
+
+readiness = Readiness(WARMUP_STEPS, WARMUP_CONTEXT_CAP)
+
+async def warm_up_backend(address, model_card, down_since):
+    name = table.backend_owner.get(address, address)
+    record = await readiness.warm_up(address, name, backend_pool(address), model_card, down_since)
+    print(f"{name} ({address}) ready in {record['startup_to_ready_s']}s, warm-up: {record['warmup_steps']}")
+
+# Health is tracked per backend address, i.e. per replica. Only the coordinator
+# polls and warms up backends; other router workers take its states from its
+# published snapshot (absorb_peers), so a backend isn't polled once per worker
+health = HealthMonitor(
+    fetch_backend_models,
+    lambda: list(table.backend_owner),
+    interval=HEALTH_INTERVAL,
+    warm_up=warm_up_backend if WARMUP_STEPS else None,
+    down_after=HEALTH_DOWN_AFTER,
+)
+
+# ((health.version, table.version), body, etag) of the last rendered /v1/models response
+models_cache = (None, None, None)
+
+def model_state(name, routes=None):
+    """A model is UP if any replica is, else WARMING, else UNKNOWN, else DOWN."""
+    states = {health.state(address) for address in (routes or table).replica_sets[name].weights}
+    for state in (UP, WARMING, UNKNOWN):
+        if state in states:
+            return state
+    return DOWN
+
+def model_running(name):
+    """For the scheduler: UP or WARMING, or UNKNOWN after having answered a poll,
+    so a missed poll doesn't make a running model look stopped."""
+    state = model_state(name)
+    if state == UNKNOWN:
+        return any(
+            address in health.backends and health.backends[address].last_ok
+            for address in table.replica_sets[name].weights
+        )
+    return state in (UP, WARMING)
+
+def render_models():
+    """Builds the /v1/models body from the health snapshot, re-rendering only on change."""
+    global models_cache
+    routes = table
+    if models_cache[0] != (health.version, routes.version):
+        data = []
+        for name, config in routes.models.items():
+            up = [
+                health.backends[address] for address in routes.replica_sets[name].weights
+                if address in health.backends and health.backends[address].state == UP
+            ]
+            if up and up[0].models:
+                # vLLM returns {"object": "list", "data": [...]}; one entry per service
+                entry = model_entry(name, config, up[0].models[0])
+                entry["replicas"] = [backend.name for backend in up]
+                data.append(entry)
+        # Aliases are listed while a model they can pick is up
+        categories = {entry.get("category") for entry in data}
+        for alias, allowed in AUTO_MODELS.items():
+            if categories.intersection(allowed):
+                data.append({"id": alias, "object": "model", "owned_by": "router", "categories": list(allowed)})
+        body = json.dumps({"object": "list", "data": data}).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        models_cache = ((health.version, routes.version), body, etag)
+    return models_cache[1], models_cache[2]
 
 @app.get("/v1/models")
-async def get_models():
-    """Aggregates models from all running vLLM services."""
-    tasks = []
-    active_models = []
-    
-    async def fetch_model(name, config):
-        port = config["port"]
-        url = f"http://localhost:{port}/v1/models"
-        try:
-            resp = await client.get(url, timeout=0.5)
-            if resp.status_code == 200:
-                data = resp.json()
-                # vLLM returns {"object": "list", "data": [...]}
-                # We want to extract the model info and maybe enrich it
-                for model in data.get("data", []):
-                    # Override ID to match our service name if needed
-                    # vLLM returns the full path usually.
-                    # We want to return the service name (e.g. 'yi-1.5') so it matches what router expects?
-                    # LiteLLM router expects 'yi-1.5'.
-                    # But the User might want to see the real details.
-                    # Let's just return what vLLM returns, but maybe alias the ID to the simple name 
-                    # OR return both.
-                    # Standard OpenAI client uses 'id' to call the model.
-                    # If we return 'models/mlx-community...', the user has to use that?
-                    # No, LiteLLM routes based on 'yi-1.5'.
-                    # So we MUST return 'id': 'yi-1.5'.
-                    
-                    # Create a new entry
-                    new_entry = model.copy()
-                    new_entry["id"] = name # Force the friendly name
-                    new_entry["backend_model"] = model["id"] # Keep original
-                    new_entry["port"] = port
-                    
-                    # Add extra metadata from our defs
-                    if "est_ram" in config:
-                        new_entry["est_ram"] = config["est_ram"]
-                    if "params" in config:
-                        new_entry["params"] = config["params"]
-                        
-                    return new_entry
-        except Exception:
-            return None
-
-    for name, config in MODELS.items():
-        tasks.append(fetch_model(name, config))
-        
-    results = await asyncio.gather(*tasks)
-    
-    # Filter None
-    data = [r for r in results if r is not None]
-    
+async def get_models(request: Request):
+    """Aggregates models from all running vLLM services (served from the health snapshot)."""
+    body, etag = render_models()
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+async def run_vllm_ctl(*args):
+    proc = await asyncio.create_subprocess_exec(
+        str(VLLM_CTL), *args,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    await proc.wait()
+
+async def start_model(name):
+    for address in table.replica_sets[name].weights:
+        readiness.starting(address)
+    await run_vllm_ctl("start", name)
+
+async def stop_model(name):
+    await run_vllm_ctl("stop", name)
+
+async def wait_model_ready(name, timeout, routes=None):
+    routes = routes or table
+
+    async def probe():
+        state = model_state(name, routes)
+        if state not in (UP, WARMING) and WORKER_ID == COORDINATOR:
+            # Don't wait for the next poll to notice it came up
+            await asyncio.gather(*(health.refresh(address) for address in routes.replica_sets[name].weights))
+            state = model_state(name, routes)
+        return state == UP
+
+    try:
+        await wait_until_ready(probe, timeout)
+    except asyncio.TimeoutError:
+        raise asyncio.TimeoutError(f"Model '{name}' did not become ready within {timeout:.0f}s") from None
+
+async def ensure_on_coordinator(name):
+    """Has the coordinator's scheduler start a model (for the other router workers)."""
+    try:
+        response = await coordinator.request("POST", f"/admin/scheduler/ensure/{name}", timeout=MODEL_READY_TIMEOUT + 30)
+        error = response.json().get("error") if response.status_code != 200 else None
+    except (httpx.HTTPError, ValueError) as e:
+        raise SchedulerUnavailable(f"Router worker {COORDINATOR} is unreachable: {e}") from None
+    if response.status_code == 504:
+        raise asyncio.TimeoutError(error)
+    if error is not None:
+        raise InsufficientMemory(error)
+
+scheduler = None
+if MEMORY_BUDGET and WORKER_ID != COORDINATOR:
+    # Models are only started and stopped by the coordinator; ask it
+    scheduler = RemoteScheduler(
+        MODELS,
+        is_running=model_running,
+        wait_ready=wait_model_ready,
+        ensure_remote=ensure_on_coordinator,
+        ready_timeout=MODEL_READY_TIMEOUT,
+    )
+elif MEMORY_BUDGET:
+    scheduler = ModelScheduler(
+        MODELS,
+        parse_size(MEMORY_BUDGET),
+        start=start_model,
+        stop=stop_model,
+        is_running=model_running,
+        wait_ready=wait_model_ready,
+        in_flight=lambda name: stream_stats.in_flight(name) + (shared.peer_sum("in_flight", name) if shared else 0),
+        pinned=PINNED_MODELS,
+        ready_timeout=MODEL_READY_TIMEOUT,
+        sizing=lambda name: size_model(name, table.models[name], models=table.models),
+    )
+
+@app.get("/admin/scheduler")
+async def get_scheduler_stats():
+    """Memory budget, resident models and activation/eviction counts."""
+    if scheduler is None:
+        return JSONResponse({"error": "On-demand activation is disabled (set ROUTER_MEMORY_BUDGET)"}, status_code=404)
+    return scheduler.stats()
+
+@app.post("/admin/scheduler/ensure/{name}")
+async def ensure_model(name: str):
+    """Starts a model if it isn't running, on behalf of another router worker."""
+    if scheduler is None:
+        return JSONResponse({"error": "On-demand activation is disabled (set ROUTER_MEMORY_BUDGET)"}, status_code=404)
+    if name not in table.models:
+        return JSONResponse({"error": f"Unknown model '{name}'"}, status_code=404)
+    try:
+        await scheduler.ensure_running(name)
+    except InsufficientMemory as e:
+        return JSONResponse({"error": str(e)}, status_code=503)
+    except asyncio.TimeoutError as e:
+        return JSONResponse({"error": str(e)}, status_code=504)
+    return {"model": name, "state": model_state(name)}
+
+@app.get("/admin/readiness")
+async def get_readiness():
+    """Startup-to-ready time and warm-up step timings per backend."""
+    return readiness.snapshot()
+
+@app.get("/admin/health")
+async def get_health():
+    """Per-backend state as last seen by the health poller."""
+    return health.snapshot()
+
+def swap_table(models):
+    """Makes a validated registry the live routing table; returns what changed."""
+    global table
+    old = table
+    changes = diff_models(old.models, models)
+    if not any(changes.values()):
+        return changes
+    new = RoutingTable(models, BALANCE_MODE, previous=old)
+    # Admission, breaker and pool overrides are read when their controller (or pool) is created
+    for name, fields in changes["changed"].items():
+        if "admission" in fields:
+            admission.discard(name)
+        if "breaker" in fields:
+            for address in new.replica_sets[name].weights:
+                breakers.discard(address)
+        if "pool" in fields:
+            for address in new.replica_sets[name].weights:
+                pools.discard(address)
+    for name in changes["removed"]:
+        admission.discard(name)
+    table = new
+    for address in old.backend_owner.keys() - new.backend_owner.keys():
+        health.forget(address)
+        breakers.discard(address)
+        pools.discard(address)
+    if scheduler is not None:
+        scheduler.models = models
+    print(f"Registry v{new.version}: added {changes['added']}, removed {changes['removed']}, "
+          f"changed {list(changes['changed'])}")
+    return changes
+
+# Reloads models.json when it changes; an invalid version is reported and skipped
+registry = RegistryWatcher(swap_table, interval=REGISTRY_INTERVAL)
+
+@app.get("/admin/registry")
+async def get_registry():
+    """Live routing table version and models, and the last registry file error."""
+    return dict(registry.stats(), version=table.version, loaded_at=table.loaded_at, models=table.models)
+
+@app.get("/admin/registry/diff")
+async def get_registry_diff():
+    """What reloading the registry file would change, without applying it."""
+    try:
+        models = load_models(registry.path)
+    except RegistryError as e:
+        return JSONResponse({"error": "Invalid registry", "problems": e.problems}, status_code=422)
+    return diff_models(table.models, models)
+
+@app.post("/admin/registry/reload")
+async def reload_registry():
+    """Re-reads the registry file and swaps it in; in-flight requests finish on the old table."""
+    try:
+        models = registry.load()
+    except RegistryError as e:
+        return JSONResponse(
+            {"error": "Invalid registry, keeping the current one", "problems": e.problems}, status_code=422
+        )
+    return dict(swap_table(models), version=table.version)
+
+def parse_body(content):
+    """Returns a JSON object request body as a dict, or None."""
+    if not content or not content.lstrip().startswith(b"{"):
+        return None
+    try:
+        payload = json.loads(content)
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+def extract_model(content):
+    """Returns the "model" field of a JSON request body, or None."""
+    model = (parse_body(content) or {}).get("model")
+    return model if isinstance(model, str) else None
+
+def model_load(name):
+    """Requests queued for a model per concurrency slot."""
+    slot = admission.models.get(name)
+    if slot is None:
+        return 0.0
+    return slot.queued / max(1, slot.settings["max_concurrency"])
+
+def choose_model(routes, alias, payload):
+    """The model an "auto" alias resolves to for this request (raises NoModelAvailable)."""
+    return select_model(
+        alias, payload, routes.models,
+        lambda name: model_state(name, routes), model_load,
+        allow_start=scheduler is not None,
+    )
+
+def resolve_upstream(model, routes=None):
+    """Picks the upstream (a model name or "litellm") for a requested model, or None if nothing can serve it."""
+    if litellm_process.ROUTING_MODE == "direct":
+        if model in (routes or table).models:
+            return model
+    if litellm_process.enabled():
+        return "litellm"
+    return None
+
+@app.get("/admin/pools")
+async def get_pool_stats():
+    """Live connection pool stats per upstream."""
+    return pools.stats()
+
+def worker_snapshot():
+    """This worker's counters, as published to the other router workers."""
+    admission_stats = admission.stats()
     return {
-        "object": "list",
-        "data": data
+        "metrics": metrics.export(),
+        "admission_active": {m: s["active"] for m, s in admission_stats.items()},
+        "admission_queued": {m: s["queued"] for m, s in admission_stats.items()},
+        "admission": {
+            m: {k: s[k] for k in ("active", "queued", "rejected", "timed_out", "wait_max_ms")}
+            for m, s in admission_stats.items()
+        },
+        "in_flight": {m: s["in_flight"] for m, s in stream_stats.snapshot().items()},
+        "replica_in_flight": {name: dict(rs.in_flight) for name, rs in table.replica_sets.items()},
+        "clients": {
+            name: {"taken": c.taken, "rejected": c.rejected, "tokens_used": c.tokens_used}
+            for name, c in clients.clients.items()
+        },
+        "last_used": dict(scheduler.last_used) if scheduler is not None else {},
+        "health": health.export() if WORKER_ID == COORDINATOR else {},
     }
 
-@app.api_route("/{path_name:path}", methods=["GET", "POST", "PUT", "DELETE"])
-async def catch_all(path_name: str, request: Request):
-    """Proxy everything else to LiteLLM."""
-    url = f"{LITELLM_HOST}:{LITELLM_PORT}/{path_name}"
-    
-    # Read body before stream?
-    content = await request.body()
-
-    # Forward headers but strip Host and content-length
-    # Also filter out malformed Authorization headers (empty or whitespace-only tokens)
-    headers = {}
-    for k, v in request.headers.items():
-        if k.lower() in ("host", "content-length"):
-            continue
-        
-        # Skip Authorization header if it's empty or just "Bearer" with no/empty token
-        skip_header = False
-        if k.lower() == "authorization":
-            # Check if it's "Bearer " with no token or just whitespace
-            if not v or not v.strip():
-                skip_header = True
-            # If it starts with "Bearer ", check if there's actually a token
-            elif v.strip().startswith("Bearer "):
-                token = v.strip()[7:].strip()  # Get everything after "Bearer "
-                if not token:  # Empty token
-                    skip_header = True
-        
-        if not skip_header:
-            headers[k] = v
-    
+def absorb_peers(peers):
+    """Applies the other workers' latest snapshots to this worker's limits, scheduler
+    and (except on the coordinator) backend health."""
+    for worker_id, peer in peers.items():
+        clients.absorb((worker_id, peer["pid"]), {name: c["taken"] for name, c in peer["clients"].items()})
+    admission.rebalance()
+    if COORDINATOR in peers:
+        health.absorb(peers[COORDINATOR]["health"])
+    if isinstance(scheduler, ModelScheduler):
+        # Models busy on other workers aren't idle (time.monotonic() is host-wide)
+        for peer in peers.values():
+            for name, used in peer["last_used"].items():
+                scheduler.last_used[name] = max(scheduler.last_used.get(name, 0.0), used)
+
+def combined_stats():
+    """(admission, clients, replica in-flight) totals over all router workers."""
+    local = worker_snapshot()
+    snapshots = [local] + (list(shared.peers.values()) if shared else [])
+    admission_totals, client_totals, replica_totals = {}, {}, {}
+    for snapshot in snapshots:
+        for model, stats in snapshot["admission"].items():
+            total = admission_totals.setdefault(model, dict.fromkeys(stats, 0))
+            for key, value in stats.items():
+                total[key] = max(total[key], value) if key == "wait_max_ms" else total[key] + value
+        for name, stats in snapshot["clients"].items():
+            total = client_totals.setdefault(name, {"rejected": 0, "tokens_used": 0})
+            total["rejected"] += stats["rejected"]
+            total["tokens_used"] += stats["tokens_used"]
+        for name, in_flight in snapshot["replica_in_flight"].items():
+            for address, count in in_flight.items():
+                key = (name, address)
+                replica_totals[key] = replica_totals.get(key, 0) + count
+    return admission_totals, client_totals, replica_totals
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: per-model latency histograms plus queue, pool and cache gauges.
+
+    With several router workers, request metrics, admission, caller and replica
+    figures are totals over all of them; the rest are this worker's own.
+    """
+    peers = list(shared.peers.values()) if shared else []
+    lines = (metrics.combined(peer["metrics"] for peer in peers) if peers else metrics).render()
+    admission_stats, client_stats, replica_in_flight = combined_stats()
+    lines += render_gauge("router_admission_active", "Requests holding an admission slot.",
+                          {(("model", m),): s["active"] for m, s in admission_stats.items()})
+    lines += render_gauge("router_admission_queued", "Requests waiting for an admission slot.",
+                          {(("model", m),): s["queued"] for m, s in admission_stats.items()})
+    lines += render_gauge("router_admission_wait_max_seconds", "Longest admission queue wait so far.",
+                          {(("model", m),): s["wait_max_ms"] / 1000 for m, s in admission_stats.items()})
+    lines += render_gauge("router_admission_rejected", "Requests turned away with a 429.",
+                          {(("model", m),): s["rejected"] + s["timed_out"] for m, s in admission_stats.items()})
+    lines += render_gauge("router_client_rejected", "Requests turned away by a caller's rate limits.",
+                          {(("client", c),): s["rejected"] for c, s in client_stats.items()})
+    lines += render_gauge("router_client_tokens_used", "Tokens used per caller (usage, else the estimate).",
+                          {(("client", c),): s["tokens_used"] for c, s in client_stats.items()})
+    lines += render_gauge("router_replica_in_flight", "In-flight requests per replica.", {
+        (("model", name), ("replica", address)): count for (name, address), count in replica_in_flight.items()
+    })
+    lines += render_gauge("router_breaker_open", "1 while a backend's circuit breaker is open or half-open.", {
+        (("backend", b),): int(st["state"] != "closed") for b, st in breakers.stats().items()
+    })
+    pool_stats = pools.stats()
+    for field in ("in_use", "idle", "waiting"):
+        lines += render_gauge(f"router_pool_connections_{field}", f"Upstream connections {field}.",
+                              {(("backend", b),): s[field] for b, s in pool_stats.items()})
+    if embedder is not None:
+        embed_stats = embedder.stats()
+        lines += render_gauge("router_embedding_requests", "Embedding requests seen by the batcher, and sent upstream.", {
+            (("kind", "received"),): embed_stats["requests"], (("kind", "upstream"),): embed_stats["upstream_requests"],
+        })
+        lines += render_gauge("router_embedding_batch_size_avg", "Average inputs per batched embedding request.",
+                              {(): embed_stats["batch_size_avg"]})
+    if response_cache is not None:
+        cache_stats = response_cache.stats()
+        lines += render_gauge("router_cache_events", "Response cache hits, misses and evictions.", {
+            (("event", event),): cache_stats[event]
+            for event in ("hits", "disk_hits", "misses", "stores", "bypasses", "memory_evictions", "disk_evictions")
+        })
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/replicas")
+async def get_replica_stats():
+    """Per-replica weights and in-flight requests, per model."""
+    return {name: replica_set.stats() for name, replica_set in table.replica_sets.items()}
+
+@app.get("/admin/admission")
+async def get_admission_stats():
+    """Active requests, queue depth and queue wait times per model."""
+    return admission.stats()
+
+@app.get("/admin/workers")
+async def get_worker_stats():
+    """Router worker processes and how fresh their published counters are."""
+    if shared is None:
+        return JSONResponse({"error": "Single-process router (start it with router_workers.py)"}, status_code=404)
+    return shared.stats()
+
+@app.get("/admin/clients")
+async def get_client_stats():
+    """Per-API-key weight, rate limit headroom and token usage."""
+    return clients.stats()
+
+async def send_batch_request(client, url, body):
+    """Runs one batch request through catch_all at low priority; returns (status, headers, content)."""
+    control = {"x-priority": "low"}
+    if client:
+        control["client"] = client
+    request = ProxyRequest("POST", url, [(b"content-type", b"application/json")], control,
+                           json.dumps(body).encode(), False, time.perf_counter())
+    return await collect_response(await catch_all(request), url)
+
+def batch_capacity(model):
+    """Free slots of a model for a batch to fill (negative while requests queue for it)."""
+    slot = admission.models.get(model)
+    if slot is None:
+        return admission.defaults["max_concurrency"]
+    return slot.settings["max_concurrency"] - slot.active - slot.queued
+
+# Background batch jobs (ROUTER_BATCH_DIR, ROUTER_BATCH_MAX_CONCURRENCY), resumed on start
+batches = BatchManager(send_batch_request, batch_capacity)
+
+@app.post("/v1/files")
+async def upload_file(request: Request):
+    """Stores a batch input file (the raw JSONL as the request body)."""
+    data = await request.body()
+    if not data.strip():
+        return JSONResponse({"error": "Empty file"}, status_code=400)
+    return batches.store_file(data, request.query_params.get("filename"))
+
+@app.get("/v1/files/{file_id}/content")
+async def get_file_content(file_id: str):
+    """An uploaded file, or a batch's output (<batch id>-output) or errors (<batch id>-errors)."""
+    try:
+        path = batches.file_path(file_id)
+    except KeyError:
+        return JSONResponse({"error": f"File '{file_id}' not found"}, status_code=404)
+    return Response(path.read_bytes(), media_type="application/jsonl")
+
+@app.post("/v1/batches")
+async def create_batch(request: Request):
+    """Starts a batch: {"input_file_id": <file id or local path>, "endpoint": ..., "model": optional override}."""
     try:
-        rp_req = client.build_request(
-            request.method,
-            url,
-            headers=headers,
-            content=content,
+        spec = await request.json()
+    except ValueError:
+        spec = None
+    if not isinstance(spec, dict) or not isinstance(spec.get("input_file_id"), str):
+        return JSONResponse({"error": "input_file_id is required"}, status_code=400)
+    try:
+        job = batches.create(
+            spec["input_file_id"],
+            spec.get("endpoint", "/v1/chat/completions"),
+            clients.identify(request.headers.get("authorization")),
+            spec.get("model"),
+            spec.get("metadata"),
         )
-        
-        rp_resp = await client.send(rp_req, stream=True)
-        
-        return StreamingResponse(
-            rp_resp.aiter_bytes(),
+    except BatchError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return job.describe()
+
+@app.get("/v1/batches")
+async def list_batches():
+    """All batch jobs, with progress, throughput and ETA for running ones."""
+    return {"object": "list", "data": batches.stats()}
+
+@app.get("/v1/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """One batch job and its request counts."""
+    try:
+        return batches.get(batch_id).describe()
+    except KeyError:
+        return JSONResponse({"error": f"Batch '{batch_id}' not found"}, status_code=404)
+
+@app.post("/v1/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str):
+    """Stops a batch; results written so far are kept."""
+    try:
+        return batches.cancel(batch_id).describe()
+    except KeyError:
+        return JSONResponse({"error": f"Batch '{batch_id}' not found"}, status_code=404)
+
+@app.get("/admin/cache")
+async def get_cache_stats():
+    """Response cache hit/miss/eviction counters."""
+    if response_cache is None:
+        return JSONResponse({"error": "Response cache is disabled (set ROUTER_CACHE=1)"}, status_code=404)
+    return response_cache.stats()
+
+@app.get("/admin/coalescer")
+async def get_coalescer_stats():
+    """In-flight shared generations and how many requests joined one."""
+    if coalescer is None:
+        return JSONResponse({"error": "Coalescing is disabled (ROUTER_COALESCE=0)"}, status_code=404)
+    return coalescer.stats()
+
+@app.get("/admin/embeddings")
+async def get_embedding_stats():
+    """Embedding micro-batching: batch sizes, window wait and upstream requests saved."""
+    if embedder is None:
+        return JSONResponse({"error": "Embedding batching is disabled (ROUTER_EMBED_BATCH=0)"}, status_code=404)
+    return embedder.stats()
+
+@app.get("/admin/traces")
+async def get_traces(min_ms: float = 0.0, limit: int = 100, otlp: bool = False):
+    """Kept request traces (slow, failed or sampled), newest first; as OTLP JSON with otlp=true."""
+    if tracer is None:
+        return JSONResponse({"error": "Request tracing is disabled (set ROUTER_TRACE=1)"}, status_code=404)
+    traces = tracer.traces(min_ms, limit)
+    if otlp:
+        return otlp_payload(traces)
+    return {"stats": tracer.stats(), "traces": traces}
+
+@app.get("/admin/profile")
+async def get_profile(seconds: float = 10.0, hz: int = 97):
+    """Samples the router's event loop for `seconds`; folded stacks for flamegraph.pl or speedscope."""
+    global profiling
+    if profiling:
+        return JSONResponse({"error": "A profile is already running"}, status_code=409)
+    profiling = True
+    try:
+        # Handlers run on the event loop's thread
+        profiler = SamplingProfiler(threading.get_ident(), hz)
+        await asyncio.to_thread(profiler.run, seconds)
+    finally:
+        profiling = False
+    return PlainTextResponse(profiler.folded(), headers={"X-Profile-Samples": str(profiler.samples)})
+
+@app.get("/admin/breakers")
+async def get_breaker_stats():
+    """Circuit breaker state and failure counts per backend."""
+    return breakers.stats()
+
+@app.get("/admin/hedging")
+async def get_hedging_stats():
+    """Current hedge delay and how often hedges were sent and won, per model."""
+    return hedger.stats()
+
+@app.get("/admin/streams")
+async def get_stream_stats():
+    """Completed vs client-aborted streams per upstream."""
+    return stream_stats.snapshot()
+
+def queue_timeout(request):
+    """Optional per-request queue deadline (seconds) from the X-Queue-Timeout header."""
+    try:
+        return float(request.control["x-queue-timeout"])
+    except (KeyError, ValueError):
+        return None
+
+def prompt_bytes(request):
+    """Size of the request body, for estimating its prompt tokens."""
+    if not request.streamed:
+        return len(request.content)
+    try:
+        return int(request.control.get("content-length", ""))
+    except ValueError:
+        return len(request.content.prefix)
+
+def rejected(e):
+    """429 for a request turned away by admission control or a rate limit."""
+    return JSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": str(e.retry_after)})
+
+def cache_policy(request):
+    """(lookup, store) for a request: X-Cache-Bypass skips the cache entirely,
+    Cache-Control: no-cache forces a fresh generation, no-store keeps it out."""
+    if request.control.get("x-cache-bypass", "").lower() in ("1", "true", "yes"):
+        return False, False
+    cache_control = request.control.get("cache-control", "").lower()
+    return "no-cache" not in cache_control, "no-store" not in cache_control
+
+def backend_breaker(address, routes=None):
+    """Returns the circuit breaker for a backend address, or for LiteLLM."""
+    overrides = (routes or table).config(address).get("breaker") if address != "litellm" else None
+    return breakers.get(address, overrides)
+
+def available_replicas(routes, name):
+    """Replicas of a model that are neither known to be down nor behind an open breaker."""
+    return [
+        address for address in routes.replica_sets[name].weights
+        if health.state(address) in (UP, UNKNOWN) and backend_breaker(address, routes).available()
+    ]
+
+def unavailable(routes, upstream, addresses):
+    """503 for an upstream none of whose backends can take a request right now."""
+    tripped = [backend_breaker(a, routes) for a in addresses if not backend_breaker(a, routes).available()]
+    if not tripped:
+        return JSONResponse({"error": f"No replica of '{upstream}' is available"}, status_code=503)
+    for breaker in tripped:
+        breaker.rejected += 1
+    retry_after = min(breaker.retry_after() for breaker in tripped)
+    return JSONResponse(
+        {"error": f"'{upstream}' is failing (connect errors or timeouts); circuit open, retry in {retry_after}s"},
+        status_code=503,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+async def send_upstream(routes, address, request, content, stream=False):
+    """Sends a request to one backend, recording the outcome on its circuit breaker.
+
+    For a streaming request (`stream`) the response headers must arrive within
+    STREAM_HEADERS_TIMEOUT, else asyncio.TimeoutError is raised.
+    """
+    breaker = backend_breaker(address, routes)
+    breaker.attempt()
+    pool = backend_pool(address, routes)
+    try:
+        # Headers were filtered once on the raw ASGI pairs (see asgi_proxy)
+        rp_req = pool.build_request(request.method, request.path, headers=request.headers, content=content)
+        sending = pool.send(rp_req, stream=True)
+        rp_resp = await (asyncio.wait_for(sending, STREAM_HEADERS_TIMEOUT) if stream else sending)
+    except httpx.PoolTimeout:
+        # Our own connection limit, not the backend's fault
+        breaker.cancelled()
+        raise
+    except (httpx.ConnectError, httpx.TimeoutException, asyncio.TimeoutError):
+        breaker.failure()
+        raise
+    except BaseException:
+        breaker.cancelled()
+        raise
+    breaker.success()
+    return rp_resp
+
+def hedge_enabled(routes, upstream, request, payload):
+    # Only streaming requests have a first token to wait for, and only a
+    # buffered body can be sent twice
+    return (not request.streamed and payload.get("stream") is True
+            and routes.models[upstream].get("hedge", HEDGE_ENABLED))
+
+def hedge_target(routes, upstream, request, payload, address):
+    """A spare replica of `upstream`, else a replica of its fallback model:
+    (replica set, address, request body), or None."""
+    replica_set = routes.replica_sets[upstream]
+    spare = replica_set.pick(payload, [a for a in available_replicas(routes, upstream) if a != address])
+    if spare is not None:
+        return replica_set, spare, request.content
+    fallback = routes.models[upstream].get("fallback")
+    if fallback in routes.replica_sets:
+        target = routes.replica_sets[fallback].pick(payload, available_replicas(routes, fallback))
+        if target is not None:
+            return routes.replica_sets[fallback], target, json.dumps(dict(payload, model=fallback)).encode()
+    return None
+
+async def first_chunk(routes, replica_set, address, request, content):
+    """Sends to `address` and waits for the first body chunk."""
+    rp_resp = await send_upstream(routes, address, request, content, stream=True)
+    rest = rp_resp.aiter_bytes()
+    try:
+        first = await rest.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    except BaseException:
+        await rp_resp.aclose()
+        raise
+    return replica_set, address, rp_resp, first, rest
+
+async def discard_attempt(result):
+    await result[2].aclose()
+
+async def send_hedged(routes, request, payload, upstream, address):
+    """Sends to `address` and, if no first token arrives within the model's hedge
+    delay, to a spare replica or the fallback model as well.
+
+    Returns ((replica set, address, response, first chunk, rest of body), hedge_won);
+    the hedge's replica is held only if it won.
+    """
+    sent = time.perf_counter()
+    primary = first_chunk(routes, routes.replica_sets[upstream], address, request, request.content)
+    delay = hedger.delay(upstream)
+    target = hedge_target(routes, upstream, request, payload, address) if delay is not None else None
+    if target is None:
+        result, hedge_won = await primary, False
+    else:
+        target_set, target_address, content = target
+        hedge_started = False
+
+        async def hedge():
+            nonlocal hedge_started
+            hedge_started = True
+            target_set.acquire(target_address)
+            return await first_chunk(routes, target_set, target_address, request, content)
+
+        try:
+            result, hedge_won = await hedger.race(upstream, primary, hedge, delay, discard_attempt)
+        except BaseException:
+            if hedge_started:
+                target_set.release(target_address)
+            raise
+        if hedge_started and not hedge_won:
+            target_set.release(target_address)
+    hedger.observe(upstream, time.perf_counter() - sent)
+    return result, hedge_won
+
+async def collect_response(response, path):
+    """Runs an ASGI response for an in-router caller; returns (status, headers, content)."""
+    start = {}
+    chunks = []
+
+    async def receive():
+        # Nobody disconnects; the response stops waiting once it is sent
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            start.update(message)
+        else:
+            chunks.append(message.get("body", b""))
+
+    await response({"type": "http", "method": "POST", "path": path, "headers": []}, receive, send)
+    headers = {k.decode("latin1"): v.decode("latin1") for k, v in start.get("headers", [])}
+    return start.get("status", 502), headers, b"".join(chunks)
+
+async def send_embedding_batch(key, items):
+    """Sends a batch of single-input embedding requests upstream as one request.
+
+    Each caller is charged for its own input; the merged request takes one
+    admission slot under a shared, unlimited identity. Inputs the backend
+    rejects as a batch are retried one by one.
+    """
+    routes, request, payload, upstream = items[0].context
+    charged = []
+    for item in items:
+        item_request = item.context[1]
+        client = clients.get(clients.identify(item_request.control.get("authorization")))
+        estimate = max(1, len(item_request.content) // 4)
+        try:
+            client.charge(estimate)
+        except Rejected as e:
+            metrics.requests.inc((("model", upstream), ("code", "429")))
+            item.resolve(rejected(e))
+            continue
+        charged.append((item, client, estimate))
+    if not charged:
+        return
+
+    merged = dict(payload, input=[item.text for item, _, _ in charged])
+    control = {"x-priority": request.control.get("x-priority", "normal")}
+    batch_request = ProxyRequest("POST", request.path, request.headers, control,
+                                 json.dumps(merged).encode(), False, time.perf_counter())
+    response = await forward(routes, batch_request, merged, upstream, None, {}, client=embedding_client)
+    status, headers, content = await collect_response(response, request.path)
+
+    if status in (400, 413, 422) and len(charged) > 1:
+        # One bad input fails the whole batch: let each go on its own
+        for item, client, estimate in charged:
+            client.refund(estimate)
+        return
+    try:
+        results = split_response(json.loads(content), [item.text for item, _, _ in charged]) if status == 200 else None
+    except (ValueError, KeyError, TypeError):
+        status, results = 502, None
+    for i, (item, client, estimate) in enumerate(charged):
+        if results is None:
+            client.settle(estimate, 0)
+            error_headers = {"Retry-After": headers["retry-after"]} if "retry-after" in headers else None
+            item.resolve(Response(content, status_code=status, headers=error_headers,
+                                  media_type=headers.get("content-type", "application/json")))
+            continue
+        client.settle(estimate, results[i].get("usage", {}).get("prompt_tokens"))
+        item.resolve(JSONResponse(results[i], headers={"X-Embedding-Batch": str(len(charged))}))
+
+async def proxy(scope, receive, send):
+    """Proxy everything but the router's own endpoints to the model backend (or LiteLLM as a fallback)."""
+    started = time.perf_counter()
+    trace = tracer.start(scope["method"], scope["path"], started) if tracer is not None else None
+    try:
+        request = await read_request(scope, receive, started, MAX_BUFFERED_BODY, trace)
+    except ClientDisconnected:
+        return
+    if trace is not None:
+        trace.phase("route", streamed=request.streamed)
+        request.trace = trace
+    response = await catch_all(request)
+    try:
+        await response(scope, receive, send)
+    finally:
+        if trace is not None:
+            trace.finish(response.status_code)
+
+async def catch_all(request):
+    """Routes a ProxyRequest and returns the ASGI response to send back."""
+    # Looked up once: a registry reload from here on only affects later requests
+    routes = table
+    if request.streamed:
+        # Only the start of the body has been read; enough to route on
+        payload = {}
+        model = sniff_model(request.content.prefix)
+    else:
+        payload = parse_body(request.content) or {}
+        model = payload.get("model")
+        if not isinstance(model, str):
+            model = None
+
+    response_headers = {}
+    if model in AUTO_MODELS:
+        if request.streamed:
+            return JSONResponse({"error": f"Request body too large for model '{model}'"}, status_code=400)
+        try:
+            model = choose_model(routes, model, payload)
+        except NoModelAvailable as e:
+            return JSONResponse({"error": str(e)}, status_code=e.status_code)
+        payload["model"] = model
+        request.content = json.dumps(payload).encode()
+        response_headers["X-Routed-Model"] = model
+
+    upstream = resolve_upstream(model, routes)
+    if upstream is None:
+        if model is None:
+            return JSONResponse({"error": "Request does not specify a model"}, status_code=400)
+        return JSONResponse({"error": f"Model '{model}' not found"}, status_code=404)
+    trace = request.trace
+    if trace is not None:
+        trace.attrs["model"] = upstream
+
+    if embedder is not None and upstream != "litellm" and not request.streamed and request.path == "/v1/embeddings":
+        text = single_input(payload)
+        options = batch_key(payload)
+        if text is not None and options is not None:
+            pending = PendingEmbedding(text, (routes, request, payload, upstream))
+            if trace is not None:
+                trace.phase("embedding_batch")
+            result = await embedder.submit((routes.version, upstream, options), pending)
+            if result is not ALONE:
+                return result
+
+    # Deterministic requests may be answered without touching the backend
+    key = None
+    store = False
+    if upstream != "litellm" and (response_cache is not None or coalescer is not None):
+        key = cache_key(request.path.lstrip("/"), payload)
+    if key is not None and response_cache is not None:
+        lookup, store = cache_policy(request)
+        cached = await response_cache.get(key) if lookup else None
+        if cached is not None:
+            if trace is not None:
+                trace.attrs["cache"] = "hit"
+            return StreamingResponse(
+                iter(cached.chunks),
+                status_code=cached.status_code,
+                media_type=cached.content_type,
+                headers=dict(response_headers, **{"X-Cache": "HIT"}),
+            )
+        if not lookup:
+            response_cache.bypasses += 1
+        response_headers["X-Cache"] = "MISS" if lookup else "BYPASS"
+
+    if key is None or coalescer is None:
+        return await forward(routes, request, payload, upstream, key if store else None, response_headers)
+
+    # Identical deterministic request already in flight: share its stream
+    flight, leader = coalescer.join(key)
+    if leader:
+        try:
+            response = await forward(routes, request, payload, upstream,
+                                     key if store else None, response_headers, flight)
+        except BaseException:
+            flight.fail(JSONResponse({"error": "Upstream request failed"}, status_code=502))
+            raise
+        if not flight.ready.is_set():
+            # Failed before streaming (429, 503, ...): followers get the same answer
+            flight.fail(response)
+        return response
+    if trace is not None:
+        trace.phase("coalesced")
+    await flight.ready.wait()
+    if flight.error is not None:
+        return flight.error
+    return StreamingResponse(
+        flight.subscribe(),
+        status_code=flight.status_code,
+        media_type=flight.content_type,
+        headers=dict(response_headers, **{"X-Coalesced": "1"}),
+    )
+
+async def forward(routes, request, payload, upstream, store_key, response_headers, flight=None, client=None):
+    """Sends a request to its upstream and streams the response back.
+
+    If `store_key` is set, a successful response is stored in the response cache;
+    if `flight` is set, the upstream stream is shared through it. `client` is the
+    caller to charge, by default the one identified by the request.
+    """
+    trace = request.trace
+    if upstream != "litellm":
+        if scheduler is not None:
+            # Starts the model (evicting idle ones) if it isn't running yet
+            if trace is not None:
+                trace.phase("model_ready")
+            try:
+                await scheduler.ensure_running(upstream)
+            except (InsufficientMemory, SchedulerUnavailable, asyncio.TimeoutError) as e:
+                metrics.requests.inc((("model", upstream), ("code", "503")))
+                return JSONResponse({"error": str(e)}, status_code=503)
+        elif model_state(upstream, routes) == DOWN:
+            # Known to be down as of the last poll: don't wait for a connect error
+            metrics.requests.inc((("model", upstream), ("code", "503")))
+            return JSONResponse({"error": f"Model '{upstream}' is not running"}, status_code=503)
+        elif model_state(upstream, routes) == WARMING:
+            if trace is not None:
+                trace.phase("model_ready")
+            try:
+                await wait_model_ready(upstream, MODEL_READY_TIMEOUT, routes)
+            except asyncio.TimeoutError as e:
+                metrics.requests.inc((("model", upstream), ("code", "503")))
+                return JSONResponse({"error": str(e)}, status_code=503)
+
+    if trace is not None:
+        trace.phase("admission")
+    # The caller's rate limits are charged an estimate now, settled from usage at the end
+    # Batch requests come with the submitter's name rather than their key
+    if client is None:
+        client = clients.get(request.control.get("client") or clients.identify(request.control.get("authorization")))
+    estimate = estimate_tokens(prompt_bytes(request), payload)
+    try:
+        client.charge(estimate)
+    except Rejected as e:
+        metrics.requests.inc((("model", upstream), ("code", "429")))
+        return rejected(e)
+
+    # Wait for a slot on the model (fairly shared between callers), or get turned away with a 429
+    slot = None
+    if upstream != "litellm":
+        slot = admission.get(upstream, routes.models[upstream].get("admission"))
+        priority = PRIORITIES.get(request.control.get("x-priority", "normal").lower(), PRIORITIES["normal"])
+        try:
+            await slot.acquire(priority, queue_timeout(request), client.name, client.weight, estimate)
+        except Rejected as e:
+            client.settle(estimate, 0)
+            metrics.requests.inc((("model", upstream), ("code", "429")))
+            return rejected(e)
+    admitted_at = time.monotonic()
+
+    # Pick a replica among those not known to be down, nor tripped
+    address = "litellm"
+    replica_set = None
+    if upstream != "litellm":
+        replica_set = routes.replica_sets[upstream]
+        address = replica_set.pick(payload, available_replicas(routes, upstream))
+        if address is None:
+            slot.release()
+            client.settle(estimate, 0)
+            metrics.requests.inc((("model", upstream), ("code", "503")))
+            return unavailable(routes, upstream, replica_set.weights)
+        replica_set.acquire(address)
+    elif not backend_breaker("litellm").available():
+        client.settle(estimate, 0)
+        metrics.requests.inc((("model", upstream), ("code", "503")))
+        return unavailable(routes, upstream, ["litellm"])
+
+    observer = None
+
+    def release_slot():
+        if slot is not None:
+            slot.release(time.monotonic() - admitted_at)
+        if replica_set is not None:
+            replica_set.release(address)
+        client.settle(estimate, usage_tokens(observer))
+
+    stream_stats.started(upstream)
+    if trace is not None:
+        trace.phase("upstream_connect", replica=address)
+    try:
+        if upstream != "litellm" and hedge_enabled(routes, upstream, request, payload):
+            (winner_set, winner, rp_resp, first, rest), hedge_won = await send_hedged(
+                routes, request, payload, upstream, address
+            )
+            if hedge_won:
+                if trace is not None:
+                    trace.attrs["hedge_won"] = winner
+                replica_set.release(address)
+                replica_set, address = winner_set, winner
+            body = prepend(first, rest)
+        else:
+            rp_resp = await send_upstream(routes, address, request, request.content, payload.get("stream") is True)
+            body = None
+        content_type = rp_resp.headers.get("content-type")
+        observer = metrics.observe(upstream, request.started)
+        observer.response(rp_resp.status_code)
+        if trace is not None:
+            trace.phase("first_byte", status=rp_resp.status_code)
+            trace.observer = observer
+
+        def store(chunks):
+            entry = CachedResponse(rp_resp.status_code, content_type, chunks)
+            asyncio.ensure_future(response_cache.put(store_key, entry))
+        on_complete = store if store_key is not None and rp_resp.status_code == 200 else None
+
+        # relay() closes the upstream as soon as the client goes away, so the
+        # backend aborts the generation instead of finishing it for nobody
+        body = relay(rp_resp, upstream, stream_stats, payload.get("max_tokens"),
+                     on_close=release_slot, on_complete=on_complete, observer=observer, body=body)
+        if flight is not None:
+            flight.start(rp_resp.status_code, content_type, body)
+            body = flight.subscribe()
+        return UpstreamStreamingResponse(
+            body,
             status_code=rp_resp.status_code,
-            background=None
+            media_type=content_type,
+            headers=response_headers,
+            # A shared stream is read, and cleaned up, by its flight
+            on_unstarted=None if flight is not None else lambda: abandon(
+                rp_resp, upstream, stream_stats, payload.get("max_tokens"), on_close=release_slot, observer=observer
+            ),
+        )
+    except ClientDisconnected:
+        # Gone while its body was still being streamed upstream
+        stream_stats.aborted(upstream, 0, None)
+        release_slot()
+        return Response(status_code=499)
+    except asyncio.TimeoutError:
+        stream_stats.failed(upstream)
+        release_slot()
+        metrics.requests.inc((("model", upstream), ("code", "504")))
+        return JSONResponse(
+            {"error": f"'{upstream}' did not start responding within {STREAM_HEADERS_TIMEOUT:g}s"}, status_code=504
         )
     except (ValueError, httpx.InvalidURL) as e:
+        stream_stats.failed(upstream)
+        release_slot()
         # Handle header validation errors (like "Illegal header value")
         error_msg = str(e)
         if "header" in error_msg.lower():
             return JSONResponse({"error": f"Invalid request headers: {error_msg}"}, status_code=400)
         return JSONResponse({"error": str(e)}, status_code=400)
     except Exception as e:
+        stream_stats.failed(upstream)
+        release_slot()
+        metrics.requests.inc((("model", upstream), ("code", "502")))
         return JSONResponse({"error": str(e)}, status_code=502)
 
+if coordinator is not None:
+    app.add_middleware(CoordinatorForwarding, prefixes=COORDINATOR_PATHS, coordinator=coordinator,
+                       timeouts=COORDINATOR_TIMEOUTS)
+# Outermost handler for proxied paths; runs inside FastAPI's error handling
+app.add_middleware(ProxyMiddleware, proxy=proxy, routes=app.routes)
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=ROUTER_PORT)
+    if WORKERS > 1:
+        serve(app, ROUTER_PORT)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=ROUTER_PORT)
@@ -8,37 +8,42 @@ OUTPUT_FILE = PROJECT_ROOT / "router_config.yaml"
 
 # Model Definitions (Must match generate_plists.py)
 try:
-    from model_defs import MODELS
+    from model_defs import MODELS, replicas
 except ImportError:
     # If running from script dir directly
     try:
-        from scripts.model_defs import MODELS
+        from scripts.model_defs import MODELS, replicas
     except ImportError:
         # Fallback for when running from root without package structure
         import sys
         sys.path.append(str(Path(__file__).parent))
-        from model_defs import MODELS
+        from model_defs import MODELS, replicas
 
 def generate_config():
     model_list = []
     
     for name, config in MODELS.items():
-        # define the model routing
-        model_entry = {
-            "model_name": name,
-            "litellm_params": {
-                "model": f"openai/{name}", # 'openai/' prefix tells litellm to use openai client
-                "api_base": f"http://0.0.0.0:{config['port']}/v1",
-                "api_key": "EMPTY"
+        # define the model routing; LiteLLM load-balances entries sharing a model_name
+        for replica in replicas(config):
+            model_entry = {
+                "model_name": name,
+                "litellm_params": {
+                    "model": f"openai/{name}", # 'openai/' prefix tells litellm to use openai client
+                    "api_base": f"http://{replica['address']}/v1",
+                    "api_key": "EMPTY",
+                    "weight": replica["weight"]
+                }
             }
-        }
-        model_list.append(model_entry)
+            model_list.append(model_entry)
         
     config_data = {
         "model_list": model_list,
         "router_settings": {
             "num_retries": 3,
-            "timeout": 600
+            "timeout": 600,
+            # Take a failing deployment out of rotation instead of retrying into it
+            "allowed_fails": 3,
+            "cooldown_time": 10
         }
     }
     
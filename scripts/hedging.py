@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Hedged requests for slow backends.
+#
+# A streaming request that has produced no first token by the model's recent
+# time-to-first-token percentile is sent a second time, to a spare replica or a
+# fallback model, and whichever answers first is used; the other is cancelled.
+# Only the tail is hedged, so the extra load stays around (100 - percentile)%.
+import asyncio
+import collections
+import os
+
+DEFAULT_HEDGE_SETTINGS = {
+    "percentile": float(os.environ.get("ROUTER_HEDGE_PERCENTILE", "95")),
+    # TTFT samples kept per model, and needed before hedging starts
+    "window": 256,
+    "min_samples": 20,
+    # Never hedge sooner than this (seconds), however fast the model usually is
+    "min_delay": float(os.environ.get("ROUTER_HEDGE_MIN_DELAY", "0.05")),
+}
+
+
+class Hedger:
+    """Tracks recent TTFT per model and counts hedges."""
+
+    def __init__(self, settings=None):
+        self.settings = dict(settings or DEFAULT_HEDGE_SETTINGS)
+        self.samples = {}
+        self.hedged = {}
+        self.hedge_wins = {}
+
+    def observe(self, model, ttft):
+        samples = self.samples.get(model)
+        if samples is None:
+            samples = self.samples[model] = collections.deque(maxlen=self.settings["window"])
+        samples.append(ttft)
+
+    def delay(self, model):
+        """Seconds to wait for a first token before hedging, or None if too few samples yet."""
+        samples = self.samples.get(model)
+        if not samples or len(samples) < self.settings["min_samples"]:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.settings["percentile"] / 100))
+        return max(self.settings["min_delay"], ordered[index])
+
+    async def race(self, model, primary, hedge, delay, discard):
+        """Awaits `primary`; if it isn't done after `delay` seconds, starts `hedge()` too.
+
+        Returns (result, hedge_won) for whichever finishes first without an error
+        (raising if both fail). The loser is cancelled, or handed to `discard(result)`
+        if it finished anyway.
+        """
+        first = asyncio.ensure_future(primary)
+        try:
+            await asyncio.wait_for(asyncio.shield(first), delay)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            if not first.done():
+                first.cancel()
+            raise
+        if first.done():
+            return first.result(), False
+
+        self.hedged[model] = self.hedged.get(model, 0) + 1
+        second = asyncio.ensure_future(hedge())
+        tasks = (first, second)
+        pending = set(tasks)
+        winner = None
+        error = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:
+                    if task in done and winner is None:
+                        if task.exception() is None:
+                            winner = task
+                        else:
+                            error = task.exception()
+            if winner is None:
+                raise error
+        finally:
+            for task in tasks:
+                if task is not winner:
+                    _drop(task, discard)
+        if winner is second:
+            self.hedge_wins[model] = self.hedge_wins.get(model, 0) + 1
+        return winner.result(), winner is second
+
+    def stats(self):
+        return {
+            model: {
+                "samples": len(samples),
+                "delay": self.delay(model),
+                "hedged": self.hedged.get(model, 0),
+                "hedge_wins": self.hedge_wins.get(model, 0),
+            }
+            for model, samples in self.samples.items()
+        }
+
+
+def _drop(task, discard):
+    def done(task):
+        if not task.cancelled() and task.exception() is None:
+            asyncio.ensure_future(discard(task.result()))
+
+    task.cancel()
+    task.add_done_callback(done)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# The LiteLLM proxy subprocess: started by the router, or once by router_workers.py
+# for all of its workers.
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+LITELLM_PORT = 8080
+
+# Routing mode:
+#   "direct"  - read the "model" field and forward straight to the vLLM backend
+#   "litellm" - proxy everything through the LiteLLM subprocess (legacy behaviour)
+# In direct mode LiteLLM is only started when ROUTER_LITELLM_FALLBACK=1, and then
+# only receives requests that name a model we don't know about.
+ROUTING_MODE = os.environ.get("ROUTER_MODE", "direct")
+LITELLM_FALLBACK = os.environ.get("ROUTER_LITELLM_FALLBACK", "0") == "1"
+
+
+def enabled():
+    return ROUTING_MODE == "litellm" or LITELLM_FALLBACK
+
+
+def start_litellm():
+    """Starts LiteLLM on LITELLM_PORT; returns the process."""
+    print(f"Starting LiteLLM on port {LITELLM_PORT}...")
+    
+    # Ensure config exists
+    config_path = PROJECT_ROOT / "router_config.yaml"
+    if not config_path.exists():
+        # Fallback generation? Or assume it exists.
+        # Ideally we run generate_router_config.py first.
+        subprocess.check_call([sys.executable, str(PROJECT_ROOT / "scripts/generate_router_config.py")])
+
+    # Start LiteLLM
+    cmd = [
+        "litellm",
+        "--config", str(config_path),
+        "--port", str(LITELLM_PORT)
+    ]
+    
+    # Use same environment
+    env = os.environ.copy()
+    
+    return subprocess.Popen(cmd, env=env)
+
+
+def stop_litellm(process):
+    print("Shutting down LiteLLM...")
+    if process:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# Replica selection for models served by more than one vLLM instance.
+#
+# "least_outstanding" sends each request to the replica with the fewest in-flight
+# requests relative to its weight. "prefix_affinity" hashes the shared prompt
+# prefix (system prompt or start of the prompt) onto a consistent-hash ring so
+# conversations that share it land on the same replica and reuse its prefix
+# cache, falling back to least-outstanding when that replica is overloaded.
+import bisect
+import hashlib
+import random
+
+LEAST_OUTSTANDING = "least_outstanding"
+PREFIX_AFFINITY = "prefix_affinity"
+
+# Characters of the prompt that identify a shared prefix
+AFFINITY_PREFIX_CHARS = 512
+# Virtual nodes per unit of weight on the hash ring
+RING_POINTS = 64
+# An affine replica is skipped once it carries this many times the average load (+1)
+AFFINITY_LOAD_FACTOR = 2.0
+
+
+def _hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+
+def affinity_key(payload):
+    """Returns the prompt prefix that identifies a request's shareable KV cache, or None."""
+    messages = payload.get("messages")
+    if isinstance(messages, list) and messages:
+        first = messages[0]
+        if isinstance(first, dict):
+            content = first.get("content")
+            if isinstance(content, str):
+                return content[:AFFINITY_PREFIX_CHARS]
+            return None
+    prompt = payload.get("prompt")
+    if isinstance(prompt, str):
+        return prompt[:AFFINITY_PREFIX_CHARS]
+    return None
+
+
+class ReplicaSet:
+    def __init__(self, model, replicas, mode=LEAST_OUTSTANDING):
+        self.model = model
+        self.mode = mode
+        self.weights = {r["address"]: r["weight"] for r in replicas}
+        self.in_flight = {address: 0 for address in self.weights}
+        self.requests = {address: 0 for address in self.weights}
+        self.affinity_hits = 0
+        self.affinity_spills = 0
+        self._ring = sorted(
+            (_hash(f"{address}#{i}"), address)
+            for address, weight in self.weights.items()
+            for i in range(max(1, int(RING_POINTS * weight)))
+        )
+        self._ring_keys = [point for point, _ in self._ring]
+
+    def _load(self, address):
+        return self.in_flight[address] / self.weights[address] if self.weights[address] > 0 else float("inf")
+
+    def _least_outstanding(self, candidates):
+        best = min(self._load(address) for address in candidates)
+        return random.choice([address for address in candidates if self._load(address) == best])
+
+    def _affine(self, key, candidates):
+        start = bisect.bisect(self._ring_keys, _hash(key))
+        for i in range(len(self._ring)):
+            address = self._ring[(start + i) % len(self._ring)][1]
+            if address in candidates:
+                return address
+        return None
+
+    def pick(self, payload=None, available=None):
+        """Chooses a replica among `available` (all of them if None), or None."""
+        candidates = [a for a in self.weights if available is None or a in available]
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.mode == PREFIX_AFFINITY and payload is not None:
+            key = affinity_key(payload)
+            if key is not None:
+                address = self._affine(key, candidates)
+                average = sum(self._load(a) for a in candidates) / len(candidates)
+                if self._load(address) <= AFFINITY_LOAD_FACTOR * average + 1:
+                    self.affinity_hits += 1
+                    return address
+                self.affinity_spills += 1
+        return self._least_outstanding(candidates)
+
+    def acquire(self, address):
+        self.in_flight[address] += 1
+        self.requests[address] += 1
+
+    def release(self, address):
+        self.in_flight[address] -= 1
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "replicas": {
+                address: {
+                    "weight": self.weights[address],
+                    "in_flight": self.in_flight[address],
+                    "requests": self.requests[address],
+                }
+                for address in self.weights
+            },
+            "affinity_hits": self.affinity_hits,
+            "affinity_spills": self.affinity_spills,
+        }
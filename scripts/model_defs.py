@@ -1,109 +1,150 @@
 # Model Definitions
-# Shared between generate_plists.py and generate_router_config.py
-
-MODELS = {
-    "yi-1.5": {
-        "repo_id": "mlx-community/Yi-1.5-34B-Chat-4bit",
-        "port": 8002,
-        "est_ram": "19 GB",
-        "params": "34B"
-    },
-    "mixtral": {
-        "repo_id": "mlx-community/Mixtral-8x7B-Instruct-v0.1-4bit",
-        "port": 8004,
-        "est_ram": "26 GB",
-        "params": "8x7B"
-    },
-    "codestral": {
-        "repo_id": "mlx-community/Codestral-22B-v0.1-4bit",
-        "port": 8005,
-        "est_ram": "14 GB",
-        "params": "22B"
-    },
-    "yi-coder-9b": {
-        "repo_id": "k2rks/Yi-Coder-9B-Chat-mlx-4bit",
-        "port": 8006,
-        "est_ram": "6 GB",
-        "params": "9B"
-    },
-    "starcoder2": {
-        "repo_id": "mlx-community/starcoder2-15b-4bit",
-        "port": 8007,
-        "est_ram": "10 GB",
-        "params": "15B"
-    },
-    "phi-4": {
-        "repo_id": "mlx-community/phi-4-4bit",
-        "port": 8008,
-        "est_ram": "9 GB",
-        "params": "14B"
-    },
-    "qwen-2.5": {
-        "repo_id": "mlx-community/Qwen2.5-32B-Instruct-4bit",
-        "port": 8009,
-        "est_ram": "18 GB",
-        "params": "32B"
-    },
-    "smollm2-135m": {
-        "repo_id": "mlx-community/SmolLM2-135M-Instruct",
-        "port": 8010,
-        "est_ram": "200 MB",
-        "params": "135M"
-    },
-    "qwen-0.5": {
-        "repo_id": "mlx-community/Qwen2.5-0.5B-Instruct-4bit",
-        "port": 8011,
-        "est_ram": "400 MB",
-        "params": "0.5B"
-    },
-    "qwen-1.5": {
-        "repo_id": "mlx-community/Qwen2.5-1.5B-Instruct-4bit",
-        "port": 8012,
-        "est_ram": "1 GB",
-        "params": "1.5B"
-    },
-    "llama-3.2-1b": {
-        "repo_id": "mlx-community/Llama-3.2-1B-Instruct-4bit",
-        "port": 8013,
-        "est_ram": "800 MB",
-        "params": "1B"
-    },
-    "llama-3.2-3b": {
-        "repo_id": "mlx-community/Llama-3.2-3B-Instruct-4bit",
-        "port": 8014,
-        "est_ram": "2 GB",
-        "params": "3B"
-    },
-    # Vision Models (VLMs) - Experimental vLLM support
-    "llava-1.5-7b": {
-        "repo_id": "mlx-community/llava-1.5-7b-4bit",
-        "port": 8015,
-        "est_ram": "4 GB",
-        "params": "7B"
-    },
-    "llava-qwen-0.5b": {
-        "repo_id": "mlx-community/llava-interleave-qwen-0.5b-4bit",
-        "port": 8016,
-        "est_ram": "300 MB",
-        "params": "0.5B"
-    },
-    # Math & Reasoning Models
-    "qwq-32b": {
-        "repo_id": "mlx-community/QwQ-32B-Preview-4bit",
-        "port": 8017,
-        "est_ram": "17 GB",
-        "params": "32B"
-    },
-    "qwen-math-1.5b": {
-        "repo_id": "mlx-community/Qwen2.5-Math-1.5B-Instruct-4bit",
-        "port": 8018,
-        "est_ram": "1 GB",
-        "params": "1.5B"
-    },
-    "deepseek-r1-1.5b": {
-        "repo_id": "mlx-community/DeepSeek-R1-Distill-Qwen-1.5B-4bit",
-        "port": 8019,
-        "est_ram": "1 GB",
-        "params": "1.5B"
-    }
+# Shared by the supervisor, the router and the other scripts
+#
+# The registry is models.json at the project root (VLLM_MODELS_FILE to use another
+# file): model name -> settings. Each model is served by the local vLLM instance
+# on "port". A model can be scaled out with a "replicas" list of "host:port"
+# strings (or {"address": "host:port", "weight": 2} dicts), in which case the
+# router balances across them. The router re-reads the file when it changes.
+#
+# "context" (tokens), "category" and "cost" (relative cost per token, roughly the
+# active parameters in billions) let the router pick a model for the virtual
+# AUTO_MODELS: the cheapest running model of one of the alias's categories whose
+# context window fits the request.
+import json
+import os
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+MODELS_FILE = Path(os.environ.get("VLLM_MODELS_FILE", str(PROJECT_ROOT / "models.json")))
+
+CATEGORIES = ("tiny", "small", "chat", "code", "logic", "reasoning", "math", "vision")
+# Virtual model names -> categories they may be served by
+AUTO_MODELS = {
+    "auto": ("tiny", "small", "chat", "logic", "reasoning"),
+    "auto-code": ("code",),
+    "auto-math": ("math", "reasoning", "logic"),
 }
+
+
+class RegistryError(ValueError):
+    """A registry that can't be used; `problems` lists every reason."""
+
+    def __init__(self, problems):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+def replicas(config):
+    """Returns a model's replicas as [{"address": "host:port", "weight": w}, ...]."""
+    entries = config.get("replicas") or [f"localhost:{config['port']}"]
+    result = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"address": entry}
+        result.append({"address": entry["address"], "weight": float(entry.get("weight", 1))})
+    return result
+
+_SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+
+def parse_size(value):
+    """Parses a size like "19 GB" or "400MB" into bytes. Raises ValueError if malformed."""
+    text = str(value).strip().upper()
+    number = text.rstrip("KMGTB ")
+    unit = text[len(number):].strip() or "B"
+    try:
+        return int(float(number) * _SIZE_UNITS[unit])
+    except (KeyError, ValueError):
+        raise ValueError(f"Unparseable size {value!r}") from None
+
+
+def validate(models):
+    """Returns the problems with a registry (empty if it can be used)."""
+    if not isinstance(models, dict) or not models:
+        return ["the registry must be a non-empty object of models"]
+    problems = []
+    ports = {}
+    owners = {}
+    for name, config in models.items():
+        if not isinstance(config, dict):
+            problems.append(f"{name}: settings must be an object")
+            continue
+        if name in AUTO_MODELS:
+            problems.append(f"{name}: reserved for automatic model selection")
+        if not isinstance(config.get("repo_id"), str) or not config["repo_id"]:
+            problems.append(f"{name}: missing repo_id")
+        port = config.get("port")
+        if not isinstance(port, int) or isinstance(port, bool) or not 0 < port < 65536:
+            problems.append(f"{name}: invalid port {port!r}")
+        elif port in ports:
+            problems.append(f"{name}: port {port} is already used by {ports[port]}")
+        else:
+            ports[port] = name
+        for field in ("est_ram", "memory_budget"):
+            if field in config:
+                try:
+                    parse_size(config[field])
+                except ValueError as e:
+                    problems.append(f"{name}: {field}: {e}")
+        try:
+            members = replicas(config)
+        except (KeyError, TypeError, ValueError) as e:
+            problems.append(f"{name}: invalid replicas ({e!r})")
+            members = []
+        for replica in members:
+            address = replica["address"]
+            if not isinstance(address, str) or not address.rpartition(":")[2].isdigit():
+                problems.append(f"{name}: replica address {address!r} is not host:port")
+            elif address in owners and owners[address] != name and (
+                # Already reported as a port clash
+                "replicas" in config or owners[address] != ports.get(port)
+            ):
+                problems.append(f"{name}: replica {address} is already used by {owners[address]}")
+            owners.setdefault(address, name)
+            if replica["weight"] < 0:
+                problems.append(f"{name}: replica {address} has a negative weight")
+        context = config.get("context")
+        if context is not None and (not isinstance(context, int) or isinstance(context, bool) or context <= 0):
+            problems.append(f"{name}: invalid context {context!r}")
+        if "category" in config and config["category"] not in CATEGORIES:
+            problems.append(f"{name}: unknown category {config['category']!r}")
+        cost = config.get("cost")
+        if cost is not None and (not isinstance(cost, (int, float)) or isinstance(cost, bool) or cost < 0):
+            problems.append(f"{name}: invalid cost {cost!r}")
+        fallback = config.get("fallback")
+        if fallback is not None and (fallback not in models or fallback == name):
+            problems.append(f"{name}: unknown fallback model {fallback!r}")
+    return problems
+
+
+def load_models(path=None):
+    """Reads and validates a registry file. Raises RegistryError."""
+    path = Path(path or MODELS_FILE)
+    try:
+        with open(path) as f:
+            models = json.load(f)
+    except OSError as e:
+        raise RegistryError([f"cannot read {path}: {e.strerror}"]) from None
+    except ValueError as e:
+        raise RegistryError([f"{path} is not valid JSON: {e}"]) from None
+    problems = validate(models)
+    if problems:
+        raise RegistryError(problems)
+    return models
+
+
+def diff_models(old, new):
+    """Models added, removed, and changed (with the changed fields) between two registries."""
+    changed = {}
+    for name in old.keys() & new.keys():
+        fields = sorted(k for k in old[name].keys() | new[name].keys() if old[name].get(k) != new[name].get(k))
+        if fields:
+            changed[name] = fields
+    return {
+        "added": sorted(new.keys() - old.keys()),
+        "removed": sorted(old.keys() - new.keys()),
+        "changed": dict(sorted(changed.items())),
+    }
+
+
+MODELS = load_models()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# The router's routing table, rebuilt and swapped whenever the registry changes.
+#
+# A RoutingTable is built from a validated MODELS dict and not modified after
+# that. Reloading builds a new table and replaces the router's reference to it in
+# a single assignment. Each request looks the table up once, when it arrives, and
+# uses that table to the end, so in-flight requests finish on the table they
+# started with while new requests see the new one. Replica sets of models whose
+# replicas didn't change are carried over, so in-flight counts survive a swap.
+import asyncio
+import time
+
+from load_balancer import LEAST_OUTSTANDING, ReplicaSet
+from model_defs import MODELS_FILE, RegistryError, load_models, replicas
+
+
+class RoutingTable:
+    """Models, their replica sets and the owner of every backend address."""
+
+    def __init__(self, models, balance=LEAST_OUTSTANDING, previous=None):
+        self.models = models
+        self.version = previous.version + 1 if previous is not None else 1
+        self.loaded_at = time.time()
+        self.replica_sets = {}
+        for name, config in models.items():
+            members = replicas(config)
+            mode = config.get("balance", balance)
+            old = previous.replica_sets.get(name) if previous is not None else None
+            if old is not None and old.mode == mode and old.weights == {r["address"]: r["weight"] for r in members}:
+                self.replica_sets[name] = old
+            else:
+                self.replica_sets[name] = ReplicaSet(name, members, mode)
+        self.backend_owner = {
+            address: name for name, replica_set in self.replica_sets.items() for address in replica_set.weights
+        }
+
+    def config(self, address):
+        """Settings of the model a backend address belongs to."""
+        return self.models[self.backend_owner[address]]
+
+
+class RegistryWatcher:
+    """Polls the registry file and hands every valid new version to `apply(models)`.
+
+    A version that fails to load or validate is reported and otherwise ignored,
+    so the router keeps serving from the last good table.
+    """
+
+    def __init__(self, apply, path=None, interval=2.0):
+        self.apply = apply
+        self.path = path or MODELS_FILE
+        self.interval = interval
+        self.signature = self._signature()
+        self.error = None
+        self.checked_at = None
+        self._task = None
+
+    def _signature(self):
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self):
+        """Reads the registry file, recording (and re-raising) RegistryError."""
+        self.signature = self._signature()
+        self.checked_at = time.time()
+        try:
+            models = load_models(self.path)
+        except RegistryError as e:
+            self.error = e.problems
+            raise
+        self.error = None
+        return models
+
+    def check(self):
+        """Reloads if the file changed since it was last read; returns apply()'s result or None."""
+        if self._signature() == self.signature:
+            return None
+        try:
+            models = self.load()
+        except RegistryError as e:
+            print(f"Registry {self.path} not reloaded: {e}")
+            return None
+        return self.apply(models)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.check()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {"path": str(self.path), "checked_at": self.checked_at, "error": self.error}
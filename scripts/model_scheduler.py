@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# On-demand model activation against a memory budget.
+#
+# The first request for a stopped model starts it, evicting the least recently
+# used idle models until it fits in the budget, and holds the request until the
+# backend is serving. A model takes the memory budget it is sized for (see
+# model_sizing.py) once its config.json is there, else its est_ram.
+import asyncio
+import time
+from model_defs import parse_size
+
+
+class InsufficientMemory(Exception):
+    pass
+
+
+class SchedulerUnavailable(Exception):
+    """The router worker that runs the scheduler could not be reached."""
+
+
+class ModelScheduler:
+    """Starts and evicts models so the resident set stays within `budget` bytes.
+
+    `start(name)` / `stop(name)` are coroutines that launch or stop a backend,
+    `is_running(name)` reports whether its backend is running (not merely missing a poll),
+    `wait_ready(name, timeout)` returns once the backend is serving, and
+    `in_flight(name)` is the number of requests currently using a model, and
+    `sizing(name)` its size_model() result (None when it can't be sized).
+    """
+
+    def __init__(self, models, budget, start, stop, is_running, wait_ready, in_flight,
+                 pinned=(), ready_timeout=300.0, sizing=None):
+        self.models = models
+        self.budget = budget
+        self.start = start
+        self.stop = stop
+        self.is_running = is_running
+        self.wait_ready = wait_ready
+        self.in_flight = in_flight
+        self.pinned = set(pinned)
+        self.ready_timeout = ready_timeout
+        self.sizing = sizing
+        self.last_used = {}
+        self.starting = {}
+        self.stopping = set()
+        self.evictions = 0
+        self.activations = 0
+        self._lock = asyncio.Lock()
+
+    def ram(self, name):
+        sizing = self.sizing(name) if self.sizing is not None else None
+        if sizing is not None and sizing["fits"] and sizing["budget_bytes"]:
+            return sizing["budget_bytes"]
+        return parse_size(self.models[name].get("est_ram", "0 B"))
+
+    def touch(self, name):
+        self.last_used[name] = time.monotonic()
+
+    def resident(self):
+        running = {name for name in self.models if self.is_running(name)}
+        # A stopped model only frees its memory once the health poller sees it gone
+        self.stopping &= running
+        return (running | set(self.starting)) - self.stopping
+
+    def used(self):
+        return sum(self.ram(name) for name in self.resident())
+
+    def _pick_victims(self, needed):
+        free = self.budget - self.used()
+        victims = []
+        candidates = sorted(
+            (name for name in self.resident()
+             if name not in self.starting and name not in self.pinned and self.in_flight(name) == 0),
+            key=lambda name: self.last_used.get(name, 0.0),
+        )
+        for name in candidates:
+            if free >= needed:
+                break
+            victims.append(name)
+            free += self.ram(name)
+        if free < needed:
+            raise InsufficientMemory(
+                f"Need {needed} bytes but only {free} can be freed within the {self.budget} byte budget"
+            )
+        return victims
+
+    async def ensure_running(self, name):
+        """Returns once `name` is serving, starting it (and evicting others) if needed."""
+        self.touch(name)
+        if self.is_running(name) and name not in self.stopping:
+            # Returns immediately unless it is still warming up
+            await self.wait_ready(name, self.ready_timeout)
+            return
+        starting = self.starting.get(name)
+        if starting is None:
+            async with self._lock:
+                starting = self.starting.get(name)
+                if starting is None:
+                    for victim in self._pick_victims(self.ram(name)):
+                        print(f"Evicting {victim} to make room for {name}")
+                        self.stopping.add(victim)
+                        self.evictions += 1
+                        await self.stop(victim)
+                    print(f"Activating {name}")
+                    self.stopping.discard(name)
+                    self.activations += 1
+                    await self.start(name)
+                    starting = self.starting[name] = asyncio.ensure_future(
+                        self._wait_started(name)
+                    )
+        # Several requests may wait on the same start
+        await asyncio.shield(starting)
+
+    async def _wait_started(self, name):
+        try:
+            await self.wait_ready(name, self.ready_timeout)
+        finally:
+            self.starting.pop(name, None)
+
+    def stats(self):
+        resident = self.resident()
+        return {
+            "budget_bytes": self.budget,
+            "used_bytes": sum(self.ram(name) for name in resident),
+            "resident": sorted(resident),
+            "starting": sorted(self.starting),
+            "activations": self.activations,
+            "evictions": self.evictions,
+        }
+
+
+class RemoteScheduler:
+    """ModelScheduler stand-in for router workers other than the one running it.
+
+    A model that isn't running is started by `ensure_remote(name)`, a coroutine
+    asking the scheduling worker (raising InsufficientMemory, SchedulerUnavailable
+    or asyncio.TimeoutError), then waited for locally with `wait_ready`.
+    `last_used` is published so the scheduler can tell which models are idle.
+    """
+
+    def __init__(self, models, is_running, wait_ready, ensure_remote, ready_timeout=300.0):
+        self.models = models
+        self.is_running = is_running
+        self.wait_ready = wait_ready
+        self.ensure_remote = ensure_remote
+        self.ready_timeout = ready_timeout
+        self.last_used = {}
+
+    def touch(self, name):
+        self.last_used[name] = time.monotonic()
+
+    async def ensure_running(self, name):
+        self.touch(name)
+        if not self.is_running(name):
+            await self.ensure_remote(name)
+        await self.wait_ready(name, self.ready_timeout)
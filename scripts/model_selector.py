@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# Picks a concrete model for the virtual "auto" models (AUTO_MODELS in model_defs).
+#
+# Candidates are the models in one of the alias's categories (vision models only
+# when the request contains images) whose context window holds the prompt plus
+# max_tokens. Running models are preferred over warming ones, and those over
+# models that would have to be started; within a tier the cheapest wins, a
+# model's cost growing with the requests queued for it so a busy small model
+# hands over to an idle bigger one.
+from api_keys import DEFAULT_MAX_TOKENS
+from backend_health import UP, WARMING
+from model_defs import AUTO_MODELS
+
+# Approximate characters per token and per-message overhead of chat templates
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD = 4
+
+
+class NoModelAvailable(Exception):
+    """No model of the alias fits the request (status 400) or is running (503)."""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _text(content):
+    """Text and image count of a message's content (a string or a list of parts)."""
+    if isinstance(content, str):
+        return content, 0
+    text, images = [], 0
+    if isinstance(content, list):
+        for part in content:
+            if not isinstance(part, dict):
+                continue
+            if part.get("type") in ("image_url", "input_image", "image"):
+                images += 1
+            elif isinstance(part.get("text"), str):
+                text.append(part["text"])
+    return "".join(text), images
+
+
+def prompt_tokens(payload):
+    """Local estimate of a request's prompt tokens: characters / 4, plus a little
+    per chat message. Returns (tokens, images)."""
+    chars, images, messages = 0, 0, 0
+    for message in payload.get("messages") or []:
+        if isinstance(message, dict):
+            text, count = _text(message.get("content"))
+            chars += len(text)
+            images += count
+            messages += 1
+    prompt = payload.get("prompt")
+    if isinstance(prompt, str):
+        chars += len(prompt)
+    elif isinstance(prompt, list):
+        chars += sum(len(p) for p in prompt if isinstance(p, str))
+    return -(-chars // CHARS_PER_TOKEN) + MESSAGE_OVERHEAD * messages, images
+
+
+def completion_budget(payload):
+    max_tokens = payload.get("max_tokens") or payload.get("max_completion_tokens") or DEFAULT_MAX_TOKENS
+    try:
+        return max(0, int(max_tokens))
+    except (TypeError, ValueError):
+        return DEFAULT_MAX_TOKENS
+
+
+def select_model(alias, payload, models, state, load=None, allow_start=False):
+    """Name of the model to serve `payload` for `alias`.
+
+    `state(name)` is a model's health state and `load(name)` the number of queued
+    requests per concurrency slot. Models that aren't UP or WARMING are only
+    chosen with `allow_start`. Raises NoModelAvailable.
+    """
+    prompt, images = prompt_tokens(payload)
+    needed = prompt + completion_budget(payload)
+    categories = ("vision",) if images else AUTO_MODELS[alias]
+    fitting = [
+        name for name, config in models.items()
+        if config.get("category") in categories and config.get("context", needed) >= needed
+    ]
+    if not fitting:
+        raise NoModelAvailable(f"No '{alias}' model has a context window of {needed} tokens", 400)
+
+    tiers = {UP: 0, WARMING: 1}
+    best = None
+    for name in fitting:
+        tier = tiers.get(state(name), 2)
+        if tier == 2 and not allow_start:
+            continue
+        cost = models[name].get("cost", 1.0) * (1 + (load(name) if load else 0.0))
+        if best is None or (tier, cost) < best[0]:
+            best = ((tier, cost), name)
+    if best is None:
+        raise NoModelAvailable(f"No '{alias}' model that fits the request is running", 503)
+    return best[1]
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# Memory sizing and vLLM launch flags from a model's own config.json.
+#
+# Weights are the size of the downloaded weight files (or, before a download,
+# the parameter count from config.json times the quantization bits). Every token
+# of context costs 2 (K and V) x layers x KV heads x head dim x 2 bytes of KV
+# cache. Out of the memory budget a model may use (a "memory_budget" entry in
+# MODELS, else VLLM_MEMORY_BUDGET - default 75% of physical memory - less the
+# other models' own budgets; see memory_budget()) what is left after the weights
+# and the runtime overhead is KV cache. That gives:
+#   --gpu-memory-utilization  the budget as a fraction of physical memory
+#   --max-model-len           the model's context window, cut down to what the
+#                             KV cache can hold for one sequence
+#   --max-num-seqs            sequences of TYPICAL_SEQUENCE_TOKENS that fit at once
+# Flags already given in a model's "vllm_args" are left alone.
+#
+# Usage: model_sizing.py [name ...]   table of the computed sizes and flags
+import json
+import os
+import sys
+from pathlib import Path
+
+try:
+    from model_defs import MODELS, parse_size
+except ImportError:
+    sys.path.append(str(Path(__file__).parent))
+    from model_defs import MODELS, parse_size
+from prefetch import model_dir, read_manifest
+
+RUNTIME_OVERHEAD = parse_size(os.environ.get("VLLM_RUNTIME_OVERHEAD", "1 GB"))
+TYPICAL_SEQUENCE_TOKENS = int(os.environ.get("VLLM_TYPICAL_SEQUENCE_TOKENS", "2048"))
+# vLLM's own default and ceiling for --max-num-seqs
+MAX_NUM_SEQS = 256
+# Context lengths are rounded down to a multiple of this (vLLM's KV block size is 16)
+CONTEXT_STEP = 256
+# Most of the memory vLLM may be given; the rest is left to the OS
+MAX_UTILIZATION = 0.95
+KV_DTYPE_BYTES = 2
+WEIGHT_SUFFIXES = (".safetensors", ".bin", ".gguf", ".npz")
+DTYPE_BITS = {"float32": 32, "float16": 16, "bfloat16": 16}
+
+
+def physical_memory():
+    """Bytes of physical memory, or None where it can't be read."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def host_budget():
+    """Bytes all models together may use: VLLM_MEMORY_BUDGET, or 75% of physical memory."""
+    value = os.environ.get("VLLM_MEMORY_BUDGET")
+    if value:
+        return parse_size(value)
+    total = physical_memory()
+    return int(total * 0.75) if total else None
+
+
+def memory_budget(name, config=None, models=None):
+    """Bytes a model may use: its "memory_budget", else what the other models' own
+    budgets leave of the host budget.
+
+    Models without a budget of their own are each sized against all of that, as
+    only some of them are resident at once (the on-demand scheduler stops idle
+    ones to make room); give models that must run side by side a budget each.
+    """
+    models = dict(models if models is not None else MODELS)
+    if config is not None:
+        models[name] = config
+    if models[name].get("memory_budget"):
+        return parse_size(models[name]["memory_budget"])
+    host = host_budget()
+    if host is None:
+        return None
+    reserved = sum(parse_size(c["memory_budget"]) for n, c in models.items() if n != name and c.get("memory_budget"))
+    return max(0, host - reserved)
+
+
+def read_model_config(config):
+    """The model's config.json (the text model's part for vision models), or None."""
+    path = model_dir(config) / "config.json"
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    text = data.get("text_config")
+    if isinstance(text, dict):
+        # Keep top-level quantization settings, which apply to the whole model
+        data = dict(text, **{k: v for k, v in data.items() if k.startswith("quantization")})
+    return data
+
+
+def quantization_bits(model_config):
+    for key in ("quantization", "quantization_config"):
+        bits = (model_config.get(key) or {}).get("bits")
+        if isinstance(bits, int):
+            return bits
+    return DTYPE_BITS.get(model_config.get("torch_dtype"), 16)
+
+
+def architecture(model_config):
+    """Layers, KV heads, head dim and context window from a config.json."""
+    layers = model_config.get("num_hidden_layers") or model_config.get("n_layer")
+    heads = model_config.get("num_attention_heads") or model_config.get("n_head")
+    hidden = model_config.get("hidden_size") or model_config.get("n_embd")
+    if not (layers and heads and hidden):
+        return None
+    kv_heads = model_config.get("num_key_value_heads") or heads
+    head_dim = model_config.get("head_dim") or hidden // heads
+    return {
+        "layers": layers,
+        "kv_heads": kv_heads,
+        "head_dim": head_dim,
+        "hidden": hidden,
+        "heads": heads,
+        "context": model_config.get("max_position_embeddings") or model_config.get("n_positions"),
+    }
+
+
+def kv_bytes_per_token(arch):
+    return 2 * arch["layers"] * arch["kv_heads"] * arch["head_dim"] * KV_DTYPE_BYTES
+
+
+def estimate_parameters(model_config, arch):
+    """Rough parameter count of a decoder-only transformer (attention, MLP, embeddings)."""
+    hidden = arch["hidden"]
+    attention = hidden * arch["heads"] * arch["head_dim"] * 2 + hidden * arch["kv_heads"] * arch["head_dim"] * 2
+    mlp = 3 * hidden * (model_config.get("intermediate_size") or 4 * hidden)
+    mlp *= model_config.get("num_local_experts") or 1
+    embeddings = (model_config.get("vocab_size") or 0) * hidden
+    if not model_config.get("tie_word_embeddings", False):
+        embeddings *= 2
+    return arch["layers"] * (attention + mlp) + embeddings
+
+
+def weight_bytes(config, model_config, arch):
+    """Size of the downloaded weight files, else an estimate from the config."""
+    directory = model_dir(config)
+    manifest = read_manifest(directory)
+    if manifest:
+        files = {path: entry["size"] for path, entry in manifest["files"].items()}
+    else:
+        files = {path.name: path.stat().st_size for path in directory.glob("*") if path.is_file()}
+    size = sum(size for path, size in files.items() if path.endswith(WEIGHT_SUFFIXES))
+    if size:
+        return size
+    return estimate_parameters(model_config, arch) * quantization_bits(model_config) // 8
+
+
+def size_model(name, config=None, budget=None, total_memory=None, models=None):
+    """Memory sizes and the limits derived from them, or None without a config.json.
+    `models` is the registry the host budget is split across (default MODELS)."""
+    config = config if config is not None else (models or MODELS)[name]
+    model_config = read_model_config(config)
+    arch = architecture(model_config) if model_config else None
+    if arch is None:
+        return None
+    budget = budget if budget is not None else memory_budget(name, config, models)
+    total_memory = total_memory if total_memory is not None else physical_memory()
+    weights = weight_bytes(config, model_config, arch)
+    per_token = kv_bytes_per_token(arch)
+    kv_budget = (budget or 0) - weights - RUNTIME_OVERHEAD
+    kv_tokens = max(0, kv_budget // per_token)
+
+    context = arch["context"] or kv_tokens
+    max_model_len = context if kv_tokens >= context else kv_tokens // CONTEXT_STEP * CONTEXT_STEP
+    sizing = {
+        "weights_bytes": weights,
+        "kv_bytes_per_token": per_token,
+        "budget_bytes": budget,
+        "kv_cache_bytes": max(0, kv_budget),
+        "kv_cache_tokens": kv_tokens,
+        "context": arch["context"],
+        "max_model_len": max_model_len,
+        "max_num_seqs": min(MAX_NUM_SEQS, max(1, kv_tokens // max(1, min(max_model_len, TYPICAL_SEQUENCE_TOKENS)))),
+        # Sequences using the whole context window at once
+        "max_full_sequences": kv_tokens // max_model_len if max_model_len else 0,
+        "gpu_memory_utilization": None,
+        # Weights, overhead and one full-length sequence
+        "needed_bytes": weights + RUNTIME_OVERHEAD + per_token * max_model_len,
+        "fits": max_model_len > 0,
+    }
+    if budget and total_memory:
+        sizing["gpu_memory_utilization"] = min(MAX_UTILIZATION, int(100 * budget / total_memory) / 100)
+    return sizing
+
+
+def launch_flags(sizing, vllm_args=()):
+    """vLLM flags from a sizing, except those already in `vllm_args`."""
+    if sizing is None or not sizing["fits"]:
+        return []
+    flags = {
+        "--max-model-len": sizing["max_model_len"],
+        "--max-num-seqs": sizing["max_num_seqs"],
+        "--gpu-memory-utilization": sizing["gpu_memory_utilization"],
+    }
+    given = {arg.split("=", 1)[0] for arg in vllm_args}
+    args = []
+    for flag, value in flags.items():
+        if value is not None and flag not in given:
+            args += [flag, str(value)]
+    return args
+
+
+def format_bytes(size):
+    if size is None:
+        return "-"
+    if size >= 1024 ** 3:
+        return f"{size / 1024 ** 3:.1f} GB"
+    return f"{size / 1024 ** 2:.0f} MB"
+
+
+def main():
+    names = sys.argv[1:] or list(MODELS)
+    unknown = [name for name in names if name not in MODELS]
+    if unknown:
+        sys.exit(f"Unknown models: {', '.join(unknown)}")
+    print(f"{'MODEL':<17} {'WEIGHTS':<9} {'KV/TOKEN':<9} {'BUDGET':<9} {'CONTEXT':<8} {'MAX-LEN':<8} {'SEQS':<5} "
+          f"{'UTIL':<5} {'NEEDED':<9}")
+    for name in names:
+        sizing = size_model(name)
+        if sizing is None:
+            print(f"{name:<17} no config.json (not downloaded)")
+            continue
+        util = sizing["gpu_memory_utilization"]
+        print(
+            f"{name:<17} {format_bytes(sizing['weights_bytes']):<9} {sizing['kv_bytes_per_token'] // 1024:>5} KB  "
+            f"{format_bytes(sizing['budget_bytes']):<9} {sizing['context'] or '-':<8} "
+            f"{sizing['max_model_len'] if sizing['fits'] else 'too big':<8} {sizing['max_num_seqs']:<5} "
+            f"{util if util is not None else '-':<5} {format_bytes(sizing['needed_bytes']):<9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# Prefetches model weights ahead of starting the services.
+#
+# The files of the chosen models are fetched concurrently, at most --jobs
+# (PREFETCH_JOBS) at a time across all models, into models/<org>_<name>/. Each
+# file streams into a .part file, which a later run resumes with a Range request.
+# A manifest of every file's size and sha256 is kept next to the weights and
+# marked complete once the model is; starting a service only checks it (sizes,
+# no hashing) instead of calling the hub.
+#
+# Sources (--source, VLLM_MODEL_SOURCE; default HF_ENDPOINT or the public hub):
+#   http(s)://...  - the Hugging Face hub, or anything serving its URL layout
+#   a directory    - a local mirror holding <org>/<name>/ (or <org>_<name>/) per repo
+#
+# Usage: prefetch.py [name ...] [--all] [--jobs N] [--source URL|DIR] [--verify]
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+try:
+    from model_defs import MODELS
+except ImportError:
+    sys.path.append(str(Path(__file__).parent))
+    from model_defs import MODELS
+
+# Configuration
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+MODELS_DIR = PROJECT_ROOT / "models"
+MANIFEST_NAME = ".manifest.json"
+DEFAULT_SOURCE = os.environ.get("VLLM_MODEL_SOURCE") or os.environ.get("HF_ENDPOINT", "https://huggingface.co")
+PREFETCH_JOBS = int(os.environ.get("PREFETCH_JOBS", "4"))
+REVISION = "main"
+CHUNK_SIZE = 1024 * 1024
+
+
+class PrefetchError(Exception):
+    pass
+
+
+def model_dir(config):
+    return MODELS_DIR / config["repo_id"].replace("/", "_")
+
+
+def hidden(path):
+    # .gitattributes, hf's .cache/, our own manifest
+    return any(part.startswith(".") for part in Path(path).parts)
+
+
+def read_manifest(directory):
+    try:
+        with open(Path(directory) / MANIFEST_NAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(directory, manifest):
+    path = Path(directory) / MANIFEST_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    tmp.replace(path)
+
+
+def is_complete(config):
+    """True if the model's manifest is complete and every file in it has its recorded size."""
+    directory = model_dir(config)
+    manifest = read_manifest(directory)
+    if not manifest or not manifest.get("complete") or manifest.get("repo_id") != config["repo_id"]:
+        return False
+    for path, entry in manifest["files"].items():
+        try:
+            if (directory / path).stat().st_size != entry["size"]:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def file_sha256(path, digest=None):
+    digest = digest or hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest
+
+
+def verify(config):
+    """Paths whose contents don't match the manifest (hashes every file)."""
+    directory = model_dir(config)
+    manifest = read_manifest(directory) or {"files": {}}
+    bad = []
+    for path, entry in sorted(manifest["files"].items()):
+        target = directory / path
+        if not target.exists() or file_sha256(target).hexdigest() != entry["sha256"]:
+            bad.append(path)
+    return bad
+
+
+class HubSource:
+    """Files from the Hugging Face hub's HTTP API (or a stand-in with the same layout)."""
+
+    def __init__(self, endpoint, token=None, transport=None):
+        self.endpoint = endpoint.rstrip("/")
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        import httpx
+
+        self.client = httpx.AsyncClient(
+            headers=headers, follow_redirects=True, transport=transport,
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+
+    def __str__(self):
+        return self.endpoint
+
+    async def list_files(self, repo_id):
+        """[{"path", "size", "sha256"}] for the repo; sha256 is only known for LFS files."""
+        files = []
+        url = f"{self.endpoint}/api/models/{repo_id}/tree/{REVISION}?recursive=true"
+        while url:
+            resp = await self.client.get(url)
+            if resp.status_code == 404:
+                raise PrefetchError(f"{repo_id} not found at {self.endpoint}")
+            resp.raise_for_status()
+            for entry in resp.json():
+                if entry.get("type") == "file":
+                    lfs = entry.get("lfs") or {}
+                    files.append({"path": entry["path"], "size": entry["size"], "sha256": lfs.get("oid")})
+            # Large repos are paginated with a Link header
+            url = resp.links.get("next", {}).get("url")
+        return files
+
+    @contextlib.asynccontextmanager
+    async def open(self, repo_id, path, offset):
+        """Yields (start, chunks): where the bytes start (0 if the range was ignored) and the bytes."""
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        url = f"{self.endpoint}/{repo_id}/resolve/{REVISION}/{path}"
+        async with self.client.stream("GET", url, headers=headers) as resp:
+            resp.raise_for_status()
+            yield (offset if resp.status_code == 206 else 0), resp.aiter_bytes(CHUNK_SIZE)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class MirrorSource:
+    """Files from a local mirror directory."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def __str__(self):
+        return str(self.root)
+
+    def repo_dir(self, repo_id):
+        nested = self.root / repo_id
+        return nested if nested.is_dir() else self.root / repo_id.replace("/", "_")
+
+    async def list_files(self, repo_id):
+        base = self.repo_dir(repo_id)
+        if not base.is_dir():
+            raise PrefetchError(f"{repo_id} not found in {self.root}")
+        # A mirror that was itself prefetched knows its hashes
+        known = (read_manifest(base) or {}).get("files", {})
+        files = []
+        for path in sorted(base.rglob("*")):
+            relative = path.relative_to(base).as_posix()
+            if path.is_file() and not hidden(relative) and not relative.endswith(".part"):
+                files.append({
+                    "path": relative,
+                    "size": path.stat().st_size,
+                    "sha256": known.get(relative, {}).get("sha256"),
+                })
+        return files
+
+    @contextlib.asynccontextmanager
+    async def open(self, repo_id, path, offset):
+        f = open(self.repo_dir(repo_id) / path, "rb")
+        try:
+            f.seek(offset)
+            yield offset, self._chunks(f)
+        finally:
+            f.close()
+
+    async def _chunks(self, f):
+        while True:
+            chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    async def close(self):
+        pass
+
+
+def make_source(spec):
+    if spec.startswith(("http://", "https://")):
+        return HubSource(spec, token=os.environ.get("HF_TOKEN"))
+    return MirrorSource(spec)
+
+
+class Prefetcher:
+    """Fetches models from a source, at most `jobs` files at a time."""
+
+    def __init__(self, source, jobs=PREFETCH_JOBS):
+        self.source = source
+        self.jobs = asyncio.Semaphore(jobs)
+        self.fetched_bytes = 0
+
+    async def fetch_file(self, repo_id, entry, dest):
+        """Downloads one file via its .part file and returns its manifest entry."""
+        part = dest.with_name(dest.name + ".part")
+        async with self.jobs:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            offset = part.stat().st_size if part.exists() else 0
+            if offset > entry["size"]:
+                offset = 0
+            # Resuming: the hash has to cover what's already there
+            digest = await asyncio.to_thread(file_sha256, part) if offset else hashlib.sha256()
+            if offset and offset == entry["size"]:
+                # Complete .part left behind by an interrupted run
+                size = offset
+            else:
+                async with self.source.open(repo_id, entry["path"], offset) as (start, chunks):
+                    if start != offset:
+                        digest = hashlib.sha256()
+                    with open(part, "ab" if start else "wb") as f:
+                        async for chunk in chunks:
+                            f.write(chunk)
+                            digest.update(chunk)
+                            self.fetched_bytes += len(chunk)
+                        size = f.tell()
+            sha256 = digest.hexdigest()
+            if size != entry["size"] or (entry["sha256"] and sha256 != entry["sha256"]):
+                part.unlink(missing_ok=True)
+                raise PrefetchError(f"{repo_id}/{entry['path']}: got {size} bytes with sha256 {sha256}, "
+                                    f"expected {entry['size']} bytes" + (f" with sha256 {entry['sha256']}" if entry["sha256"] else ""))
+            part.replace(dest)
+        return {"size": size, "sha256": sha256}
+
+    async def existing(self, dest, entry, previous):
+        """Manifest entry for an already-present file that matches `entry`, else None."""
+        if not dest.exists() or dest.stat().st_size != entry["size"]:
+            return None
+        if previous and previous["size"] == entry["size"] and entry["sha256"] in (None, previous["sha256"]):
+            return previous
+        # Downloaded before manifests existed (or by hand): hash it once
+        sha256 = (await asyncio.to_thread(file_sha256, dest)).hexdigest()
+        if entry["sha256"] and sha256 != entry["sha256"]:
+            return None
+        return {"size": entry["size"], "sha256": sha256}
+
+    async def fetch(self, name):
+        """Fetches every file of model `name` that isn't already present and returns its manifest."""
+        repo_id = MODELS[name]["repo_id"]
+        directory = model_dir(MODELS[name])
+        directory.mkdir(parents=True, exist_ok=True)
+        previous = read_manifest(directory) or {}
+        known = previous.get("files", {}) if previous.get("repo_id") == repo_id else {}
+        files = [entry for entry in await self.source.list_files(repo_id) if not hidden(entry["path"])]
+        manifest = {"repo_id": repo_id, "revision": REVISION, "source": str(self.source), "complete": False, "files": {}}
+
+        async def one(entry):
+            dest = directory / entry["path"]
+            result = await self.existing(dest, entry, known.get(entry["path"]))
+            if result is None:
+                result = await self.fetch_file(repo_id, entry, dest)
+                print(f"{name}: {entry['path']} ({entry['size'] / 1024 ** 2:.1f} MB)")
+            # Recorded as each file lands, so an interrupted run doesn't rehash it
+            manifest["files"][entry["path"]] = result
+            write_manifest(directory, manifest)
+
+        results = await asyncio.gather(*(one(entry) for entry in files), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+        manifest["complete"] = True
+        manifest["completed_at"] = time.time()
+        write_manifest(directory, manifest)
+        return manifest
+
+
+async def prefetch(names, source, jobs=PREFETCH_JOBS):
+    """Fetches several models concurrently; returns {name: error or None}."""
+    prefetcher = Prefetcher(source, jobs)
+    started = time.monotonic()
+    try:
+        results = await asyncio.gather(*(prefetcher.fetch(name) for name in names), return_exceptions=True)
+    finally:
+        await source.close()
+    elapsed = time.monotonic() - started
+    print(f"Fetched {prefetcher.fetched_bytes / 1024 ** 2:.1f} MB in {elapsed:.1f}s from {source}")
+    return {name: result if isinstance(result, BaseException) else None for name, result in zip(names, results)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download model weights ahead of starting them")
+    parser.add_argument("names", nargs="*", help="Models to fetch")
+    parser.add_argument("--all", action="store_true", help="Fetch every model in MODELS")
+    parser.add_argument("--jobs", "-j", type=int, default=PREFETCH_JOBS, help="Files fetched at once")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="Hub URL or local mirror directory")
+    parser.add_argument("--verify", action="store_true", help="Re-hash downloaded files against their manifests")
+    args = parser.parse_args()
+
+    names = list(MODELS) if args.all else args.names
+    unknown = [name for name in names if name not in MODELS]
+    if unknown:
+        raise SystemExit(f"Unknown model(s): {', '.join(unknown)}")
+    if not names:
+        parser.error("give model names or --all")
+
+    if args.verify:
+        failed = False
+        for name in names:
+            bad = verify(MODELS[name]) if is_complete(MODELS[name]) else ["(not fully downloaded)"]
+            failed = failed or bool(bad)
+            print(f"{name}: {'OK' if not bad else 'BAD ' + ', '.join(bad)}")
+        sys.exit(1 if failed else 0)
+
+    errors = asyncio.run(prefetch(names, make_source(args.source), args.jobs))
+    for name, error in errors.items():
+        print(f"{name}: {'ready' if error is None else f'FAILED: {error}'}")
+    sys.exit(1 if any(errors.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# Streaming of upstream responses back to the client.
+#
+# When a client drops mid-stream the upstream response must be closed right away:
+# vLLM only aborts a generation (and frees its KV-cache blocks) once it sees its
+# own connection go away.
+import asyncio
+
+
+class StreamStats:
+    """Per-model counters of in-flight, completed, failed and aborted proxied requests."""
+
+    def __init__(self):
+        self.models = {}
+
+    def _get(self, model):
+        stats = self.models.get(model)
+        if stats is None:
+            stats = self.models[model] = {
+                "in_flight": 0, "completed": 0, "failed": 0, "aborted": 0, "tokens_saved_est": 0,
+            }
+        return stats
+
+    def in_flight(self, model):
+        stats = self.models.get(model)
+        return stats["in_flight"] if stats else 0
+
+    def started(self, model):
+        self._get(model)["in_flight"] += 1
+
+    def failed(self, model):
+        stats = self._get(model)
+        stats["in_flight"] -= 1
+        stats["failed"] += 1
+
+    def completed(self, model):
+        stats = self._get(model)
+        stats["in_flight"] -= 1
+        stats["completed"] += 1
+
+    def aborted(self, model, tokens_streamed, max_tokens):
+        stats = self._get(model)
+        stats["in_flight"] -= 1
+        stats["aborted"] += 1
+        # Only an estimate: generation could have stopped early anyway
+        if isinstance(max_tokens, int) and max_tokens > tokens_streamed:
+            stats["tokens_saved_est"] += max_tokens - tokens_streamed
+
+    def snapshot(self):
+        return {model: dict(stats) for model, stats in self.models.items()}
+
+
+async def prepend(first, rest):
+    """Yields `first` (unless empty) and then the rest of a partly read body."""
+    if first:
+        yield first
+    async for chunk in rest:
+        yield chunk
+
+
+async def relay(rp_resp, model, stats, max_tokens=None, on_close=None, on_complete=None, observer=None, body=None):
+    """Yields the upstream body, closing the upstream however the iteration ends.
+
+    `body`, if given, is read instead of rp_resp.aiter_bytes() (e.g. a body whose
+    first chunk was already read, see prepend()).
+
+    `on_close()`, if given, runs last, e.g. to free an admission slot.
+    `on_complete(chunks)`, if given, receives the body chunks of a stream that
+    finished (not of an aborted one), e.g. to cache it.
+    `observer`, if given, sees every chunk (see router_metrics.RequestObserver).
+    """
+    tokens = 0
+    finished = False
+    chunks = [] if on_complete is not None else None
+    try:
+        async for chunk in (body if body is not None else rp_resp.aiter_bytes()):
+            # Each SSE event from vLLM carries (roughly) one token
+            tokens += chunk.count(b"data: ")
+            if observer is not None:
+                observer.chunk(chunk)
+            if chunks is not None:
+                chunks.append(chunk)
+            yield chunk
+        finished = True
+    finally:
+        await rp_resp.aclose()
+        if observer is not None:
+            observer.finish(finished, tokens)
+        if finished:
+            stats.completed(model)
+            if on_complete is not None:
+                on_complete(chunks)
+        else:
+            stats.aborted(model, tokens, max_tokens)
+        if on_close is not None:
+            on_close()
+
+
+async def abandon(rp_resp, model, stats, max_tokens=None, on_close=None, observer=None):
+    """relay()'s cleanup for a relay that was never iterated: closing an async
+    generator that hasn't started doesn't run its finally block."""
+    await rp_resp.aclose()
+    if observer is not None:
+        observer.finish(False, 0)
+    stats.aborted(model, 0, max_tokens)
+    if on_close is not None:
+        on_close()
+
+
+async def _wait_for_disconnect(receive):
+    # Anything else still arriving is request body the upstream no longer needs
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+class UpstreamStreamingResponse:
+    """ASGI response that relays a body iterator and always finalises it.
+
+    Chunks go straight to the ASGI server's send() while receive() is watched for
+    the client going away. However sending ends (completed, disconnect, an error
+    from send() or cancellation), the body iterator is closed right away, which
+    runs relay()'s cleanup immediately rather than at GC time. If it ends before
+    the first chunk was asked for (e.g. a disconnect while the response start was
+    being sent), `on_unstarted()`, if given, is awaited instead (see abandon()).
+    """
+
+    def __init__(self, body, status_code=200, media_type=None, headers=None, on_unstarted=None):
+        self.body_iterator = body
+        self.status_code = status_code
+        self.media_type = media_type
+        self.headers = headers or {}
+        self.on_unstarted = on_unstarted
+        self.started = False
+
+    async def _send_body(self, send):
+        headers = [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in self.headers.items()]
+        if self.media_type:
+            headers.append((b"content-type", self.media_type.encode("latin1")))
+        await send({"type": "http.response.start", "status": self.status_code, "headers": headers})
+        self.started = True
+        async for chunk in self.body_iterator:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def __call__(self, scope, receive, send):
+        sending = asyncio.ensure_future(self._send_body(send))
+        watching = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            await asyncio.wait((sending, watching), return_when=asyncio.FIRST_COMPLETED)
+            if sending.done():
+                sending.result()
+        finally:
+            for task in (sending, watching):
+                task.cancel()
+            # The body iterator can only be closed once the task using it has stopped
+            await asyncio.wait((sending, watching))
+            await self.body_iterator.aclose()
+            if not self.started and self.on_unstarted is not None:
+                await self.on_unstarted()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# Readiness probing and warm-up for backends.
+#
+# A vLLM server accepts connections as soon as its port opens, but the first real
+# request still pays for weight loading and Metal kernel compilation. A backend
+# that comes up is therefore probed with backoff and sent a few warm-up prompts
+# before the router treats it as routable.
+import asyncio
+import time
+
+# Full-context warm-ups on 128k models would take minutes; cap the prompt length
+DEFAULT_FULL_CONTEXT_CAP = 8192
+
+
+async def wait_until_ready(probe, timeout, initial_delay=0.1, max_delay=2.0):
+    """Calls `probe()` with exponential backoff until it returns True.
+
+    Returns the seconds waited; raises asyncio.TimeoutError after `timeout`.
+    Exceptions from the probe count as "not ready yet".
+    """
+    started = time.monotonic()
+    delay = initial_delay
+    while True:
+        try:
+            if await probe():
+                return time.monotonic() - started
+        except Exception:
+            pass
+        remaining = timeout - (time.monotonic() - started)
+        if remaining <= 0:
+            raise asyncio.TimeoutError(f"Not ready after {timeout:.0f}s")
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+def warmup_requests(name, model_card, steps, full_context_cap=DEFAULT_FULL_CONTEXT_CAP):
+    """Builds the (label, completion request body) pairs for the configured steps.
+
+    "short" is a one-token prompt; "full" fills the model's context window (as
+    reported by vLLM's max_model_len) so the long-sequence kernels get compiled too.
+    """
+    requests = []
+    for step in steps:
+        if step == "short":
+            requests.append((step, {"model": name, "prompt": "Hello", "max_tokens": 1}))
+        elif step == "full":
+            context = model_card.get("max_model_len") or 2048
+            # "hello " is about one token for the tokenizers we ship; leave headroom
+            words = int(min(context, full_context_cap) * 0.9) - 8
+            if words > 0:
+                requests.append((step, {"model": name, "prompt": "hello " * words, "max_tokens": 1}))
+    return requests
+
+
+class Readiness:
+    """Runs warm-ups and records startup-to-ready and per-step timings per backend."""
+
+    def __init__(self, steps, full_context_cap=DEFAULT_FULL_CONTEXT_CAP):
+        self.steps = steps
+        self.full_context_cap = full_context_cap
+        self.start_requested = {}
+        self.records = {}
+
+    def starting(self, backend):
+        """Marks when a backend was asked to start, so readiness can be timed from there."""
+        self.start_requested[backend] = time.time()
+
+    async def warm_up(self, backend, model, pool, model_card, down_since):
+        """Warms up `backend` (a replica address) serving `model`."""
+        record = {"model": model, "warmup_steps": []}
+        for label, body in warmup_requests(model, model_card, self.steps, self.full_context_cap):
+            started = time.perf_counter()
+            try:
+                resp = await pool.send(pool.build_request("POST", "/v1/completions", json=body))
+                status = resp.status_code
+            except Exception as e:
+                status = f"error: {e}"
+            record["warmup_steps"].append({
+                "step": label,
+                "seconds": round(time.perf_counter() - started, 3),
+                "status": status,
+            })
+        ready_at = time.time()
+        since = self.start_requested.pop(backend, None) or down_since
+        record["ready_at"] = ready_at
+        record["startup_to_ready_s"] = round(ready_at - since, 3) if since else None
+        self.records[backend] = record
+        return record
+
+    def snapshot(self):
+        return dict(self.records)
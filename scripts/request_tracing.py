@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# Per-request tracing of the proxy path, with tail-based sampling.
+#
+# A request goes through its phases one after another - filtering the headers,
+# reading the body, routing, admission, upstream connect, first byte, streaming - so a Trace
+# is a list of phase boundaries: starting a phase is one clock read and one list
+# append, and each phase becomes a span under the request's root span. Whether a
+# trace is kept is decided when the request ends: slow requests
+# (ROUTER_TRACE_SLOW_MS) and server errors always are, other requests with
+# probability ROUTER_TRACE_SAMPLE. Kept traces go to a ring buffer of the last
+# ROUTER_TRACE_BUFFER (served at /admin/traces), and to an OTLP/HTTP collector
+# as JSON if ROUTER_TRACE_OTLP is set (e.g. http://localhost:4318/v1/traces).
+import asyncio
+import collections
+import os
+import random
+import time
+
+import httpx
+
+TRACE_ENABLED = os.environ.get("ROUTER_TRACE", "1") == "1"
+TRACE_BUFFER = int(os.environ.get("ROUTER_TRACE_BUFFER", "1024"))
+TRACE_SLOW_MS = float(os.environ.get("ROUTER_TRACE_SLOW_MS", "1000"))
+TRACE_SAMPLE = float(os.environ.get("ROUTER_TRACE_SAMPLE", "0.01"))
+TRACE_OTLP = os.environ.get("ROUTER_TRACE_OTLP")
+# Seconds between OTLP exports, and traces held for the collector at most
+OTLP_INTERVAL = 5.0
+OTLP_QUEUE = 4096
+SERVICE_NAME = "vllm-router"
+
+
+class Trace:
+    """Phases of one proxied request; see Tracer.start()."""
+
+    __slots__ = ("tracer", "method", "path", "started", "wall", "phases", "attrs", "observer")
+
+    def __init__(self, tracer, method, path, started):
+        self.tracer = tracer
+        self.method = method
+        self.path = path
+        self.started = started
+        self.wall = time.time() - (time.perf_counter() - started)
+        # [name, start, attrs]; each phase ends where the next starts
+        self.phases = [["headers", started, None]]
+        self.attrs = {}
+        # The response's RequestObserver, for the first-byte/stream boundary
+        self.observer = None
+
+    def phase(self, name, **attrs):
+        self.phases.append([name, time.perf_counter(), attrs or None])
+
+    def finish(self, status):
+        self.tracer.finish(self, status, time.perf_counter())
+
+
+class Tracer:
+    """Starts Traces and keeps the ones tail sampling selects."""
+
+    def __init__(self, capacity=TRACE_BUFFER, slow_ms=TRACE_SLOW_MS, sample=TRACE_SAMPLE, exporter=None):
+        self.slow_ms = slow_ms
+        self.sample = sample
+        self.exporter = exporter
+        self.kept = collections.deque(maxlen=capacity)
+        self.seen = 0
+        self.slow = 0
+        self.errors = 0
+        self.sampled = 0
+
+    def start(self, method, path, started):
+        return Trace(self, method, path, started)
+
+    def finish(self, trace, status, ended):
+        self.seen += 1
+        duration_ms = 1000 * (ended - trace.started)
+        if duration_ms >= self.slow_ms:
+            self.slow += 1
+        elif status >= 500:
+            self.errors += 1
+        elif random.random() < self.sample:
+            self.sampled += 1
+        else:
+            return
+        record = to_record(trace, status, ended)
+        self.kept.append(record)
+        if self.exporter is not None:
+            self.exporter.add(record)
+
+    def traces(self, min_ms=0.0, limit=100):
+        """Kept traces, newest first."""
+        found = [record for record in reversed(self.kept) if record["duration_ms"] >= min_ms]
+        return found[:limit]
+
+    def stats(self):
+        return {
+            "requests": self.seen,
+            "kept": self.slow + self.errors + self.sampled,
+            "kept_slow": self.slow,
+            "kept_errors": self.errors,
+            "kept_sampled": self.sampled,
+            "buffered": len(self.kept),
+            "slow_ms": self.slow_ms,
+            "sample": self.sample,
+            "exporter": self.exporter.stats() if self.exporter is not None else None,
+        }
+
+
+def to_record(trace, status, ended):
+    """A finished trace as JSON: the request, and its phases as spans (ms from its start)."""
+    phases = list(trace.phases)
+    observer = trace.observer
+    if observer is not None and observer.first is not None and phases[-1][0] == "first_byte":
+        # The first body chunk ends the wait for the backend's first byte
+        phases.append(["stream", observer.first, None])
+    spans = []
+    for i, (name, start, attrs) in enumerate(phases):
+        end = phases[i + 1][1] if i + 1 < len(phases) else ended
+        span = {"name": name, "start_ms": round(1000 * (start - trace.started), 3),
+                "duration_ms": round(1000 * (end - start), 3)}
+        if attrs:
+            span.update(attrs)
+        spans.append(span)
+    return {
+        "trace_id": os.urandom(16).hex(),
+        "method": trace.method,
+        "path": trace.path,
+        "status": status,
+        "start_time": round(trace.wall, 6),
+        "duration_ms": round(1000 * (ended - trace.started), 3),
+        **trace.attrs,
+        "spans": spans,
+    }
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def otlp_spans(record):
+    """A trace record as OTLP spans: a SERVER root span and one INTERNAL span per phase."""
+    start_ns = int(record["start_time"] * 1e9)
+    root_id = os.urandom(8).hex()
+    attributes = {"http.request.method": record["method"], "url.path": record["path"],
+                  "http.response.status_code": record["status"]}
+    attributes.update({k: v for k, v in record.items() if k not in ("trace_id", "method", "path", "status",
+                                                                      "start_time", "duration_ms", "spans")})
+    spans = [{
+        "traceId": record["trace_id"],
+        "spanId": root_id,
+        "name": f"{record['method']} {record['path']}",
+        "kind": 2,
+        "startTimeUnixNano": str(start_ns),
+        "endTimeUnixNano": str(start_ns + int(record["duration_ms"] * 1e6)),
+        "attributes": [_attribute(k, v) for k, v in attributes.items()],
+        "status": {"code": 2 if record["status"] >= 500 else 1},
+    }]
+    for span in record["spans"]:
+        begin = start_ns + int(span["start_ms"] * 1e6)
+        spans.append({
+            "traceId": record["trace_id"],
+            "spanId": os.urandom(8).hex(),
+            "parentSpanId": root_id,
+            "name": span["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(begin),
+            "endTimeUnixNano": str(begin + int(span["duration_ms"] * 1e6)),
+            "attributes": [_attribute(k, v) for k, v in span.items() if k not in ("name", "start_ms", "duration_ms")],
+        })
+    return spans
+
+
+def otlp_payload(records):
+    """OTLP/HTTP JSON body (ExportTraceServiceRequest) for trace records."""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", SERVICE_NAME), _attribute("process.pid", os.getpid())]},
+        "scopeSpans": [{
+            "scope": {"name": "federated_router"},
+            "spans": [span for record in records for span in otlp_spans(record)],
+        }],
+    }]}
+
+
+class OtlpExporter:
+    """Sends kept traces to an OTLP/HTTP collector every OTLP_INTERVAL seconds."""
+
+    def __init__(self, endpoint, interval=OTLP_INTERVAL, max_queued=OTLP_QUEUE):
+        self.endpoint = endpoint
+        self.interval = interval
+        # Oldest traces are dropped while the collector is unreachable
+        self.queue = collections.deque(maxlen=max_queued)
+        self.client = None
+        self.exported = 0
+        self.failures = 0
+        self.last_error = None
+        self._task = None
+
+    def add(self, record):
+        self.queue.append(record)
+
+    async def flush(self):
+        if not self.queue:
+            return
+        records = list(self.queue)
+        self.queue.clear()
+        try:
+            response = await self.client.post(self.endpoint, json=otlp_payload(records), timeout=10.0)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            self.failures += 1
+            if self.last_error is None:
+                print(f"OTLP export to {self.endpoint} failed: {e}")
+            self.last_error = str(e)
+            self.queue.extendleft(reversed(records))
+            return
+        self.exported += len(records)
+        self.last_error = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        self.client = httpx.AsyncClient()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            await self.flush()
+            await self.client.aclose()
+
+    def stats(self):
+        return {"endpoint": self.endpoint, "queued": len(self.queue), "exported": self.exported,
+                "failures": self.failures, "last_error": self.last_error}
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# Opt-in cache for deterministic (temperature 0) completions.
+#
+# Responses are keyed on a canonical hash of the endpoint plus the normalized
+# request body and stored chunk by chunk, so a cached stream replays as SSE with
+# the original chunking. An in-memory LRU tier is backed by an optional sqlite
+# tier that survives restarts; both are bounded in bytes.
+import asyncio
+import hashlib
+import json
+import sqlite3
+import struct
+import time
+from collections import OrderedDict
+
+CACHEABLE_PATHS = ("v1/chat/completions", "v1/completions")
+
+# Fields that don't change what the model generates
+IGNORED_FIELDS = ("user",)
+
+
+def cache_key(path, payload):
+    """Returns the cache key for a request, or None if its output isn't deterministic."""
+    if path.strip("/") not in CACHEABLE_PATHS:
+        return None
+    if payload.get("temperature") != 0:
+        return None
+    normalized = {k: v for k, v in payload.items() if k not in IGNORED_FIELDS}
+    canonical = json.dumps([path.strip("/"), normalized], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class CachedResponse:
+    def __init__(self, status_code, content_type, chunks):
+        self.status_code = status_code
+        self.content_type = content_type
+        self.chunks = chunks
+        self.size = sum(len(chunk) for chunk in chunks)
+
+
+def _pack_chunks(chunks):
+    return b"".join(struct.pack(">I", len(chunk)) + chunk for chunk in chunks)
+
+
+def _unpack_chunks(blob):
+    chunks = []
+    offset = 0
+    while offset < len(blob):
+        (length,) = struct.unpack_from(">I", blob, offset)
+        offset += 4
+        chunks.append(blob[offset:offset + length])
+        offset += length
+    return chunks
+
+
+class MemoryTier:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+        self.entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+            self.evictions += 1
+
+
+class DiskTier:
+    """sqlite-backed tier; evicts least recently used rows beyond `max_bytes`."""
+
+    def __init__(self, path, max_bytes):
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, status INTEGER, content_type TEXT,"
+            " chunks BLOB, size INTEGER, last_used REAL)"
+        )
+        self.db.commit()
+        self._lock = asyncio.Lock()
+
+    def _get(self, key):
+        row = self.db.execute(
+            "SELECT status, content_type, chunks FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        return CachedResponse(row[0], row[1], _unpack_chunks(row[2]))
+
+    def _put(self, key, entry):
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (key, entry.status_code, entry.content_type, _pack_chunks(entry.chunks), entry.size, time.time()),
+        )
+        (total,) = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        while total > self.max_bytes:
+            row = self.db.execute("SELECT key, size FROM responses ORDER BY last_used LIMIT 1").fetchone()
+            if row is None:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            total -= row[1]
+            self.evictions += 1
+        self.db.commit()
+
+    # sqlite is blocking, so keep it off the event loop
+    async def get(self, key):
+        async with self._lock:
+            return await asyncio.to_thread(self._get, key)
+
+    async def put(self, key, entry):
+        async with self._lock:
+            await asyncio.to_thread(self._put, key, entry)
+
+    def close(self):
+        self.db.close()
+
+
+class ResponseCache:
+    def __init__(self, max_bytes, disk_path=None, disk_max_bytes=None):
+        self.memory = MemoryTier(max_bytes)
+        self.disk = DiskTier(disk_path, disk_max_bytes or max_bytes * 4) if disk_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.bypasses = 0
+
+    async def get(self, key):
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = await self.disk.get(key)
+            if entry is not None:
+                self.disk_hits += 1
+                self.memory.put(key, entry)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def put(self, key, entry):
+        self.stores += 1
+        self.memory.put(key, entry)
+        if self.disk is not None:
+            await self.disk.put(key, entry)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "bypasses": self.bypasses,
+            "memory_entries": len(self.memory.entries),
+            "memory_bytes": self.memory.size,
+            "memory_evictions": self.memory.evictions,
+            "disk_evictions": self.disk.evictions if self.disk is not None else 0,
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# Token-level latency metrics for proxied requests, in Prometheus text format.
+#
+# The proxy path hands every upstream chunk to a RequestObserver as it passes
+# through. Observing a chunk is a clock read, a histogram increment and a
+# substring check; chunks are never copied or decoded, except the one carrying
+# the final "usage" object.
+import bisect
+import re
+import time
+
+TTFT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ITL_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320, 640)
+
+PROMPT_TOKENS_RE = re.compile(rb'"prompt_tokens"\s*:\s*(\d+)')
+COMPLETION_TOKENS_RE = re.compile(rb'"completion_tokens"\s*:\s*(\d+)')
+
+
+def _labels(labels):
+    return ",".join(f'{k}="{v}"' for k, v in labels)
+
+
+def _key(labels):
+    # Label tuples come back from JSON as lists
+    return tuple(tuple(pair) for pair in labels)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            # Per-bucket (non-cumulative) counts, plus +Inf, then sum
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def merge(self, series):
+        """Adds another process's series (as exported) into this one."""
+        for labels, (counts, total) in series:
+            mine = self.series.setdefault(_key(labels), [[0] * (len(self.buckets) + 1), 0.0])
+            mine[0] = [a + b for a, b in zip(mine[0], counts)]
+            mine[1] += total
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self.series.items()):
+            prefix = _labels(labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{prefix}}} {total}")
+            lines.append(f"{self.name}_count{{{prefix}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def merge(self, series):
+        """Adds another process's series (as exported) into this one."""
+        for labels, value in series:
+            self.inc(_key(labels), value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{{{_labels(labels)}}} {value}")
+        return lines
+
+
+def render_gauge(name, help_text, samples):
+    """Renders {labels tuple: value} as a Prometheus gauge."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for labels, value in sorted(samples.items()):
+        lines.append(f"{name}{{{_labels(labels)}}} {value}")
+    return lines
+
+
+class RouterMetrics:
+    def __init__(self):
+        self.requests = Counter("router_requests_total", "Proxied requests by model and status code.")
+        self.aborted = Counter("router_requests_aborted_total", "Proxied requests the client abandoned mid-stream.")
+        self.prompt_tokens = Counter("router_prompt_tokens_total", "Prompt tokens reported in usage.")
+        self.completion_tokens = Counter(
+            "router_completion_tokens_total", "Completion tokens (from usage, else one per SSE event)."
+        )
+        self.ttft = Histogram("router_time_to_first_token_seconds", "Time from request to first body chunk.", TTFT_BUCKETS)
+        self.itl = Histogram("router_inter_token_latency_seconds", "Gap between consecutive body chunks.", ITL_BUCKETS)
+        self.duration = Histogram("router_request_duration_seconds", "Time from request to end of response.", DURATION_BUCKETS)
+        self.tokens_per_second = Histogram(
+            "router_completion_tokens_per_second", "Completion tokens per second of generation.", TOKENS_PER_SECOND_BUCKETS
+        )
+
+    def observe(self, model, started):
+        return RequestObserver(self, model, started)
+
+    def all(self):
+        return (self.requests, self.aborted, self.prompt_tokens, self.completion_tokens,
+                self.ttft, self.itl, self.duration, self.tokens_per_second)
+
+    def export(self):
+        """JSON-able copy of every series, for another router worker to merge."""
+        return {metric.name: list(metric.series.items()) for metric in self.all()}
+
+    def combined(self, exports):
+        """A new RouterMetrics holding this one's series plus those of `exports`."""
+        total = RouterMetrics()
+        for export in [self.export()] + list(exports):
+            for metric in total.all():
+                metric.merge(export.get(metric.name, ()))
+        return total
+
+    def render(self):
+        lines = []
+        for metric in self.all():
+            lines.extend(metric.render())
+        return lines
+
+
+class RequestObserver:
+    """Watches one response stream; see RouterMetrics.observe()."""
+
+    __slots__ = ("metrics", "labels", "started", "status", "first", "last", "prompt_tokens", "completion_tokens")
+
+    def __init__(self, metrics, model, started):
+        self.metrics = metrics
+        self.labels = (("model", model),)
+        self.started = started
+        self.status = None
+        self.first = None
+        self.last = None
+        self.prompt_tokens = None
+        self.completion_tokens = None
+
+    def response(self, status_code):
+        self.status = status_code
+
+    def chunk(self, chunk):
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+            self.metrics.ttft.observe(self.labels, now - self.started)
+        else:
+            self.metrics.itl.observe(self.labels, now - self.last)
+        self.last = now
+        if b'"usage"' in chunk:
+            prompt = PROMPT_TOKENS_RE.search(chunk)
+            completion = COMPLETION_TOKENS_RE.search(chunk)
+            if prompt:
+                self.prompt_tokens = int(prompt.group(1))
+            if completion:
+                self.completion_tokens = int(completion.group(1))
+
+    def finish(self, completed, events):
+        metrics = self.metrics
+        now = time.perf_counter()
+        metrics.requests.inc(self.labels + (("code", str(self.status)),))
+        if not completed:
+            metrics.aborted.inc(self.labels)
+        metrics.duration.observe(self.labels, now - self.started)
+        if self.prompt_tokens is not None:
+            metrics.prompt_tokens.inc(self.labels, self.prompt_tokens)
+        # Without usage, each SSE event is (roughly) one token; the last is [DONE]
+        tokens = self.completion_tokens if self.completion_tokens is not None else max(0, events - 1)
+        metrics.completion_tokens.inc(self.labels, tokens)
+        if tokens > 1 and self.first is not None and self.last > self.first:
+            metrics.tokens_per_second.observe(self.labels, tokens / (self.last - self.first))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# Runs the router as several worker processes sharing its port.
+#
+# One federated_router.py process is limited to one core; with ROUTER_WORKERS=N
+# this parent starts N of them instead. On Linux each worker binds the port
+# itself with SO_REUSEPORT and the kernel spreads connections between them;
+# elsewhere (macOS doesn't balance SO_REUSEPORT sockets) the parent binds it
+# once and the workers accept from the inherited socket. The parent also starts
+# LiteLLM once for all of them, restarts a crashed worker with the supervisor's
+# backoff, and stops them all on SIGTERM. How the workers share their counters
+# and limits is described in worker_state.py.
+#
+# Usage: router_workers.py [workers]   (default ROUTER_WORKERS, else one per core)
+import asyncio
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+
+try:
+    from supervisor import ServiceRunner, environment, python_bin
+except ImportError:
+    sys.path.append(str(Path(__file__).parent))
+    from supervisor import ServiceRunner, environment, python_bin
+import litellm_process
+from worker_state import listen_socket
+
+ROUTER_SCRIPT = Path(__file__).resolve().parent / "federated_router.py"
+ROUTER_PORT = int(os.environ.get("ROUTER_PORT", "8000"))
+WORKERS = int(os.environ.get("ROUTER_WORKERS", str(os.cpu_count() or 1)))
+REUSE_PORT = os.environ.get("ROUTER_REUSE_PORT", "1" if sys.platform.startswith("linux") else "0") == "1"
+
+
+class ConsoleLog:
+    """RotatingLog's interface on stdout, which the router's own runner logs."""
+
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+
+    def note(self, message):
+        self.write(f"[router-workers {time.strftime('%Y-%m-%d %H:%M:%S')}] {message}\n".encode())
+
+
+class WorkerRunner(ServiceRunner):
+    """Runs one router worker until stopped, restarting it when it crashes."""
+
+    def __init__(self, worker_id, workers, log, listener=None):
+        super().__init__(f"router worker {worker_id}", log)
+        self.worker_id = worker_id
+        self.workers = workers
+        self.listener = listener
+
+    def argv(self):
+        return [python_bin(), str(ROUTER_SCRIPT)]
+
+    def env(self):
+        env = dict(environment(), ROUTER_WORKER_ID=str(self.worker_id), ROUTER_WORKERS=str(self.workers))
+        if self.listener is not None:
+            env["ROUTER_LISTEN_FD"] = str(self.listener.fileno())
+        return env
+
+    async def _run_once(self):
+        self.log.note(f"starting {self.name}")
+        pass_fds = (self.listener.fileno(),) if self.listener is not None else ()
+        return await self._spawn(self.argv(), self.env(), pass_fds)
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else WORKERS
+    if workers <= 1:
+        os.execv(sys.executable, [sys.executable, str(ROUTER_SCRIPT)])
+    log = ConsoleLog()
+    listener = None if REUSE_PORT else listen_socket(ROUTER_PORT)
+    litellm = litellm_process.start_litellm() if litellm_process.enabled() else None
+
+    async def run():
+        runners = [WorkerRunner(i, workers, log, listener) for i in range(workers)]
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, lambda: [asyncio.ensure_future(runner.stop()) for runner in runners])
+        mode = "SO_REUSEPORT" if listener is None else "a shared listening socket"
+        log.note(f"{workers} router workers on port {ROUTER_PORT} using {mode}")
+        await asyncio.gather(*(runner.run() for runner in runners))
+
+    try:
+        asyncio.run(run())
+    finally:
+        if litellm is not None:
+            litellm_process.stop_litellm(litellm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# Sampling profiler for the live router.
+#
+# A helper thread reads the event loop thread's Python stack (sys._current_frames)
+# at a fixed rate for a limited time, and the samples are counted per distinct
+# stack. The result is in the folded format flamegraph.pl, speedscope and
+# inferno read: one "outermost;...;innermost count" line per stack. Nothing is
+# instrumented, so the router runs at full speed outside the sampling instants.
+import collections
+import os
+import sys
+import time
+
+MAX_SECONDS = 60.0
+MAX_HZ = 1000
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def stack_of(frame):
+    """'outermost;...;innermost' for a frame and its callers."""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """Samples one thread's stack `hz` times a second; see run()."""
+
+    def __init__(self, thread_id, hz=97):
+        self.thread_id = thread_id
+        # Off a round number, so sampling doesn't lock step with periodic work
+        self.hz = min(max(1, hz), MAX_HZ)
+        self.stacks = collections.Counter()
+        self.samples = 0
+
+    def run(self, seconds):
+        """Samples for `seconds` (in the calling thread); returns the stack counts."""
+        interval = 1.0 / self.hz
+        deadline = time.monotonic() + min(seconds, MAX_SECONDS)
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[stack_of(frame)] += 1
+                self.samples += 1
+            del frame
+            time.sleep(interval)
+        return self.stacks
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
@@ -1,103 +1,239 @@
 #!/usr/bin/env python3
+# Status of the vLLM services from a single snapshot per refresh.
+#
+# One listing of the supervisor's services (a single `launchctl list` under
+# launchd) and one `ps` scan are taken concurrently with the router's /admin
+# endpoints, then joined in memory, instead of forking several commands per
+# model. RAM is the RSS of a service's whole process tree (vLLM runs its engine
+# in child processes), shown next to the estimate model_sizing.py derives from the
+# model's config.json (weights, overhead and one full-length sequence of KV
+# cache), or the registry's est_ram before a download.
+#
+# Usage:
+#   status.py                 table, once
+#   status.py --watch [-n 2]  refresh in place every 2 seconds
+#   status.py --json          JSON snapshot (one object per line with --watch)
+import argparse
+import asyncio
+import json
 import os
-import subprocess
+import re
+import sys
+import time
 from pathlib import Path
-from model_defs import MODELS
+from model_defs import MODELS, replicas
+from model_sizing import format_bytes, size_model
+from prefetch import is_complete, model_dir, read_manifest
+from supervisor import backend
 
 # Configuration
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
-MODELS_DIR = PROJECT_ROOT / "models"
 SERVICES_DIR = PROJECT_ROOT / "services"
+ROUTER_URL = os.environ.get("VLLM_ROUTER_URL", "http://localhost:8000")
+HTTP_TIMEOUT = 1.0
 
-def get_service_status(label):
-    try:
-        # Check launchctl list
-        output = subprocess.check_output(f"launchctl list | grep {label} || true", shell=True).decode().strip()
-        if not output:
-            return "STOPPED", "-"
-        
-        parts = output.split()
-        pid = parts[0]
-        if pid == "-":
-            return "STOPPED", "-"
-        return "RUNNING", pid
-    except:
-        return "ERROR", "?"
-
-def get_process_rss(pid):
-    if pid == "-" or pid == "?":
-        return "-"
+TOKENS_PER_SECOND_RE = re.compile(r'^router_completion_tokens_per_second_(sum|count)\{model="([^"]+)"\} (\S+)$', re.M)
+
+
+async def run_command(*args):
+    """Runs a command and returns its stdout, or "" if it can't be run."""
     try:
-        # The PID might be the bash wrapper. We want the python child (vLLM)
-        # Check if current process is bash/sh
-        cmd = subprocess.check_output(f"ps -p {pid} -o comm=", shell=True).decode().strip()
-        target_pid = pid
-        
-        if "bash" in cmd or "sh" in cmd:
-            # Find child
-            try:
-                children = subprocess.check_output(f"pgrep -P {pid}", shell=True).decode().split()
-                if children:
-                    # Assume the last child or the one consuming most memory
-                    # For simplicity, take the last one (usually the python command in our script)
-                    target_pid = children[-1]
-            except subprocess.CalledProcessError:
-                pass # No children found
-
-        # Get RSS in KB
-        output = subprocess.check_output(f"ps -p {target_pid} -o rss=", shell=True).decode().strip()
-        if not output:
-            return "-"
-        rss_kb = int(output)
-        
-        # Convert to GB or MB
-        if rss_kb > 1024 * 1024:
-            return f"{rss_kb / (1024 * 1024):.1f} GB"
-        else:
-            return f"{rss_kb / 1024:.0f} MB"
-    except:
+        proc = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+    except OSError:
+        return ""
+    out, _ = await proc.communicate()
+    return out.decode(errors="replace")
+
+
+def parse_ps(output):
+    """{pid: (ppid, rss_kb)} from `ps -A -o pid=,ppid=,rss=`."""
+    table = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) >= 3 and all(p.isdigit() for p in parts[:3]):
+            table[int(parts[0])] = (int(parts[1]), int(parts[2]))
+    return table
+
+
+def tree_rss(table, children, pid):
+    """RSS (KB) of a process and all of its descendants, or None if it isn't running."""
+    if pid not in table:
+        return None
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        total += table[current][1]
+        stack.extend(children.get(current, ()))
+    return total
+
+
+def parse_tokens_per_second(metrics):
+    """Mean generation tokens/s per model from the router's /metrics histogram."""
+    sums, counts = {}, {}
+    for kind, model, value in TOKENS_PER_SECOND_RE.findall(metrics or ""):
+        (sums if kind == "sum" else counts)[model] = float(value)
+    return {model: sums.get(model, 0.0) / count for model, count in counts.items() if count}
+
+
+def format_rss(kb):
+    if kb is None:
         return "-"
+    if kb > 1024 * 1024:
+        return f"{kb / (1024 * 1024):.1f} GB"
+    return f"{kb / 1024:.0f} MB"
 
-def is_downloaded(repo_id):
-    safe_name = repo_id.replace("/", "_")
-    model_path = MODELS_DIR / safe_name
-    # Check if directory exists and has config.json (heuristic)
-    if model_path.exists() and (model_path / "config.json").exists():
+
+def is_downloaded(config):
+    # Checked against the prefetch manifest (file sizes, no hashing)
+    if is_complete(config):
         return "YES"
+    if read_manifest(model_dir(config)) is not None:
+        return "PARTIAL"
     return "NO"
 
-def main():
-    print(f"{'MODEL':<15} {'STATUS':<10} {'PORT':<6} {'RAM (Act/Est)':<20} {'PARAMS':<8} {'DOWNLOADED':<10}")
-    print("-" * 80)
-    
-    # Sort models by name
-    for name in sorted(MODELS.keys()):
+
+async def fetch_json(client, url):
+    try:
+        resp = await client.get(url, timeout=HTTP_TIMEOUT)
+        return resp.json() if resp.status_code == 200 else None
+    except Exception:
+        return None
+
+
+async def fetch_text(client, url):
+    try:
+        resp = await client.get(url, timeout=HTTP_TIMEOUT)
+        return resp.text if resp.status_code == 200 else None
+    except Exception:
+        return None
+
+
+async def collect(client):
+    """Takes one snapshot of services, processes and router state."""
+    services, ps_out, health, streams, metrics = await asyncio.gather(
+        asyncio.to_thread(backend().running),
+        run_command("ps", "-A", "-o", "pid=,ppid=,rss="),
+        fetch_json(client, f"{ROUTER_URL}/admin/health"),
+        fetch_json(client, f"{ROUTER_URL}/admin/streams"),
+        fetch_text(client, f"{ROUTER_URL}/metrics"),
+    )
+    table = parse_ps(ps_out)
+    children = {}
+    for pid, (ppid, _) in table.items():
+        children.setdefault(ppid, []).append(pid)
+    tokens_per_second = parse_tokens_per_second(metrics)
+
+    models = {}
+    for name in sorted(MODELS):
         config = MODELS[name]
-        label = f"com.jowest.vllm.{name}"
-        
-        status, pid = get_service_status(label)
-        
-        # Get actual RAM if running
-        actual_ram = get_process_rss(pid)
-        est_ram = config.get("est_ram", "?")
-        ram_display = f"{actual_ram} / {est_ram}"
-        
-        # Check download status
-        downloaded = is_downloaded(config["repo_id"])
-        
-        port = config["port"]
-        params = config.get("params", "-")
-        
-        # Colorize status (if supported, but let's stick to plain text for now or simple ascii)
-        # If running, maybe add *? No, user wants simple.
-        
-        print(f"{name:<15} {status:<10} {port:<6} {ram_display:<20} {params:<8} {downloaded:<10}")
-
-    # Also show router?
-    router_label = "com.jowest.vllm.router"
-    r_status, r_pid = get_service_status(router_label)
-    r_ram = get_process_rss(r_pid)
-    print(f"{'router':<15} {r_status:<10} {'8000':<6} {f'{r_ram} / <100MB':<20} {'-':<8} {'YES':<10}")
+        pid = services.get(name)
+        addresses = [replica["address"] for replica in replicas(config)]
+        sizing = size_model(name, config)
+        models[name] = {
+            "status": "RUNNING" if pid else "STOPPED",
+            "pid": pid,
+            "port": config["port"],
+            "rss_kb": tree_rss(table, children, pid) if pid else None,
+            "est_ram": format_bytes(sizing["needed_bytes"]) if sizing else config.get("est_ram", "?"),
+            "sizing": sizing,
+            "params": config.get("params", "-"),
+            "downloaded": is_downloaded(config),
+            "health": {a: health[a]["state"] for a in addresses if a in health} if health else None,
+            "in_flight": (streams or {}).get(name, {}).get("in_flight", 0) if streams is not None else None,
+            "tokens_per_second": tokens_per_second.get(name),
+        }
+
+    if health is None:
+        # Router not reachable: ask the running backends directly
+        running = [name for name, model in models.items() if model["status"] == "RUNNING"]
+        results = await asyncio.gather(*(
+            fetch_json(client, f"http://localhost:{MODELS[name]['port']}/v1/models") for name in running
+        ))
+        for name, result in zip(running, results):
+            models[name]["health"] = {f"localhost:{MODELS[name]['port']}": "up" if result else "down"}
+
+    router_pid = services.get("router")
+    return {
+        "timestamp": time.time(),
+        "router": {
+            "status": "RUNNING" if router_pid else "STOPPED",
+            "pid": router_pid,
+            "reachable": health is not None,
+            "rss_kb": tree_rss(table, children, router_pid) if router_pid else None,
+        },
+        "models": models,
+    }
+
+
+def health_summary(health):
+    if not health:
+        return "-"
+    states = list(health.values())
+    if len(states) == 1:
+        return states[0]
+    up = sum(1 for state in states if state == "up")
+    return f"{up}/{len(states)} up"
+
+
+def render(snapshot):
+    lines = [
+        f"{'MODEL':<17} {'STATUS':<8} {'PID':<7} {'PORT':<6} {'HEALTH':<9} {'IN-FL':<6} {'TOK/S':<7} "
+        f"{'RAM (Act/Est)':<20} {'CTX':<7} {'SEQS':<5} {'PARAMS':<8} {'DOWNLOADED':<10}",
+        "-" * 120,
+    ]
+    for name, model in snapshot["models"].items():
+        in_flight = "-" if model["in_flight"] is None else str(model["in_flight"])
+        tps = "-" if model["tokens_per_second"] is None else f"{model['tokens_per_second']:.1f}"
+        ram = f"{format_rss(model['rss_kb'])} / {model['est_ram']}"
+        sizing = model.get("sizing")
+        context = "-" if sizing is None else str(sizing["max_model_len"]) if sizing["fits"] else "too big"
+        seqs = "-" if sizing is None or not sizing["fits"] else str(sizing["max_num_seqs"])
+        lines.append(
+            f"{name:<17} {model['status']:<8} {model['pid'] or '-':<7} {model['port']:<6} "
+            f"{health_summary(model['health']):<9} {in_flight:<6} {tps:<7} {ram:<20} {context:<7} {seqs:<5} "
+            f"{model['params']:<8} {model['downloaded']:<10}"
+        )
+    router = snapshot["router"]
+    reachable = "up" if router["reachable"] else "down"
+    lines.append(
+        f"{'router':<17} {router['status']:<8} {router['pid'] or '-':<7} {'8000':<6} {reachable:<9} {'-':<6} "
+        f"{'-':<7} {format_rss(router['rss_kb']) + ' / <100MB':<20} {'-':<7} {'-':<5} {'-':<8} {'YES':<10}"
+    )
+    return lines
+
+
+async def run(args):
+    import httpx
+
+    async with httpx.AsyncClient() as client:
+        while True:
+            snapshot = await collect(client)
+            if args.json:
+                print(json.dumps(snapshot), flush=True)
+            else:
+                if args.watch:
+                    # Home the cursor and clear, so the table refreshes in place
+                    sys.stdout.write("\x1b[H\x1b[2J")
+                    print(time.strftime("%H:%M:%S"), f"(every {args.interval:g}s, Ctrl-C to quit)")
+                print("\n".join(render(snapshot)), flush=True)
+            if not args.watch:
+                return
+            await asyncio.sleep(args.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show status of all vLLM services")
+    parser.add_argument("--watch", action="store_true", help="Refresh in place until interrupted")
+    parser.add_argument("-n", "--interval", type=float, default=2.0, help="Seconds between refreshes with --watch")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+# Process supervisor for the model backends and the router.
+#
+# Each service (every model in MODELS, plus the router) is run by a small runner
+# that exec's the server directly - no login shell, no venv activation, and
+# prefetch.py only when the weights' manifest isn't complete. The runner restarts a crashed
+# server with exponential backoff and writes its output to size-rotated logs.
+#
+# Where the runners live is up to a backend:
+#   launchd - one LaunchAgent per service (macOS)
+#   native  - detached runner processes tracked by pid files (Linux, containers)
+# VLLM_SUPERVISOR picks one; the default is launchd on macOS and native elsewhere.
+#
+# Usage: supervisor.py {install|start|stop|restart|stop-all|list|logs|run} [name ...]
+import argparse
+import asyncio
+import os
+import plistlib
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+try:
+    from model_defs import MODELS, parse_size
+except ImportError:
+    sys.path.append(str(Path(__file__).parent))
+    from model_defs import MODELS, parse_size
+from prefetch import is_complete, model_dir
+from model_sizing import launch_flags, size_model
+
+# Configuration
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SCRIPT = Path(__file__).resolve()
+VENV_DIR = PROJECT_ROOT / ".venv"
+SERVICES_DIR = PROJECT_ROOT / "services"
+RUN_DIR = PROJECT_ROOT / "run"
+LAUNCH_AGENTS_DIR = Path.home() / "Library" / "LaunchAgents"
+LABEL_PREFIX = "com.jowest.vllm."
+
+if sys.platform == "darwin":
+    DEFAULT_LOGS_DIR = Path.home() / "Library" / "Logs" / "vllm"
+else:
+    DEFAULT_LOGS_DIR = Path.home() / ".local" / "state" / "vllm" / "logs"
+LOGS_DIR = Path(os.environ.get("VLLM_LOG_DIR", str(DEFAULT_LOGS_DIR)))
+LOG_MAX_BYTES = parse_size(os.environ.get("VLLM_LOG_MAX_BYTES", "50 MB"))
+LOG_BACKUPS = 3
+
+# Restart backoff: doubles from the initial delay up to the max, and starts over
+# once a server has stayed up for STABLE_AFTER seconds
+RESTART_INITIAL_DELAY = 1.0
+RESTART_MAX_DELAY = 60.0
+STABLE_AFTER = 60.0
+# Seconds a server gets to exit after SIGTERM before it is killed
+STOP_TIMEOUT = 15.0
+
+
+def python_bin():
+    venv_python = VENV_DIR / "bin" / "python"
+    return str(venv_python) if venv_python.exists() else sys.executable
+
+
+def environment():
+    env = dict(os.environ)
+    env["PATH"] = f"{VENV_DIR}/bin:" + env.get("PATH", "/usr/bin:/bin:/usr/sbin:/sbin")
+    env["VIRTUAL_ENV"] = str(VENV_DIR)
+    env["HF_HUB_ENABLE_HF_TRANSFER"] = "1"
+    return env
+
+
+def service_names():
+    return list(MODELS) + ["router"]
+
+
+def service_spec(name):
+    """{"argv": server command, "download": download command or None} for a service.
+
+    A downloaded model also gets the context length, sequence and memory limits
+    model_sizing.py derives from its config.json.
+    """
+    if name == "router":
+        # ROUTER_WORKERS > 1 runs several router processes under router_workers.py
+        script = "router_workers.py" if int(os.environ.get("ROUTER_WORKERS", "1")) > 1 else "federated_router.py"
+        return {"argv": [python_bin(), str(PROJECT_ROOT / "scripts" / script)], "download": None}
+    config = MODELS[name]
+    vllm_args = list(config.get("vllm_args", []))
+    argv = [
+        python_bin(), "-m", "vllm.entrypoints.openai.api_server",
+        "--model", str(model_dir(config)),
+        "--served-model-name", name,
+        "--port", str(config["port"]),
+        "--trust-remote-code",
+    ] + launch_flags(size_model(name, config), vllm_args) + vllm_args
+    download = None
+    if not is_complete(config):
+        download = [python_bin(), str(PROJECT_ROOT / "scripts" / "prefetch.py"), name]
+    return {"argv": argv, "download": download}
+
+
+class RotatingLog:
+    """Append-only log file, rotated to .1, .2, ... once it reaches `max_bytes`."""
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, "ab")
+        self.size = self.file.tell()
+
+    def write(self, data):
+        if self.size and self.size + len(data) > self.max_bytes:
+            self.rotate()
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data)
+
+    def note(self, message):
+        self.write(f"[supervisor {time.strftime('%Y-%m-%d %H:%M:%S')}] {message}\n".encode())
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{i}")
+            if older.exists():
+                older.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backups:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self.file = open(self.path, "ab")
+        self.size = 0
+
+    def close(self):
+        self.file.close()
+
+
+class ServiceRunner:
+    """Runs one service until stopped, restarting it with backoff when it crashes."""
+
+    def __init__(self, name, log):
+        self.name = name
+        self.log = log
+        self.process = None
+        self.stopping = False
+        self.restarts = 0
+        self._stopped = asyncio.Event()
+
+    async def run(self):
+        delay = RESTART_INITIAL_DELAY
+        while not self.stopping:
+            started = time.monotonic()
+            code = await self._run_once()
+            if self.stopping:
+                break
+            if code == 0:
+                self.log.note(f"{self.name} exited cleanly")
+                break
+            if time.monotonic() - started >= STABLE_AFTER:
+                delay = RESTART_INITIAL_DELAY
+            self.restarts += 1
+            self.log.note(f"{self.name} exited with status {code}; restart {self.restarts} in {delay:.0f}s")
+            try:
+                await asyncio.wait_for(self._stopped.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, RESTART_MAX_DELAY)
+
+    async def _run_once(self):
+        # Looked up per attempt: the weights may have appeared since the last one
+        spec = service_spec(self.name)
+        if spec["download"] is not None:
+            self.log.note(f"downloading weights: {' '.join(spec['download'])}")
+            code = await self._spawn(spec["download"])
+            if code != 0 or self.stopping:
+                return code
+            # Sized from the config.json that just arrived
+            spec = service_spec(self.name)
+        self.log.note(f"starting: {' '.join(spec['argv'])}")
+        return await self._spawn(spec["argv"])
+
+    async def _spawn(self, argv, env=None, pass_fds=()):
+        try:
+            # Own process group, so vLLM's engine processes can be signalled with it
+            self.process = await asyncio.create_subprocess_exec(
+                *argv, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+                cwd=str(PROJECT_ROOT), env=env or environment(), start_new_session=True, pass_fds=pass_fds,
+            )
+        except OSError as e:
+            self.log.note(f"cannot start {argv[0]}: {e}")
+            return 127
+        while True:
+            chunk = await self.process.stdout.read(65536)
+            if not chunk:
+                break
+            self.log.write(chunk)
+        return await self.process.wait()
+
+    def _signal(self, sig):
+        try:
+            os.killpg(self.process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    async def stop(self):
+        self.stopping = True
+        self._stopped.set()
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.log.note(f"stopping {self.name}")
+        self._signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(self.process.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.log.note(f"{self.name} did not exit within {STOP_TIMEOUT:.0f}s; killing it")
+            self._signal(signal.SIGKILL)
+
+
+def log_path(name):
+    return LOGS_DIR / f"{name}.log"
+
+
+def run_service(name):
+    """Entry point of a runner process: runs `name` until SIGTERM/SIGINT."""
+    log = RotatingLog(log_path(name))
+
+    async def main():
+        runner = ServiceRunner(name, log)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, lambda: asyncio.ensure_future(runner.stop()))
+        await runner.run()
+
+    try:
+        asyncio.run(main())
+    finally:
+        log.close()
+
+
+class NativeBackend:
+    """Runners as detached processes, tracked by pid files in run/."""
+
+    name = "native"
+
+    def pid_file(self, name):
+        return RUN_DIR / f"{name}.pid"
+
+    def _pid(self, name):
+        try:
+            pid = int(self.pid_file(name).read_text())
+            os.kill(pid, 0)
+            return pid
+        except (OSError, ValueError):
+            return None
+
+    def running(self):
+        """{service name: runner pid} for every running service."""
+        pids = {}
+        for name in service_names():
+            if self.pid_file(name).exists():
+                pid = self._pid(name)
+                if pid is None:
+                    self.pid_file(name).unlink(missing_ok=True)
+                else:
+                    pids[name] = pid
+        return pids
+
+    def install(self):
+        RUN_DIR.mkdir(exist_ok=True)
+        LOGS_DIR.mkdir(parents=True, exist_ok=True)
+        print(f"Native supervisor ready (pid files in {RUN_DIR}, logs in {LOGS_DIR})")
+
+    def start(self, names):
+        RUN_DIR.mkdir(exist_ok=True)
+        running = self.running()
+        # Runners are spawned without waiting on each other, so models load in parallel
+        for name in names:
+            if name in running:
+                print(f"{name} is already running (pid {running[name]})")
+                continue
+            proc = subprocess.Popen(
+                [python_bin(), str(SCRIPT), "run", name],
+                cwd=str(PROJECT_ROOT), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL, start_new_session=True,
+            )
+            self.pid_file(name).write_text(str(proc.pid))
+            print(f"Started {name} (pid {proc.pid})")
+
+    def stop(self, names):
+        running = self.running()
+        pids = {name: running[name] for name in names if name in running}
+        for name, pid in pids.items():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass  # Exited since running() looked
+        deadline = time.monotonic() + STOP_TIMEOUT + 5
+        while pids and time.monotonic() < deadline:
+            time.sleep(0.2)
+            pids = {name: pid for name, pid in pids.items() if self._pid(name) == pid}
+        for name in names:
+            if name in pids:
+                print(f"{name} did not stop in time (runner pid {pids[name]})")
+            elif name in running:
+                self.pid_file(name).unlink(missing_ok=True)
+                print(f"Stopped {name}")
+            else:
+                print(f"{name} is not running")
+
+    def restart(self, names):
+        self.stop(names)
+        self.start(names)
+
+
+class LaunchdBackend:
+    """One LaunchAgent per service, each running a runner (macOS)."""
+
+    name = "launchd"
+
+    def __init__(self):
+        self.domain = f"gui/{os.getuid()}"
+
+    def label(self, name):
+        return LABEL_PREFIX + name
+
+    def plist(self, name):
+        return {
+            "Label": self.label(name),
+            "ProgramArguments": [python_bin(), str(SCRIPT), "run", name],
+            "WorkingDirectory": str(PROJECT_ROOT),
+            # The runner logs the server itself; this only catches the runner's own errors
+            "StandardOutPath": str(LOGS_DIR / f"{name}.supervisor.log"),
+            "StandardErrorPath": str(LOGS_DIR / f"{name}.supervisor.log"),
+            # Started on demand; the runner does crash restarts
+            "RunAtLoad": False,
+            "KeepAlive": False,
+            "EnvironmentVariables": {"PATH": f"{VENV_DIR}/bin:/usr/bin:/bin:/usr/sbin:/sbin"},
+        }
+
+    def generate(self):
+        SERVICES_DIR.mkdir(exist_ok=True)
+        LOGS_DIR.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for name in service_names():
+            path = SERVICES_DIR / f"{self.label(name)}.plist"
+            with open(path, "wb") as f:
+                plistlib.dump(self.plist(name), f)
+            paths.append(path)
+        return paths
+
+    def install(self):
+        LAUNCH_AGENTS_DIR.mkdir(parents=True, exist_ok=True)
+        for path in self.generate():
+            target = LAUNCH_AGENTS_DIR / path.name
+            if not target.is_symlink():
+                target.symlink_to(path)
+            # Re-register so launchd picks up the regenerated plist
+            subprocess.run(["launchctl", "bootout", f"{self.domain}/{path.stem}"], stderr=subprocess.DEVNULL)
+            subprocess.run(["launchctl", "bootstrap", self.domain, str(target)])
+            print(f"Installed {path.stem}")
+
+    @staticmethod
+    def parse_list(output):
+        """{service name: pid} of running services from `launchctl list` (PID, Status, Label)."""
+        pids = {}
+        for line in output.splitlines()[1:]:
+            parts = line.split(None, 2)
+            if len(parts) == 3 and parts[2].startswith(LABEL_PREFIX) and parts[0].isdigit():
+                pids[parts[2][len(LABEL_PREFIX):]] = int(parts[0])
+        return pids
+
+    def running(self):
+        try:
+            output = subprocess.run(["launchctl", "list"], capture_output=True, text=True).stdout
+        except OSError:
+            return {}
+        return self.parse_list(output)
+
+    def _launchctl_all(self, *args_per_name):
+        procs = [subprocess.Popen(["launchctl", *args]) for args in args_per_name]
+        return [proc.wait() for proc in procs]
+
+    def start(self, names):
+        running = self.running()
+        names = [name for name in names if name not in running]
+        self._launchctl_all(*(["kickstart", f"{self.domain}/{self.label(name)}"] for name in names))
+        for name in names:
+            print(f"Started {name}")
+
+    def stop(self, names):
+        running = self.running()
+        names = [name for name in names if name in running]
+        self._launchctl_all(*(["kill", "SIGTERM", f"{self.domain}/{self.label(name)}"] for name in names))
+        for name in names:
+            print(f"Stopped {name}")
+
+    def restart(self, names):
+        # -k: kill the running instance first
+        self._launchctl_all(*(["kickstart", "-k", f"{self.domain}/{self.label(name)}"] for name in names))
+        for name in names:
+            print(f"Restarted {name}")
+
+
+BACKENDS = {"launchd": LaunchdBackend, "native": NativeBackend}
+
+
+def backend():
+    default = "launchd" if sys.platform == "darwin" else "native"
+    choice = os.environ.get("VLLM_SUPERVISOR", default)
+    if choice not in BACKENDS:
+        raise SystemExit(f"Unknown VLLM_SUPERVISOR {choice!r} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[choice]()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run and supervise the vLLM services")
+    parser.add_argument("command", choices=["install", "start", "stop", "restart", "stop-all", "list", "logs", "run"])
+    parser.add_argument("names", nargs="*", help="Service names (models, or 'router')")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.names if name not in service_names()]
+    if unknown:
+        raise SystemExit(f"Unknown service(s): {', '.join(unknown)}")
+    if args.command in ("start", "stop", "restart", "logs", "run") and not args.names:
+        raise SystemExit(f"{args.command} needs at least one service name")
+
+    if args.command == "run":
+        run_service(args.names[0])
+        return
+    if args.command == "list":
+        print("\n".join(service_names()))
+        return
+    if args.command == "logs":
+        os.execvp("tail", ["tail", "-f"] + [str(log_path(name)) for name in args.names])
+
+    services = backend()
+    if args.command == "install":
+        services.install()
+    elif args.command == "start":
+        services.start(args.names)
+    elif args.command == "stop":
+        services.stop(args.names)
+    elif args.command == "restart":
+        services.restart(args.names)
+    elif args.command == "stop-all":
+        services.stop(list(services.running()))
+
+
+if __name__ == "__main__":
+    main()
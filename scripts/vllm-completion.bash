@@ -7,7 +7,7 @@ _vllm_ctl_complete() {
     prev="${COMP_WORDS[COMP_CWORD-1]}"
     
     # List of main commands
-    opts="install start stop stop-all restart status logs list"
+    opts="install start stop stop-all restart status logs list prefetch sizing"
     
     # Get model list dynamically
     # Expects vllm-ctl to be in the path or relative
@@ -23,7 +23,7 @@ _vllm_ctl_complete() {
     local cmd="${COMP_WORDS[0]}"
     
     case "${prev}" in
-        start|stop|restart|logs)
+        start|stop|restart|logs|prefetch|sizing)
             # Complete model names
             if [ -x "$cmd" ]; then
                 # If ./vllm-ctl is executable
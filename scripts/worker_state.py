@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# State shared between router worker processes (see router_workers.py).
+#
+# Every worker publishes a JSON snapshot of its counters - admission slots in
+# use, in-flight requests, rate-limit takes, latency histograms - to
+# <ROUTER_STATE_DIR>/worker-<id>.json a few times a second, and reads the other
+# workers' snapshots back in the same loop. Request handling only ever looks at
+# the cached copies, so sharing costs nothing on the request path; the price is
+# that other workers' numbers are up to one interval old.
+#
+# Worker 0 is the coordinator: it runs the on-demand model scheduler and the
+# batch jobs, and also listens on a unix socket in the state directory. The other
+# workers relay those requests to it there (CoordinatorForwarding).
+import asyncio
+import json
+import os
+import socket
+import time
+from pathlib import Path
+
+import httpx
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+STATE_DIR = Path(os.environ.get("ROUTER_STATE_DIR", str(PROJECT_ROOT / "run" / "router")))
+# Seconds between snapshots; also how stale another worker's counters can be
+PUBLISH_INTERVAL = float(os.environ.get("ROUTER_WORKER_PUBLISH_INTERVAL", "0.5"))
+# A snapshot this much older than the interval belongs to a worker that died
+STALE_INTERVALS = 10
+COORDINATOR = 0
+# Seconds a request relayed to the coordinator may take, unless its prefix has its own
+FORWARD_TIMEOUT = 30.0
+
+# Set by router_workers.py in each worker it starts; a router started on its own is worker 0 of 1
+WORKER_ID = int(os.environ.get("ROUTER_WORKER_ID", "0"))
+WORKERS = int(os.environ.get("ROUTER_WORKERS", "1")) if "ROUTER_WORKER_ID" in os.environ else 1
+# Listening socket inherited from router_workers.py (absent when each worker binds with SO_REUSEPORT)
+LISTEN_FD = os.environ.get("ROUTER_LISTEN_FD")
+
+
+def coordinator_socket(directory=STATE_DIR):
+    return Path(directory) / "coordinator.sock"
+
+
+def listen_socket(port, reuse_port=False, host="0.0.0.0"):
+    """A listening TCP socket; with `reuse_port` several processes can bind the
+    same port and the kernel spreads connections between them."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def unix_socket(path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.unlink(missing_ok=True)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(str(path))
+    sock.listen(256)
+    return sock
+
+
+def serve(app, port):
+    """Runs `app` as one router worker: on the inherited listening socket, or its
+    own SO_REUSEPORT one, plus the coordinator's unix socket on worker 0."""
+    import uvicorn
+
+    if LISTEN_FD is not None:
+        sockets = [socket.socket(fileno=int(LISTEN_FD))]
+    else:
+        sockets = [listen_socket(port, reuse_port=True)]
+    if WORKER_ID == COORDINATOR:
+        sockets.append(unix_socket(coordinator_socket()))
+    print(f"Router worker {WORKER_ID}/{WORKERS} (pid {os.getpid()}) serving on port {port}")
+    uvicorn.Server(uvicorn.Config(app)).run(sockets=sockets)
+
+
+class WorkerState:
+    """Publishes this worker's snapshot and keeps the other workers' latest ones.
+
+    `snapshot()` returns this worker's counters as a JSON-able dict;
+    `on_refresh(peers)` is called after each round with {worker id: snapshot}.
+    """
+
+    def __init__(self, snapshot, on_refresh=None, worker_id=WORKER_ID, workers=WORKERS,
+                 directory=STATE_DIR, interval=PUBLISH_INTERVAL):
+        self.snapshot = snapshot
+        self.on_refresh = on_refresh
+        self.worker_id = worker_id
+        self.workers = workers
+        self.directory = Path(directory)
+        self.interval = interval
+        self.peers = {}
+        self.published = 0
+        self._task = None
+
+    def path(self, worker_id):
+        return self.directory / f"worker-{worker_id}.json"
+
+    def publish(self):
+        state = dict(self.snapshot(), worker=self.worker_id, pid=os.getpid(), published_at=time.time())
+        path = self.path(self.worker_id)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state))
+        tmp.replace(path)
+        self.published += 1
+
+    def read_peers(self):
+        peers = {}
+        oldest = time.time() - STALE_INTERVALS * self.interval
+        for worker_id in range(self.workers):
+            if worker_id == self.worker_id:
+                continue
+            try:
+                state = json.loads(self.path(worker_id).read_text())
+            except (OSError, ValueError):
+                continue
+            if state.get("published_at", 0) >= oldest:
+                peers[worker_id] = state
+        return peers
+
+    def refresh(self):
+        self.publish()
+        self.peers = self.read_peers()
+        if self.on_refresh is not None:
+            self.on_refresh(self.peers)
+
+    def peer_sum(self, section, key):
+        """Sum of `section`[`key`] over the other workers' snapshots."""
+        return sum(peer.get(section, {}).get(key, 0) for peer in self.peers.values())
+
+    async def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except OSError as e:
+                print(f"Worker state: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Gone at once rather than after STALE_INTERVALS
+        self.path(self.worker_id).unlink(missing_ok=True)
+
+    def stats(self):
+        now = time.time()
+        return {
+            "worker": self.worker_id,
+            "workers": self.workers,
+            "pid": os.getpid(),
+            "snapshots_published": self.published,
+            "peers": {
+                worker_id: {"pid": peer.get("pid"), "age_ms": round(1000 * (now - peer.get("published_at", now)))}
+                for worker_id, peer in sorted(self.peers.items())
+            },
+        }
+
+
+class Coordinator:
+    """HTTP client for worker 0's unix socket."""
+
+    def __init__(self, path=None):
+        self.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=str(path or coordinator_socket())),
+            base_url="http://coordinator",
+            timeout=None,
+        )
+
+    async def request(self, method, path, headers=None, content=None, timeout=FORWARD_TIMEOUT):
+        return await self.client.request(method, path, headers=headers, content=content, timeout=timeout)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class CoordinatorForwarding:
+    """ASGI middleware of workers other than the coordinator: relays requests
+    under `prefixes` to it, so there is one copy of the state behind them.
+    `timeouts` maps prefixes to their own timeout in seconds."""
+
+    def __init__(self, app, prefixes, coordinator, timeouts=None):
+        self.app = app
+        self.prefixes = tuple(prefixes)
+        self.coordinator = coordinator
+        self.timeouts = dict(timeouts or {})
+
+    def timeout(self, path):
+        for prefix, timeout in self.timeouts.items():
+            if path.startswith(prefix):
+                return timeout
+        return FORWARD_TIMEOUT
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        path = scope["path"] + ("?" + scope["query_string"].decode() if scope.get("query_string") else "")
+        headers = [(k, v) for k, v in scope["headers"] if k not in (b"host", b"content-length", b"connection")]
+        try:
+            response = await self.coordinator.request(scope["method"], path, headers, body,
+                                                      timeout=self.timeout(scope["path"]))
+            status, content = response.status_code, response.content
+            response_headers = [
+                (k, v) for k, v in response.headers.raw if k.lower() not in (b"content-length", b"transfer-encoding")
+            ]
+        except httpx.HTTPError as e:
+            status = 503
+            content = json.dumps({"error": f"Router worker {COORDINATOR} is unreachable: {e}"}).encode()
+            response_headers = [(b"content-type", b"application/json")]
+        response_headers.append((b"content-length", str(len(content)).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": response_headers})
+        await send({"type": "http.response.body", "body": content})
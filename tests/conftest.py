@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The scripts are run directly (not installed), so make them importable the
+# same way they import each other
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+from admission import ModelAdmission, Rejected
+
+
+def make(max_concurrency=1, max_queue=2, queue_timeout=5.0):
+    return ModelAdmission("m", {
+        "max_concurrency": max_concurrency, "max_queue": max_queue, "queue_timeout": queue_timeout,
+    })
+
+
+def test_queue_overflow_is_rejected_with_retry_after():
+    async def run():
+        slot = make(max_queue=1)
+        await slot.acquire()
+        waiter = asyncio.ensure_future(slot.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected) as excinfo:
+            await slot.acquire()
+        assert excinfo.value.retry_after >= 1
+        slot.release()
+        await waiter
+        return slot.stats()
+
+    stats = asyncio.run(run())
+    assert stats["admitted"] == 2
+    assert stats["rejected"] == 1
+    assert stats["active"] == 1
+    assert stats["queued"] == 0
+
+
+def test_higher_priority_is_admitted_first():
+    async def run():
+        slot = make(max_queue=5)
+        await slot.acquire()
+        order = []
+
+        async def wait(label, priority):
+            await slot.acquire(priority)
+            order.append(label)
+            slot.release()
+
+        tasks = [asyncio.ensure_future(wait("low", 2)), asyncio.ensure_future(wait("high", 0))]
+        await asyncio.sleep(0)
+        slot.release()
+        await asyncio.gather(*tasks)
+        return order, slot.stats()
+
+    order, stats = asyncio.run(run())
+    assert order == ["high", "low"]
+    assert stats["active"] == 0
+
+
+def test_queue_deadline():
+    async def run():
+        slot = make(queue_timeout=5.0)
+        await slot.acquire()
+        with pytest.raises(Rejected):
+            await slot.acquire(timeout=0.01)
+        slot.release()
+        return slot.stats()
+
+    stats = asyncio.run(run())
+    assert stats["timed_out"] == 1
+    assert stats["queued"] == 0
+    assert stats["active"] == 0
+
+
+def test_light_caller_overtakes_backlog():
+    async def run():
+        slot = make(max_queue=10)
+        await slot.acquire(key="bulk")
+        order = []
+
+        async def wait(label, key, weight=1.0):
+            await slot.acquire(key=key, weight=weight, cost=100)
+            order.append(label)
+            slot.release()
+
+        tasks = [asyncio.ensure_future(wait(f"bulk{i}", "bulk")) for i in range(4)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(wait("interactive", "user")))
+        await asyncio.sleep(0)
+        assert slot.stats()["queued_by_key"] == {"bulk": 4, "user": 1}
+        slot.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(run())
+    # Bulk's backlog has already pushed its finish tags out, so the new caller goes first
+    assert order == ["interactive", "bulk0", "bulk1", "bulk2", "bulk3"]
+
+
+def test_weights_share_slots():
+    async def run():
+        slot = make(max_queue=20)
+        await slot.acquire()
+        order = []
+
+        async def wait(key, weight):
+            await slot.acquire(key=key, weight=weight)
+            order.append(key)
+            slot.release()
+
+        tasks = [asyncio.ensure_future(wait("heavy", 3.0)) for _ in range(6)]
+        tasks += [asyncio.ensure_future(wait("light", 1.0)) for _ in range(6)]
+        await asyncio.sleep(0)
+        slot.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(run())
+    # 3:1 while both have requests waiting
+    assert order[:8].count("heavy") == 6
+
+
+def test_full_queue_sheds_the_heaviest_caller():
+    async def run():
+        slot = make(max_queue=3)
+        await slot.acquire(key="bulk")
+        waiters = [asyncio.ensure_future(slot.acquire(key="bulk")) for _ in range(3)]
+        await asyncio.sleep(0)
+        # A light caller still gets in; the newest bulk request makes room
+        light = asyncio.ensure_future(slot.acquire(key="user"))
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected):
+            await waiters[-1]
+        # Bulk can't shed its own requests to get more
+        with pytest.raises(Rejected):
+            await slot.acquire(key="bulk")
+        for _ in range(3):
+            slot.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(light, *waiters[:2])
+        return slot.stats()
+
+    stats = asyncio.run(run())
+    assert stats["rejected"] == 2
+    assert stats["queued"] == 0
+    assert stats["queued_by_key"] == {}
+    assert stats["active"] == 1
+
+
+def test_workers_share_slots_and_borrow_idle_ones():
+    async def run():
+        peers = {"m": (3, 4)}
+        slot = ModelAdmission("m", {"max_concurrency": 4, "max_queue": 4, "queue_timeout": 5.0},
+                              workers=2, peer_load=lambda name: peers[name])
+        # Guaranteed half of the slots and of the queue, while the other worker uses most of them
+        await slot.acquire()
+        await slot.acquire()
+        waiters = [asyncio.ensure_future(slot.acquire()) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(Rejected):
+            await slot.acquire()
+        # The other worker goes idle: its slots can be filled
+        peers["m"] = (0, 0)
+        slot.rebalance()
+        await asyncio.gather(*waiters)
+        active = slot.active
+        # And comes back: a released slot isn't handed on above this worker's share
+        peers["m"] = (4, 0)
+        slot.release()
+        return active, slot.active
+
+    assert asyncio.run(run()) == (4, 3)
+
+
+def test_single_worker_ignores_peers():
+    slot = ModelAdmission("m", {"max_concurrency": 4, "max_queue": 8, "queue_timeout": 5.0},
+                          workers=1, peer_load=lambda name: 1 / 0)
+    assert (slot.concurrency(), slot.queue_limit()) == (4, 8)
@@ -0,0 +1,82 @@
+import pytest
+
+from admission import Rejected
+from api_keys import ANONYMOUS, ClientRegistry, TokenBucket, estimate_tokens, usage_tokens
+from router_metrics import RouterMetrics
+
+
+def test_identify_callers():
+    registry = ClientRegistry({"sk-batch": {"name": "batch", "weight": 0.25}})
+    assert registry.identify("Bearer sk-batch") == "batch"
+    assert registry.identify("bearer   sk-batch") == "batch"
+    assert registry.identify(None) == ANONYMOUS
+    other = registry.identify("Bearer sk-other")
+    assert other.startswith("key-") and "sk-other" not in other
+    assert registry.identify("Bearer sk-other") == other
+    assert registry.get("batch").weight == 0.25
+    assert registry.get(other).weight == 1.0
+
+
+def test_estimate_tokens():
+    assert estimate_tokens(400, {"max_tokens": 50}) == 150
+    assert estimate_tokens(0, {"max_tokens": "lots"}) == estimate_tokens(0, {})
+
+
+def test_token_bucket_refills(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("api_keys.time.monotonic", lambda: now[0])
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    now[0] += 30
+    assert bucket.wait_time(30) == 0
+    # Larger than the bucket: only needs it full
+    assert bucket.wait_time(600) == pytest.approx(30.0)
+
+
+def test_requests_and_tokens_limits(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("api_keys.time.monotonic", lambda: now[0])
+    registry = ClientRegistry({"sk-a": {"name": "a", "requests_per_minute": 2, "tokens_per_minute": 1000}})
+    client = registry.get("a")
+    client.charge(300)
+    client.charge(300)
+    with pytest.raises(Rejected, match="requests per minute") as e:
+        client.charge(1)
+    assert e.value.retry_after == 30
+
+    now[0] += 60
+    client.charge(900)
+    with pytest.raises(Rejected, match="tokens per minute"):
+        client.charge(500)
+    # The request used far less than estimated: the rest comes back
+    client.settle(900, 100)
+    client.charge(500)
+    assert client.stats()["rejected"] == 2
+    assert client.stats()["tokens_used"] == 100
+
+
+def test_usage_tokens_from_observer():
+    observer = RouterMetrics().observe("m", 0.0)
+    assert usage_tokens(observer) == 0
+    observer.response(200)
+    assert usage_tokens(observer) is None
+    observer.chunk(b'data: {"usage": {"prompt_tokens": 12, "completion_tokens": 30}}\n\n')
+    assert usage_tokens(observer) == 42
+    observer.response(502)
+    assert usage_tokens(observer) == 0
+
+
+def test_absorb_charges_other_workers_takes(monkeypatch):
+    monkeypatch.setattr("api_keys.time.monotonic", lambda: 100.0)
+    registry = ClientRegistry({"sk-a": {"name": "a", "requests_per_minute": 10, "tokens_per_minute": 1000}})
+    registry.get("a").charge(100)
+    assert registry.taken() == {"a": [1, 100]}
+    # Another worker's running totals: only what changed since the last ones is taken
+    registry.absorb((1, 4242), {"a": [5, 600]})
+    registry.absorb((1, 4242), {"a": [8, 850]})
+    client = registry.get("a")
+    assert client.stats()["requests_available"] == 1
+    assert client.stats()["tokens_available"] == 50
+    with pytest.raises(Rejected, match="tokens per minute"):
+        client.charge(100)
@@ -0,0 +1,96 @@
+import asyncio
+import re
+import time
+
+from asgi_proxy import BodyStream, ProxyMiddleware, read_request, sanitize_headers, sniff_model, split_headers
+from request_tracing import Tracer
+
+
+def receiver(*chunks):
+    messages = [{"type": "http.request", "body": c, "more_body": i < len(chunks) - 1} for i, c in enumerate(chunks)]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+    return receive
+
+
+def scope(headers=(), path="/v1/completions", query=b""):
+    return {"type": "http", "method": "POST", "path": path, "query_string": query, "headers": list(headers)}
+
+
+def test_split_headers_filters_once():
+    raw = [
+        (b"host", b"router"), (b"content-length", b"12"), (b"authorization", b"Bearer "),
+        (b"x-priority", b"high"), (b"accept", b"*/*"),
+    ]
+    forward, control = split_headers(raw)
+    assert forward == [(b"x-priority", b"high"), (b"accept", b"*/*")]
+    assert control == {"content-length": "12", "x-priority": "high"}
+    assert sanitize_headers([(b"authorization", b"  "), (b"authorization", b"Bearer abc")]) == [
+        (b"authorization", b"Bearer abc")
+    ]
+
+
+def test_sniff_model_ignores_prompt_text():
+    assert sniff_model(b'{"prompt": "say \\"model\\": \\"x\\"", "model": "qwen-0.5"') == "qwen-0.5"
+    assert sniff_model(b'{"prompt": "aaaa') is None
+    assert sniff_model(b'{"model": "org\\/qwen-\\u0030.5", "prompt": "') == "org/qwen-0.5"
+
+
+def test_small_body_is_read_whole():
+    async def run():
+        return await read_request(scope(query=b"a=1"), receiver(b'{"model":', b' "m"}'), 0.0, max_buffered=64)
+
+    request = asyncio.run(run())
+    assert not request.streamed
+    assert request.content == b'{"model": "m"}'
+    assert request.path == "/v1/completions?a=1"
+
+
+def test_body_read_is_its_own_trace_phase():
+    trace = Tracer().start("POST", "/v1/completions", time.perf_counter())
+
+    async def run():
+        return await read_request(scope(), receiver(b'{"model": "m"}'), trace.started, max_buffered=64, trace=trace)
+
+    asyncio.run(run())
+    assert [phase[0] for phase in trace.phases] == ["headers", "read_body"]
+
+
+def test_large_body_is_streamed():
+    body = [b'{"model": "m", "prompt": "', b"x" * 100, b"x" * 100, b'"}']
+    headers = [(b"content-length", str(sum(map(len, body))).encode())]
+
+    async def run():
+        request = await read_request(scope(headers), receiver(*body), 0.0, max_buffered=64)
+        return request, [chunk async for chunk in request.content]
+
+    request, chunks = asyncio.run(run())
+    assert request.streamed
+    assert isinstance(request.content, BodyStream)
+    assert sniff_model(request.content.prefix) == "m"
+    assert b"".join(chunks) == b"".join(body)
+    assert (b"content-length", b"228") in request.headers
+
+
+def test_middleware_sends_own_routes_to_app():
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(("app", scope["headers"]))
+
+    async def proxy(scope, receive, send):
+        seen.append(("proxy", scope["path"]))
+
+    class Route:
+        path = "/metrics"
+
+    class ParamRoute:
+        path = "/v1/batches/{batch_id}"
+        path_regex = re.compile("^/v1/batches/(?P<batch_id>[^/]+)$")
+
+    middleware = ProxyMiddleware(app, proxy, [Route(), ParamRoute()])
+    asyncio.run(middleware(scope([(b"authorization", b"Bearer")], path="/metrics"), None, None))
+    asyncio.run(middleware(scope(path="/v1/chat/completions"), None, None))
+    asyncio.run(middleware(scope(path="/v1/batches/batch_1"), None, None))
+    assert seen == [("app", []), ("proxy", "/v1/chat/completions"), ("app", [])]
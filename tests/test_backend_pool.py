@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from backend_pool import PoolManager
+
+
+async def _serve_ok(reader, writer):
+    while True:
+        # Keep-alive: answer every request on the same connection
+        head = await reader.readuntil(b"\r\n\r\n")
+        if not head:
+            break
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nContent-Type: text/plain\r\n\r\nok")
+        await writer.drain()
+
+
+def test_pool_reuses_connection_and_reports_stats():
+    async def run():
+        server = await asyncio.start_server(_serve_ok, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pools = PoolManager()
+        pool = pools.get("fake", f"http://127.0.0.1:{port}", {"max_keepalive": 4})
+        try:
+            for _ in range(3):
+                resp = await pool.get("/health")
+                assert resp.text == "ok"
+            return pools.stats()["fake"]
+        finally:
+            await pools.aclose()
+            server.close()
+
+    stats = asyncio.run(run())
+    assert stats["requests"] == 3
+    assert stats["connects"] == 1
+    assert stats["idle"] == 1
+    assert stats["in_use"] == 0
+    assert stats["waiting"] == 0
+    assert stats["limits"]["max_keepalive"] == 4
+
+
+def test_discarded_pool_closes_once_idle():
+    async def run():
+        server = await asyncio.start_server(_serve_ok, "127.0.0.1", 0)
+        url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        pools = PoolManager()
+        old = pools.get("fake", url, {"max_connections": 4})
+        try:
+            resp = await old.send(old.build_request("GET", "/stream"), stream=True)
+            pools.discard("fake")
+            new = pools.get("fake", url, {"max_connections": 8})
+            await asyncio.sleep(0)
+            # Still streaming on the old pool
+            assert not old.client.is_closed and old in pools.retiring
+            assert await resp.aread() == b"ok"
+            await resp.aclose()
+            while pools.retiring:
+                await asyncio.sleep(0.05)
+            return old.client.is_closed, new.settings["max_connections"]
+        finally:
+            await pools.aclose()
+            server.close()
+
+    assert asyncio.run(run()) == (True, 8)
@@ -0,0 +1,149 @@
+import asyncio
+import json
+
+import pytest
+
+import batch_jobs
+from batch_jobs import BatchError, BatchManager, Concurrency, validate_input
+
+
+def write_input(path, count, url="/v1/chat/completions"):
+    lines = [
+        {"custom_id": f"r{i}", "method": "POST", "url": url, "body": {"model": "m", "messages": [], "stream": True}}
+        for i in range(count)
+    ]
+    path.write_text("".join(json.dumps(line) + "\n" for line in lines))
+    return path
+
+
+def results(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_validation_reports_lines(tmp_path):
+    path = tmp_path / "in.jsonl"
+    path.write_text(
+        '{"custom_id": "a", "url": "/v1/chat/completions", "body": {}}\n'
+        '{"custom_id": "a", "url": "/v1/completions", "body": {}}\n'
+        "nope\n\n"
+    )
+    with pytest.raises(BatchError) as e:
+        validate_input(path, "/v1/chat/completions")
+    assert e.value.problems == [
+        {"line": 2, "message": "duplicate custom_id 'a'"},
+        {"line": 2, "message": "url must be the batch's endpoint /v1/chat/completions"},
+        {"line": 3, "message": "not valid JSON"},
+    ]
+    assert validate_input(write_input(path, 3), "/v1/chat/completions") == 3
+
+
+def test_concurrency_aimd():
+    limit = Concurrency(maximum=8, initial=2)
+    # Slow start: one more per success
+    limit.success(free_slots=5)
+    limit.success(free_slots=5)
+    assert limit.limit == 4
+    limit.overloaded()
+    limit.overloaded()
+    # Halved once per second at most
+    assert limit.limit == 2
+    limit.success(free_slots=5)
+    assert limit.limit == 2.5
+    limit.success(free_slots=-3)
+    assert limit.limit == 2.1
+
+
+def test_batch_runs_retries_and_records_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_jobs, "MAX_ATTEMPTS", 2)
+    calls = []
+
+    async def send(client, url, body):
+        calls.append((client, body))
+        n = int(body["messages"][0]["content"]) if body["messages"] else 0
+        if len(calls) == 1:
+            return 503, {"retry-after": "0"}, b'{"error": "busy"}'
+        return (400, {}, b'{"error": "bad"}') if n else (200, {}, b'{"ok": true}')
+
+    async def main():
+        manager = BatchManager(send, directory=tmp_path / "batches")
+        path = write_input(tmp_path / "in.jsonl", 3)
+        lines = path.read_text().splitlines()
+        lines[2] = lines[2].replace('"messages": []', '"messages": [{"role": "user", "content": "1"}]')
+        path.write_text("\n".join(lines) + "\n")
+        job = manager.create(str(path), "/v1/chat/completions", client="batch", model="other")
+        await job.task
+        return manager, job
+
+    manager, job = asyncio.run(main())
+    assert job.state["status"] == "completed"
+    assert job.state["request_counts"] == {"total": 3, "completed": 2, "failed": 1}
+    assert all(client == "batch" and body["model"] == "other" and "stream" not in body for client, body in calls)
+    assert len(calls) == 4
+    assert sorted(r["custom_id"] for r in results(job.output_path)) == ["r0", "r1"]
+    error = results(job.errors_path)[0]
+    assert error["custom_id"] == "r2"
+    assert error["error"] == {"code": "400", "message": "bad"}
+    assert manager.file_path(f"{job.id}-output") == job.output_path
+    with pytest.raises(KeyError):
+        manager.file_path("../../etc/passwd")
+
+
+def test_batch_resumes_after_restart(tmp_path):
+    path = write_input(tmp_path / "in.jsonl", 10)
+    sent = []
+
+    async def first_run():
+        release = asyncio.Event()
+
+        async def send(client, url, body):
+            sent.append(body)
+            if len(sent) > 4:
+                await release.wait()
+            return 200, {}, b"{}"
+
+        manager = BatchManager(send, directory=tmp_path / "batches")
+        job = manager.create(str(path), "/v1/chat/completions")
+        while job.done() < 4:
+            await asyncio.sleep(0.01)
+        # The router shuts down with requests still in flight
+        await manager.stop()
+        return job
+
+    job = asyncio.run(first_run())
+    assert job.state["status"] == "in_progress"
+    # A result line cut short by the shutdown is dropped and the request redone
+    with open(job.output_path, "a") as f:
+        f.write('{"custom_id": "r9", "resp')
+
+    async def second_run():
+        async def send(client, url, body):
+            sent.append(body)
+            return 200, {}, b"{}"
+
+        manager = BatchManager(send, directory=tmp_path / "batches")
+        manager.resume()
+        resumed = manager.get(job.id)
+        await resumed.task
+        return resumed
+
+    resumed = asyncio.run(second_run())
+    assert resumed.state["status"] == "completed"
+    assert resumed.state["request_counts"]["completed"] == 10
+    assert sorted(r["custom_id"] for r in results(resumed.output_path)) == [f"r{i}" for i in range(10)]
+
+
+def test_batch_fails_when_a_request_breaks(tmp_path):
+    async def send(client, url, body):
+        # Not a response body; recording it raises TypeError
+        return 200, {}, None
+
+    async def main():
+        manager = BatchManager(send, directory=tmp_path / "batches")
+        job = manager.create(str(write_input(tmp_path / "in.jsonl", 3)), "/v1/chat/completions")
+        await job.task
+        return job
+
+    job = asyncio.run(main())
+    assert job.state["status"] == "failed"
+    assert job.state["failed_at"] is not None
+    assert "NoneType" in job.state["errors"]["message"]
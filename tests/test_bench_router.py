@@ -0,0 +1,31 @@
+import asyncio
+
+import httpx
+
+from bench_router import percentile, run_load
+from fake_backend import FakeBackend
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) is None
+
+
+def test_fake_backend_streams_and_load_runs():
+    async def run():
+        backend = await FakeBackend("tiny", 0, ttft=0.0, tokens_per_second=10000.0).start()
+        port = backend.server.sockets[0].getsockname()[1]
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+                resp = await client.post("/v1/completions", json={"model": "tiny", "max_tokens": 3})
+                assert resp.json()["usage"]["completion_tokens"] == 3
+            return await run_load(f"http://127.0.0.1:{port}", ["tiny"], 4, 12, 5)
+        finally:
+            await backend.stop()
+
+    result = asyncio.run(run())
+    assert result["errors"] == 0
+    assert result["requests"] == 12
+    assert result["ttft_p50_ms"] is not None
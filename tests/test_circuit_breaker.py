@@ -0,0 +1,37 @@
+import time
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, BreakerRegistry
+
+
+def test_opens_after_consecutive_failures_and_recovers():
+    breaker = BreakerRegistry().get("localhost:8011", {"failure_threshold": 2, "reset_timeout": 0.05})
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == CLOSED
+    breaker.failure()
+    assert breaker.state == OPEN
+    assert not breaker.available()
+    assert breaker.retry_after() >= 1
+
+    time.sleep(0.06)
+    assert breaker.available()
+    breaker.attempt()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    assert not breaker.available()
+    breaker.success()
+    assert breaker.state == CLOSED
+    assert breaker.stats()["trips"] == 1
+
+
+def test_failed_probe_reopens_and_cancelled_probe_frees_the_slot():
+    breaker = BreakerRegistry({"failure_threshold": 1, "reset_timeout": 0.05}).get("b")
+    breaker.failure()
+    time.sleep(0.06)
+    breaker.attempt()
+    breaker.cancelled()
+    assert breaker.state == OPEN and breaker.available()
+    breaker.attempt()
+    breaker.failure()
+    assert breaker.state == OPEN and not breaker.available()
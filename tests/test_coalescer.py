@@ -0,0 +1,54 @@
+import asyncio
+
+from coalescer import Coalescer
+
+
+async def upstream(chunks, closed):
+    try:
+        for chunk in chunks:
+            await asyncio.sleep(0.01)
+            yield chunk
+    finally:
+        closed.append(True)
+
+
+def test_followers_share_the_leaders_stream():
+    async def run():
+        coalescer = Coalescer()
+        closed = []
+        flight, leader = coalescer.join("k")
+        assert leader
+        flight.start(200, "text/event-stream", upstream([b"a", b"b", b"c"], closed))
+
+        async def read():
+            return [chunk async for chunk in flight.subscribe()]
+
+        first = asyncio.ensure_future(read())
+        await asyncio.sleep(0.015)
+        # Joins mid-stream and still gets every chunk
+        follower, leader = coalescer.join("k")
+        assert follower is flight and not leader
+        second = await read()
+        return await first, second, closed, coalescer.stats()
+
+    first, second, closed, stats = asyncio.run(run())
+    assert first == second == [b"a", b"b", b"c"]
+    assert closed == [True]
+    assert stats == {"in_flight": 0, "subscribers": 0, "leaders": 1, "coalesced": 1}
+
+
+def test_upstream_is_cancelled_when_every_subscriber_leaves():
+    async def run():
+        coalescer = Coalescer()
+        closed = []
+        flight, _ = coalescer.join("k")
+        flight.start(200, "text/event-stream", upstream([b"x"] * 100, closed))
+        body = flight.subscribe()
+        await body.__anext__()
+        await body.aclose()
+        await asyncio.sleep(0.01)
+        return closed, coalescer.stats()
+
+    closed, stats = asyncio.run(run())
+    assert closed == [True]
+    assert stats["in_flight"] == 0
@@ -0,0 +1,68 @@
+import asyncio
+
+from embedding_batcher import ALONE, EmbeddingBatcher, PendingEmbedding, batch_key, single_input, split_response
+
+
+def test_single_input_and_key():
+    assert single_input({"input": "hello"}) == "hello"
+    assert single_input({"input": ["hello"]}) == "hello"
+    assert single_input({"input": ["a", "b"]}) is None
+    assert single_input({"input": [1, 2, 3]}) is None
+    assert batch_key({"model": "m", "input": "a"}) == batch_key({"input": "b", "model": "m"})
+    assert batch_key({"model": "m", "input": "a"}) != batch_key({"model": "m", "input": "a", "dimensions": 8})
+
+
+def test_split_response_assigns_indices_and_usage():
+    body = {
+        "object": "list",
+        "model": "m",
+        "data": [{"object": "embedding", "index": 1, "embedding": [1.0]}, {"object": "embedding", "index": 0, "embedding": [0.0]}],
+        "usage": {"prompt_tokens": 10, "total_tokens": 10},
+    }
+    first, second = split_response(body, ["aaaa", "b" * 12])
+    assert first["data"] == [{"object": "embedding", "index": 0, "embedding": [0.0]}]
+    assert second["data"] == [{"object": "embedding", "index": 0, "embedding": [1.0]}]
+    assert first["usage"] == {"prompt_tokens": 2, "total_tokens": 2}
+    assert second["usage"] == {"prompt_tokens": 8, "total_tokens": 8}
+
+
+def test_concurrent_requests_share_one_batch():
+    sent = []
+
+    async def send(key, items):
+        sent.append([item.text for item in items])
+        for item in items:
+            item.resolve(item.text.upper())
+
+    async def main():
+        batcher = EmbeddingBatcher(send, window=0.01, max_batch=3)
+        submit = lambda key, text: batcher.submit(key, PendingEmbedding(text))
+        # Five at once: a full batch of three right away, then the other two
+        full = await asyncio.gather(*(submit("m", text) for text in "abcde"))
+        alone = await submit("m", "f")
+        return batcher, full, alone
+
+    batcher, full, alone = asyncio.run(main())
+    assert full == ["A", "B", "C", "D", "E"]
+    assert sent == [["a", "b", "c"], ["d", "e"]]
+    assert alone is ALONE
+    stats = batcher.stats()
+    assert stats["requests"] == 6
+    assert stats["upstream_requests"] == 3
+    assert stats["batch_size_max"] == 3
+    assert stats["throughput_gain"] == 2.0
+
+
+def test_unresolved_items_go_alone():
+    async def send(key, items):
+        items[0].resolve("done")
+
+    async def main():
+        batcher = EmbeddingBatcher(send, window=0.01)
+        results = await asyncio.gather(*(batcher.submit("m", PendingEmbedding(text)) for text in "ab"))
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == ["done", ALONE]
+    assert stats["retried_alone"] == 1
+    assert stats["upstream_requests"] == 2
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+fastapi = pytest.importorskip("fastapi")
+
+import federated_router as router
+
+
+def test_extract_model():
+    assert router.extract_model(b'{"model": "qwen-0.5", "messages": []}') == "qwen-0.5"
+    assert router.extract_model(b"") is None
+    assert router.extract_model(b"not json") is None
+    assert router.extract_model(b'{"model": 5}') is None
+
+
+def test_direct_dispatch_uses_backend_port(monkeypatch):
+    monkeypatch.setattr(router.litellm_process, "ROUTING_MODE", "direct")
+    monkeypatch.setattr(router.litellm_process, "LITELLM_FALLBACK", False)
+    assert router.resolve_upstream("smollm2-135m") == "smollm2-135m"
+    assert router.resolve_upstream("nope") is None
+
+
+def test_unknown_model_falls_back_to_litellm(monkeypatch):
+    monkeypatch.setattr(router.litellm_process, "ROUTING_MODE", "direct")
+    monkeypatch.setattr(router.litellm_process, "LITELLM_FALLBACK", True)
+    assert router.resolve_upstream("nope") == "litellm"
+
+
+def test_models_served_from_snapshot_with_etag(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    qwen = f"localhost:{router.MODELS['qwen-0.5']['port']}"
+    mixtral = f"localhost:{router.MODELS['mixtral']['port']}"
+
+    async def fetch(address):
+        if address == qwen:
+            return {"object": "list", "data": [{"id": "models/qwen", "object": "model"}]}
+        raise ConnectionError(address)
+
+    monitor = router.HealthMonitor(fetch, lambda: [qwen, mixtral], down_after=1)
+    monkeypatch.setattr(router, "health", monitor)
+    asyncio.run(monitor.refresh_all())
+    assert router.model_state("mixtral") == router.DOWN
+
+    client = TestClient(router.app)
+    resp = client.get("/v1/models")
+    assert resp.status_code == 200
+    # qwen-0.5 is a "small" model, so the plain "auto" alias can be served
+    assert [m["id"] for m in resp.json()["data"]] == ["qwen-0.5", "auto"]
+    assert resp.json()["data"][0]["backend_model"] == "models/qwen"
+    assert resp.json()["data"][0]["replicas"] == [qwen]
+
+    cached = client.get("/v1/models", headers={"If-None-Match": resp.headers["etag"]})
+    assert cached.status_code == 304
+
+    down = client.post("/v1/chat/completions", json={"model": "mixtral", "messages": []})
+    assert down.status_code == 503
+    assert 'router_requests_total{model="mixtral",code="503"}' in "\n".join(router.metrics.render())
+
+
+def test_missed_poll_does_not_stop_model_for_scheduler(monkeypatch):
+    qwen = f"localhost:{router.MODELS['qwen-0.5']['port']}"
+    results = [None, asyncio.TimeoutError()]
+
+    async def fetch(address):
+        error = results.pop(0)
+        if error is not None:
+            raise error
+        return {"data": [{"id": "models/qwen"}]}
+
+    monitor = router.HealthMonitor(fetch, lambda: [qwen])
+    monkeypatch.setattr(router, "health", monitor)
+    assert not router.model_running("qwen-0.5")
+    asyncio.run(monitor.refresh(qwen))
+    asyncio.run(monitor.refresh(qwen))
+    assert router.model_state("qwen-0.5") == router.UNKNOWN
+    assert router.model_running("qwen-0.5")
+
+
+def test_registry_reload_swaps_table(tmp_path, monkeypatch):
+    import json
+
+    from fastapi.testclient import TestClient
+
+    path = tmp_path / "models.json"
+    models = {name: config for name, config in router.MODELS.items() if name != "mixtral"}
+    models["tiny"] = {"repo_id": "org/tiny", "port": 8190, "est_ram": "100 MB"}
+    path.write_text(json.dumps(models))
+    monkeypatch.setattr(router.litellm_process, "ROUTING_MODE", "direct")
+    monkeypatch.setattr(router.litellm_process, "LITELLM_FALLBACK", False)
+    monkeypatch.setattr(router, "table", router.table)
+    monkeypatch.setattr(router, "health", router.HealthMonitor(None, lambda: []))
+    monkeypatch.setattr(router.registry, "path", path)
+    old = router.table
+    client = TestClient(router.app)
+
+    assert client.get("/admin/registry/diff").json() == {"added": ["tiny"], "removed": ["mixtral"], "changed": {}}
+    resp = client.post("/admin/registry/reload")
+    assert resp.status_code == 200
+    assert resp.json()["removed"] == ["mixtral"]
+    assert resp.json()["version"] == old.version + 1
+    assert router.resolve_upstream("tiny") == "tiny"
+    assert router.resolve_upstream("mixtral") is None
+    # A request that started before the swap still routes on its own table
+    assert router.resolve_upstream("mixtral", old) == "mixtral"
+
+    models["tiny"]["est_ram"] = "a lot"
+    path.write_text(json.dumps(models))
+    resp = client.post("/admin/registry/reload")
+    assert resp.status_code == 422
+    assert resp.json()["problems"] == ["tiny: est_ram: Unparseable size 'a lot'"]
+    assert router.table.models["tiny"]["est_ram"] == "100 MB"
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from hedging import Hedger
+
+
+def hedger():
+    return Hedger({"percentile": 50, "window": 10, "min_samples": 3, "min_delay": 0.01})
+
+
+async def answer(value, delay):
+    await asyncio.sleep(delay)
+    return value
+
+
+def test_delay_needs_samples():
+    h = hedger()
+    assert h.delay("m") is None
+    for ttft in (0.1, 0.2, 0.3):
+        h.observe("m", ttft)
+    assert h.delay("m") == 0.2
+
+
+def test_fast_primary_is_not_hedged():
+    h = hedger()
+    started = []
+
+    async def hedge():
+        started.append(True)
+        return "hedge"
+
+    result = asyncio.run(h.race("m", answer("primary", 0), hedge, 0.05, None))
+    assert result == ("primary", False)
+    assert not started
+
+
+def test_slow_primary_loses_to_hedge_and_is_cancelled():
+    h = hedger()
+    discarded = []
+
+    async def discard(result):
+        discarded.append(result)
+
+    async def run():
+        result = await h.race("m", answer("primary", 1.0), lambda: answer("hedge", 0.01), 0.02, discard)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == ("hedge", True)
+    assert h.hedged == {"m": 1} and h.hedge_wins == {"m": 1}
+    assert discarded == []
+
+
+def test_failed_hedge_falls_back_to_primary():
+    async def broken():
+        raise ConnectionError("down")
+
+    result = asyncio.run(hedger().race("m", answer("primary", 0.05), broken, 0.01, None))
+    assert result == ("primary", False)
+
+    async def both():
+        return await hedger().race("m", broken(), broken, 0.01, None)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(both())
@@ -0,0 +1,39 @@
+from load_balancer import LEAST_OUTSTANDING, PREFIX_AFFINITY, ReplicaSet
+from model_defs import replicas
+
+
+def test_replicas_default_to_local_port():
+    assert replicas({"port": 8011}) == [{"address": "localhost:8011", "weight": 1.0}]
+    assert replicas({"port": 8011, "replicas": ["a:1", {"address": "b:2", "weight": 2}]}) == [
+        {"address": "a:1", "weight": 1.0},
+        {"address": "b:2", "weight": 2.0},
+    ]
+
+
+def test_least_outstanding_respects_weights():
+    replica_set = ReplicaSet("m", replicas({"replicas": ["a:1", {"address": "b:2", "weight": 2}]}), LEAST_OUTSTANDING)
+    picks = []
+    for _ in range(6):
+        address = replica_set.pick()
+        replica_set.acquire(address)
+        picks.append(address)
+    assert picks.count("a:1") == 2
+    assert picks.count("b:2") == 4
+
+
+def test_unavailable_replicas_are_skipped():
+    replica_set = ReplicaSet("m", replicas({"replicas": ["a:1", "b:2"]}))
+    assert replica_set.pick(available=["b:2"]) == "b:2"
+    assert replica_set.pick(available=[]) is None
+
+
+def test_prefix_affinity_is_sticky_until_overloaded():
+    replica_set = ReplicaSet("m", replicas({"replicas": ["a:1", "b:2", "c:3"]}), PREFIX_AFFINITY)
+    payload = {"messages": [{"role": "system", "content": "You are a code reviewer."}]}
+    first = replica_set.pick(payload)
+    assert all(replica_set.pick(payload) == first for _ in range(10))
+
+    for _ in range(5):
+        replica_set.acquire(first)
+    assert replica_set.pick(payload) != first
+    assert replica_set.stats()["affinity_spills"] == 1
@@ -0,0 +1,97 @@
+import json
+import os
+
+import pytest
+
+from model_defs import MODELS, RegistryError, diff_models, load_models, validate
+from model_registry import RegistryWatcher, RoutingTable
+
+BASE = {
+    "small": {"repo_id": "org/small", "port": 8101, "est_ram": "1 GB"},
+    "big": {"repo_id": "org/big", "port": 8102, "est_ram": "10 GB", "replicas": ["localhost:8102", "gpu:8102"]},
+}
+
+
+def write(path, models):
+    path.write_text(json.dumps(models))
+    # Make sure the watcher sees a new mtime even on coarse filesystems
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_shipped_registry_is_valid():
+    assert validate(MODELS) == []
+
+
+def test_validation_reports_every_problem():
+    models = {
+        "a": {"repo_id": "org/a", "port": 8101, "est_ram": "lots"},
+        "b": {"repo_id": "org/b", "port": 8101, "memory_budget": "some"},
+        "c": {"repo_id": "org/c", "port": 8103, "replicas": ["localhost:8101"], "fallback": "zzz"},
+        "d": {"port": "8104"},
+    }
+    problems = validate(models)
+    assert "a: est_ram: Unparseable size 'lots'" in problems
+    assert "b: port 8101 is already used by a" in problems
+    assert "b: memory_budget: Unparseable size 'some'" in problems
+    assert "c: replica localhost:8101 is already used by a" in problems
+    assert "c: unknown fallback model 'zzz'" in problems
+    assert "d: missing repo_id" in problems
+    assert "d: invalid port '8104'" in problems
+    assert validate([]) == ["the registry must be a non-empty object of models"]
+
+
+def test_load_models_raises_registry_error(tmp_path):
+    path = tmp_path / "models.json"
+    path.write_text("{not json")
+    with pytest.raises(RegistryError, match="not valid JSON"):
+        load_models(path)
+    write(path, {"a": {"repo_id": "org/a", "port": 0}})
+    with pytest.raises(RegistryError) as e:
+        load_models(path)
+    assert e.value.problems == ["a: invalid port 0"]
+
+
+def test_diff():
+    new = json.loads(json.dumps(BASE))
+    new["small"]["port"] = 8111
+    new["extra"] = {"repo_id": "org/extra", "port": 8120}
+    del new["big"]
+    assert diff_models(BASE, new) == {"added": ["extra"], "removed": ["big"], "changed": {"small": ["port"]}}
+    assert diff_models(BASE, BASE) == {"added": [], "removed": [], "changed": {}}
+
+
+def test_table_swap_keeps_unchanged_replica_sets():
+    old = RoutingTable(BASE)
+    old.replica_sets["big"].acquire("gpu:8102")
+    new_models = dict(BASE, small=dict(BASE["small"], port=8111))
+    new = RoutingTable(new_models, previous=old)
+    assert new.version == old.version + 1
+    # In-flight counts carry over where the replicas are the same
+    assert new.replica_sets["big"] is old.replica_sets["big"]
+    assert new.replica_sets["big"].in_flight["gpu:8102"] == 1
+    assert new.replica_sets["small"] is not old.replica_sets["small"]
+    assert new.backend_owner == {"localhost:8111": "small", "localhost:8102": "big", "gpu:8102": "big"}
+    # The old table is untouched for requests still using it
+    assert old.backend_owner["localhost:8101"] == "small"
+    assert old.config("localhost:8101")["port"] == 8101
+
+
+def test_watcher_applies_valid_changes_only(tmp_path, capsys):
+    path = tmp_path / "models.json"
+    write(path, BASE)
+    applied = []
+    watcher = RegistryWatcher(applied.append, path=path)
+    assert watcher.check() is None
+    assert applied == []
+
+    write(path, dict(BASE, extra={"repo_id": "org/extra", "port": 8101}))
+    watcher.check()
+    assert applied == []
+    assert watcher.stats()["error"] == ["extra: port 8101 is already used by small"]
+    assert "not reloaded" in capsys.readouterr().out
+
+    write(path, dict(BASE, extra={"repo_id": "org/extra", "port": 8120}))
+    watcher.check()
+    assert list(applied[-1]) == ["small", "big", "extra"]
+    assert watcher.stats()["error"] is None
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from model_defs import parse_size
+from model_scheduler import InsufficientMemory, ModelScheduler, RemoteScheduler
+
+MODELS = {
+    "big": {"est_ram": "20 GB"},
+    "medium": {"est_ram": "10 GB"},
+    "small": {"est_ram": "4 GB"},
+}
+
+
+def test_parse_size():
+    assert parse_size("19 GB") == 19 * 1024 ** 3
+    assert parse_size("400MB") == 400 * 1024 ** 2
+    assert parse_size("1.5 gb") == int(1.5 * 1024 ** 3)
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+def make_scheduler(budget, running, busy=(), sizing=None):
+    events = []
+
+    async def start(name):
+        events.append(("start", name))
+        running.add(name)
+
+    async def stop(name):
+        events.append(("stop", name))
+        running.discard(name)
+
+    async def wait_ready(name, timeout):
+        pass
+
+    scheduler = ModelScheduler(
+        MODELS, parse_size(budget), start, stop,
+        is_running=lambda name: name in running,
+        wait_ready=wait_ready,
+        in_flight=lambda name: 1 if name in busy else 0,
+        sizing=sizing,
+    )
+    return scheduler, events
+
+
+def test_evicts_least_recently_used_idle_model():
+    running = {"medium", "small"}
+    scheduler, events = make_scheduler("30 GB", running)
+    scheduler.touch("medium")
+    scheduler.touch("small")
+
+    asyncio.run(scheduler.ensure_running("big"))
+    assert events == [("stop", "medium"), ("start", "big")]
+    assert running == {"small", "big"}
+
+
+def test_busy_models_are_not_evicted():
+    running = {"medium", "small"}
+    scheduler, events = make_scheduler("24 GB", running, busy={"medium"})
+    with pytest.raises(InsufficientMemory):
+        asyncio.run(scheduler.ensure_running("big"))
+    assert events == []
+
+
+def test_sized_models_take_their_budget():
+    sizes = {"medium": {"fits": True, "budget_bytes": parse_size("16 GB")}}
+    running = {"medium", "small"}
+    scheduler, events = make_scheduler("36 GB", running, sizing=sizes.get)
+    assert scheduler.ram("medium") == parse_size("16 GB")
+    assert scheduler.ram("small") == parse_size("4 GB")
+    scheduler.touch("medium")
+    scheduler.touch("small")
+
+    # By est_ram (10 GB) "big" would fit without stopping "medium"
+
+    asyncio.run(scheduler.ensure_running("big"))
+    assert events == [("stop", "medium"), ("start", "big")]
+
+
+def test_concurrent_requests_share_one_start():
+    running = set()
+    scheduler, events = make_scheduler("30 GB", running)
+
+    async def run():
+        await asyncio.gather(*(scheduler.ensure_running("small") for _ in range(5)))
+
+    asyncio.run(run())
+    assert events == [("start", "small")]
+
+
+def test_remote_scheduler_asks_only_for_stopped_models():
+    running = {"small"}
+    asked, waited = [], []
+
+    async def ensure_remote(name):
+        asked.append(name)
+        running.add(name)
+
+    async def wait_ready(name, timeout):
+        waited.append(name)
+
+    scheduler = RemoteScheduler(MODELS, lambda name: name in running, wait_ready, ensure_remote)
+
+    async def main():
+        await scheduler.ensure_running("small")
+        await scheduler.ensure_running("big")
+
+    asyncio.run(main())
+    assert asked == ["big"]
+    assert waited == ["small", "big"]
+    assert set(scheduler.last_used) == {"small", "big"}
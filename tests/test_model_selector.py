@@ -0,0 +1,83 @@
+import pytest
+
+from backend_health import DOWN, UP, WARMING
+from model_defs import MODELS, validate
+from model_selector import NoModelAvailable, prompt_tokens, select_model
+
+MODELS_BY_COST = {
+    "tiny": {"category": "tiny", "context": 2048, "cost": 0.1},
+    "chat": {"category": "chat", "context": 32768, "cost": 3},
+    "big": {"category": "reasoning", "context": 131072, "cost": 32},
+    "coder": {"category": "code", "context": 16384, "cost": 9},
+    "eyes": {"category": "vision", "context": 4096, "cost": 7},
+}
+
+
+def chat(text, max_tokens=100):
+    return {"messages": [{"role": "user", "content": text}], "max_tokens": max_tokens}
+
+
+def test_prompt_estimate():
+    assert prompt_tokens(chat("x" * 400)) == (104, 0)
+    assert prompt_tokens({"prompt": "abcde"}) == (2, 0)
+    parts = [{"type": "text", "text": "what is this?"}, {"type": "image_url", "image_url": {"url": "data:..."}}]
+    assert prompt_tokens({"messages": [{"role": "user", "content": parts}]}) == (8, 1)
+
+
+def test_cheapest_running_model_that_fits():
+    state = lambda name: UP
+    assert select_model("auto", chat("hi"), MODELS_BY_COST, state) == "tiny"
+    # 2048 tokens don't fit the tiny model's window
+    assert select_model("auto", chat("x" * 8000), MODELS_BY_COST, state) == "chat"
+    assert select_model("auto", chat("hi", max_tokens=60000), MODELS_BY_COST, state) == "big"
+    assert select_model("auto-code", chat("hi"), MODELS_BY_COST, state) == "coder"
+    image = {"messages": [{"role": "user", "content": [{"type": "image_url", "image_url": {"url": "x"}}]}]}
+    assert select_model("auto", image, MODELS_BY_COST, state) == "eyes"
+    with pytest.raises(NoModelAvailable) as e:
+        select_model("auto", chat("hi", max_tokens=200000), MODELS_BY_COST, state)
+    assert e.value.status_code == 400
+
+
+def test_running_models_and_queues_come_first():
+    states = {"tiny": DOWN, "chat": WARMING, "big": UP}
+    state = lambda name: states.get(name, DOWN)
+    assert select_model("auto", chat("hi"), MODELS_BY_COST, state) == "big"
+    # Started on demand when a scheduler can start it
+    assert select_model("auto", chat("hi"), MODELS_BY_COST, lambda name: DOWN, allow_start=True) == "tiny"
+    with pytest.raises(NoModelAvailable) as e:
+        select_model("auto", chat("hi"), MODELS_BY_COST, lambda name: DOWN)
+    assert e.value.status_code == 503
+
+    # A saturated cheap model loses to an idle one that costs less than its queue
+    load = lambda name: 40.0 if name == "tiny" else 0.0
+    assert select_model("auto", chat("hi"), MODELS_BY_COST, lambda name: UP, load) == "chat"
+
+
+def test_aliases_are_reserved():
+    assert "auto" not in MODELS
+    models = {"auto": {"repo_id": "org/a", "port": 8101, "category": "chatty", "context": 0}}
+    assert validate(models) == [
+        "auto: reserved for automatic model selection",
+        "auto: invalid context 0",
+        "auto: unknown category 'chatty'",
+    ]
+
+
+def test_router_rewrites_auto_model(monkeypatch):
+    pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+
+    import federated_router as router
+
+    monkeypatch.setattr(router.litellm_process, "ROUTING_MODE", "direct")
+    monkeypatch.setattr(router.litellm_process, "LITELLM_FALLBACK", False)
+    monkeypatch.setattr(router, "health", router.HealthMonitor(None, lambda: []))
+    client = TestClient(router.app)
+    # Nothing is running and there is no scheduler to start a model
+    resp = client.post("/v1/chat/completions", json={"model": "auto", "messages": []})
+    assert resp.status_code == 503
+    assert "running" in resp.json()["error"]
+
+    monkeypatch.setattr(router, "model_state", lambda name, routes=None: UP)
+    assert router.choose_model(router.table, "auto", chat("hi")) == "smollm2-135m"
+    assert router.choose_model(router.table, "auto-math", chat("hi")) == "qwen-math-1.5b"
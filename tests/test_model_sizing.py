@@ -0,0 +1,83 @@
+import json
+
+import prefetch
+import supervisor
+from model_sizing import launch_flags, memory_budget, size_model
+
+GB = 1024 ** 3
+# Qwen2.5-0.5B: 24 layers, 2 KV heads of 64 dims
+QWEN = {
+    "num_hidden_layers": 24, "num_attention_heads": 14, "num_key_value_heads": 2, "hidden_size": 896,
+    "intermediate_size": 4864, "vocab_size": 151936, "max_position_embeddings": 32768,
+    "tie_word_embeddings": True, "quantization": {"group_size": 64, "bits": 4},
+}
+
+
+def install(tmp_path, monkeypatch, model_config, weights=None):
+    monkeypatch.setattr(prefetch, "MODELS_DIR", tmp_path)
+    directory = tmp_path / "org_tiny"
+    directory.mkdir()
+    (directory / "config.json").write_text(json.dumps(model_config))
+    if weights:
+        with open(directory / "model.safetensors", "wb") as f:
+            f.truncate(weights)
+    return {"repo_id": "org/tiny", "port": 8099}
+
+
+def test_kv_cache_limits_context(tmp_path, monkeypatch):
+    config = install(tmp_path, monkeypatch, QWEN, weights=GB // 4)
+    roomy = size_model("tiny", config, budget=8 * GB, total_memory=32 * GB)
+    assert roomy["kv_bytes_per_token"] == 2 * 24 * 2 * 64 * 2
+    assert roomy["weights_bytes"] == GB // 4
+    assert roomy["max_model_len"] == 32768
+    assert roomy["max_num_seqs"] == 256
+    assert roomy["gpu_memory_utilization"] == 0.25
+
+    # A 1.5 GB budget leaves 0.25 GB of KV cache after weights and overhead: 21845 tokens
+    tight = size_model("tiny", config, budget=GB + GB // 2, total_memory=32 * GB)
+    assert tight["kv_cache_tokens"] == (GB // 4) // 12288
+    assert tight["max_model_len"] == 21760
+    assert tight["max_num_seqs"] == 10
+    assert launch_flags(tight, ["--max-num-seqs=4"]) == [
+        "--max-model-len", "21760", "--gpu-memory-utilization", "0.04",
+    ]
+
+    assert not size_model("tiny", config, budget=GB, total_memory=32 * GB)["fits"]
+
+
+def test_weights_estimated_before_download(tmp_path, monkeypatch):
+    config = install(tmp_path, monkeypatch, {"text_config": QWEN, "quantization": {"bits": 4}})
+    sizing = size_model("tiny", config, budget=8 * GB, total_memory=32 * GB)
+    # ~0.5B parameters at 4 bits
+    assert 200 * 1024 ** 2 < sizing["weights_bytes"] < 300 * 1024 ** 2
+
+
+def test_service_spec_gets_sizing_flags(tmp_path, monkeypatch):
+    config = install(tmp_path, monkeypatch, QWEN, weights=GB // 4)
+    config["memory_budget"] = "1.5 GB"
+    config["vllm_args"] = ["--max-model-len", "4096"]
+    monkeypatch.setitem(supervisor.MODELS, "tiny", config)
+    argv = supervisor.service_spec("tiny")["argv"]
+    assert argv.count("--max-model-len") == 1
+    assert argv[-2:] == ["--max-model-len", "4096"]
+    assert argv[argv.index("--max-num-seqs") + 1] == "10"
+
+
+def test_models_are_sized_against_unreserved_host_budget(tmp_path, monkeypatch):
+    monkeypatch.setenv("VLLM_MEMORY_BUDGET", "4 GB")
+    # Ten downloaded models of 1 GB weights each: more than fit in 4 GB at once
+    models = {"own": {"memory_budget": "1 GB", "est_ram": "20 GB"}}
+    monkeypatch.setattr(prefetch, "MODELS_DIR", tmp_path)
+    for i in range(10):
+        directory = tmp_path / f"org_m{i}"
+        directory.mkdir()
+        (directory / "config.json").write_text(json.dumps(QWEN))
+        with open(directory / "model.safetensors", "wb") as f:
+            f.truncate(GB)
+        models[f"m{i}"] = {"repo_id": f"org/m{i}", "port": 8100 + i, "est_ram": "1 GB"}
+    assert memory_budget("own", models=models) == GB
+    for i in range(10):
+        sizing = size_model(f"m{i}", models=models, total_memory=32 * GB)
+        assert sizing["budget_bytes"] == 3 * GB
+        assert sizing["fits"] and sizing["max_model_len"] == 32768
+        assert launch_flags(sizing)
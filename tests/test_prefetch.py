@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import json
+
+import httpx
+import pytest
+
+import prefetch
+from prefetch import HubSource, MirrorSource, PrefetchError, Prefetcher, is_complete, model_dir, read_manifest
+
+FILES = {"config.json": b'{"model_type": "llama"}', "model.safetensors": bytes(range(256)) * 4096}
+
+
+@pytest.fixture
+def tiny(tmp_path, monkeypatch):
+    monkeypatch.setattr(prefetch, "MODELS_DIR", tmp_path / "models")
+    monkeypatch.setattr(prefetch, "CHUNK_SIZE", 64 * 1024)
+    monkeypatch.setitem(prefetch.MODELS, "tiny", {"repo_id": "org/tiny", "port": 8099})
+    return prefetch.MODELS["tiny"]
+
+
+def hub(files, requests, delay=0.0):
+    """A stand-in for the hub's tree and resolve endpoints, honouring Range."""
+    active = [0, 0]  # in flight, most in flight
+
+    async def handler(request):
+        requests.append(request)
+        if request.url.path == "/api/models/org/tiny/tree/main":
+            return httpx.Response(200, json=[
+                {"type": "file", "path": path, "size": len(data),
+                 "lfs": {"oid": hashlib.sha256(data).hexdigest()} if path.endswith(".safetensors") else None}
+                for path, data in files.items()
+            ] + [{"type": "directory", "path": "sub"}])
+        path = request.url.path.removeprefix("/org/tiny/resolve/main/")
+        if path not in files:
+            return httpx.Response(404)
+        active[0] += 1
+        active[1] = max(active)
+        await asyncio.sleep(delay)
+        active[0] -= 1
+        data = files[path]
+        if "range" in request.headers:
+            start = int(request.headers["range"].removeprefix("bytes=").rstrip("-"))
+            return httpx.Response(206, content=data[start:])
+        return httpx.Response(200, content=data)
+
+    return httpx.MockTransport(handler), active
+
+
+def test_fetch_from_mirror_writes_manifest(tmp_path, tiny):
+    mirror = tmp_path / "mirror" / "org" / "tiny"
+    mirror.mkdir(parents=True)
+    for path, data in FILES.items():
+        (mirror / path).write_bytes(data)
+    (mirror / ".gitattributes").write_text("*")
+
+    assert not is_complete(tiny)
+    manifest = asyncio.run(Prefetcher(MirrorSource(tmp_path / "mirror")).fetch("tiny"))
+    target = model_dir(tiny)
+    assert manifest["complete"]
+    assert sorted(manifest["files"]) == sorted(FILES)
+    assert manifest["files"]["model.safetensors"]["sha256"] == hashlib.sha256(FILES["model.safetensors"]).hexdigest()
+    assert (target / "model.safetensors").read_bytes() == FILES["model.safetensors"]
+    assert not (target / ".gitattributes").exists()
+    assert is_complete(tiny)
+    assert prefetch.verify(tiny) == []
+
+    # A truncated file is noticed from its size alone, and fetched again
+    (target / "model.safetensors").write_bytes(b"short")
+    assert not is_complete(tiny)
+    asyncio.run(Prefetcher(MirrorSource(tmp_path / "mirror")).fetch("tiny"))
+    assert is_complete(tiny)
+
+
+def test_http_fetch_resumes_partial_file(tiny):
+    requests = []
+    transport, _ = hub(FILES, requests)
+    target = model_dir(tiny)
+    target.mkdir(parents=True)
+    data = FILES["model.safetensors"]
+    (target / "model.safetensors.part").write_bytes(data[:100000])
+
+    prefetcher = Prefetcher(HubSource("http://hub.test", transport=transport))
+    asyncio.run(prefetcher.fetch("tiny"))
+    assert (target / "model.safetensors").read_bytes() == data
+    assert not (target / "model.safetensors.part").exists()
+    ranged = [r for r in requests if "range" in r.headers]
+    assert [r.headers["range"] for r in ranged] == ["bytes=100000-"]
+    assert prefetcher.fetched_bytes == len(data) - 100000 + len(FILES["config.json"])
+    assert is_complete(tiny)
+
+    # Already complete: only the listing is requested
+    requests.clear()
+    asyncio.run(Prefetcher(HubSource("http://hub.test", transport=transport)).fetch("tiny"))
+    assert [r.url.path for r in requests] == ["/api/models/org/tiny/tree/main"]
+
+
+def test_hash_mismatch_is_rejected(tiny):
+    transport, _ = hub(FILES, [])
+
+    async def corrupt(request):
+        response = await transport.handle_async_request(request)
+        if request.url.path.endswith("model.safetensors"):
+            await response.aread()
+            return httpx.Response(200, content=b"x" * len(FILES["model.safetensors"]))
+        return response
+
+    source = HubSource("http://hub.test", transport=httpx.MockTransport(corrupt))
+    with pytest.raises(PrefetchError, match="sha256"):
+        asyncio.run(Prefetcher(source).fetch("tiny"))
+    target = model_dir(tiny)
+    assert not (target / "model.safetensors").exists()
+    assert not (target / "model.safetensors.part").exists()
+    manifest = read_manifest(target)
+    assert not manifest["complete"]
+    assert list(manifest["files"]) == ["config.json"]
+    assert not is_complete(tiny)
+
+
+def test_jobs_bound_concurrent_downloads(tiny):
+    files = {f"shard-{i}.safetensors": bytes([i]) * 1000 for i in range(8)}
+    transport, active = hub(files, [], delay=0.02)
+    asyncio.run(Prefetcher(HubSource("http://hub.test", transport=transport), jobs=3).fetch("tiny"))
+    assert active[1] == 3
+    manifest = json.loads((model_dir(tiny) / prefetch.MANIFEST_NAME).read_text())
+    assert len(manifest["files"]) == 8
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("starlette")
+
+from proxy_stream import StreamStats, UpstreamStreamingResponse, abandon, relay
+
+
+class FakeUpstream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    async def aiter_bytes(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_relay_counts_completed_stream():
+    stats = StreamStats()
+    upstream = FakeUpstream([b"data: a\n\n", b"data: b\n\n"])
+    stats.started("qwen-0.5")
+
+    async def run():
+        return [chunk async for chunk in relay(upstream, "qwen-0.5", stats, 16)]
+
+    assert len(asyncio.run(run())) == 2
+    assert upstream.closed
+    assert stats.snapshot()["qwen-0.5"] == {
+        "in_flight": 0, "completed": 1, "failed": 0, "aborted": 0, "tokens_saved_est": 0,
+    }
+
+
+def test_relay_closes_upstream_when_client_goes_away():
+    stats = StreamStats()
+    upstream = FakeUpstream([b"data: x\n\n"] * 10)
+    stats.started("qwq-32b")
+
+    async def run():
+        body = relay(upstream, "qwq-32b", stats, 100)
+        await body.__anext__()
+        await body.__anext__()
+        # What UpstreamStreamingResponse does when the client disconnects
+        await body.aclose()
+
+    asyncio.run(run())
+    assert upstream.closed
+    assert stats.snapshot()["qwq-32b"] == {
+        "in_flight": 0, "completed": 0, "failed": 0, "aborted": 1, "tokens_saved_est": 98,
+    }
+
+
+def test_disconnect_before_first_chunk_still_cleans_up():
+    stats = StreamStats()
+    upstream = FakeUpstream([b"data: x\n\n"] * 10)
+    stats.started("qwq-32b")
+    closed = []
+
+    async def run():
+        stalled = asyncio.Event()
+
+        async def receive():
+            await stalled.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            # A paused transport: the response start never goes out
+            stalled.set()
+            await asyncio.Event().wait()
+
+        body = relay(upstream, "qwq-32b", stats, 100, on_close=lambda: closed.append(True))
+        response = UpstreamStreamingResponse(
+            body, on_unstarted=lambda: abandon(upstream, "qwq-32b", stats, 100, on_close=lambda: closed.append(True))
+        )
+        await response({"type": "http"}, receive, send)
+
+    asyncio.run(run())
+    assert upstream.closed and closed == [True]
+    assert stats.snapshot()["qwq-32b"] == {
+        "in_flight": 0, "completed": 0, "failed": 0, "aborted": 1, "tokens_saved_est": 100,
+    }
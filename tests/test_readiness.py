@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+
+from backend_health import DOWN, UNKNOWN, UP, WARMING, HealthMonitor
+from readiness import wait_until_ready, warmup_requests
+
+
+def test_wait_until_ready_backs_off_until_probe_succeeds():
+    calls = []
+
+    async def probe():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("not yet")
+        return True
+
+    waited = asyncio.run(wait_until_ready(probe, timeout=5, initial_delay=0.01))
+    assert len(calls) == 3
+    assert waited >= 0.03
+
+
+def test_wait_until_ready_times_out():
+    async def probe():
+        return False
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(wait_until_ready(probe, timeout=0.05, initial_delay=0.01))
+
+
+def test_warmup_requests_fill_context_up_to_cap():
+    steps = warmup_requests("qwen-0.5", {"max_model_len": 32768}, ["short", "full"], full_context_cap=1000)
+    assert [label for label, _ in steps] == ["short", "full"]
+    assert steps[0][1]["max_tokens"] == 1
+    assert len(steps[1][1]["prompt"].split()) == 892
+
+
+def test_backend_coming_up_is_warmed_before_routable():
+    up = {"value": False}
+    release = None
+
+    async def fetch(name):
+        if not up["value"]:
+            raise ConnectionError(name)
+        return {"data": [{"id": "m", "max_model_len": 4096}]}
+
+    async def warm_up(name, model_card, down_since):
+        await release.wait()
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        monitor = HealthMonitor(fetch, lambda: ["m"], warm_up=warm_up, down_after=1)
+        states = [(await monitor.refresh("m")).state]
+        up["value"] = True
+        states.append((await monitor.refresh("m")).state)
+        states.append((await monitor.refresh("m")).state)
+        release.set()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        states.append(monitor.state("m"))
+        return states
+
+    assert asyncio.run(run()) == [DOWN, WARMING, WARMING, UP]
+
+
+def test_backend_is_down_only_after_consecutive_failures():
+    results = [asyncio.TimeoutError(), None, ConnectionError("m"), ConnectionError("m"), ConnectionError("m")]
+
+    async def fetch(name):
+        error = results.pop(0)
+        if error is not None:
+            raise error
+        return {"data": [{"id": "m"}]}
+
+    async def run():
+        monitor = HealthMonitor(fetch, lambda: ["m"], down_after=3)
+        return [(await monitor.refresh("m")).state for _ in range(5)]
+
+    assert asyncio.run(run()) == [UNKNOWN, UP, UP, UP, DOWN]
+
+
+def test_health_absorbed_from_another_process():
+    async def fetch(name):
+        return {"data": [{"id": "m"}]}
+
+    async def run():
+        polling = HealthMonitor(fetch, lambda: ["m"])
+        await polling.refresh("m")
+        return polling.export()
+
+    # Published as JSON by one router worker, read back by another
+    exported = json.loads(json.dumps(asyncio.run(run())))
+    reader = HealthMonitor(None, lambda: ["m"])
+    reader.absorb(exported)
+    assert reader.state("m") == UP
+    assert reader.backends["m"].models == [{"id": "m"}]
+    assert reader.version == 1
+    reader.absorb(exported)
+    assert reader.version == 1
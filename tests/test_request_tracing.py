@@ -0,0 +1,52 @@
+import time
+
+from request_tracing import Tracer, otlp_payload
+from router_metrics import RouterMetrics
+
+
+def traced(tracer, status=200, sleep=0.0):
+    trace = tracer.start("POST", "/v1/chat/completions", time.perf_counter())
+    trace.phase("read_body")
+    trace.phase("route")
+    trace.attrs["model"] = "m"
+    trace.phase("upstream_connect", replica="localhost:8001")
+    time.sleep(sleep)
+    observer = RouterMetrics().observe("m", trace.started)
+    trace.phase("first_byte", status=status)
+    trace.observer = observer
+    observer.chunk(b"data: {}\n\n")
+    trace.finish(status)
+    return trace
+
+
+def test_tail_sampling_keeps_slow_and_failed_requests():
+    tracer = Tracer(capacity=2, slow_ms=20, sample=0.0)
+    traced(tracer)
+    traced(tracer, status=502)
+    traced(tracer, sleep=0.03)
+    stats = tracer.stats()
+    assert (stats["requests"], stats["kept_errors"], stats["kept_slow"], stats["kept_sampled"]) == (3, 1, 1, 0)
+    slow, failed = tracer.traces()
+    assert failed["status"] == 502
+    assert slow["duration_ms"] >= 20
+    assert tracer.traces(min_ms=20) == [slow]
+    assert [span["name"] for span in slow["spans"]] == [
+        "headers", "read_body", "route", "upstream_connect", "first_byte", "stream",
+    ]
+    connect = slow["spans"][3]
+    assert connect["replica"] == "localhost:8001" and connect["duration_ms"] >= 30
+    assert slow["model"] == "m"
+
+
+def test_otlp_payload_nests_phases_under_a_root_span():
+    tracer = Tracer(slow_ms=0)
+    traced(tracer, status=503)
+    record = tracer.traces()[0]
+    spans = otlp_payload([record])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    root = spans[0]
+    assert root["name"] == "POST /v1/chat/completions"
+    assert root["status"] == {"code": 2}
+    assert {"key": "model", "value": {"stringValue": "m"}} in root["attributes"]
+    assert len(spans) == 1 + len(record["spans"])
+    assert all(span["parentSpanId"] == root["spanId"] and span["traceId"] == record["trace_id"] for span in spans[1:])
+    assert int(spans[1]["startTimeUnixNano"]) == int(root["startTimeUnixNano"])
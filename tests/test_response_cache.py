@@ -0,0 +1,50 @@
+import asyncio
+
+from response_cache import CachedResponse, ResponseCache, cache_key
+
+
+def test_cache_key_only_for_deterministic_completions():
+    body = {"model": "codestral", "temperature": 0, "messages": [{"role": "user", "content": "hi"}]}
+    reordered = {"messages": [{"role": "user", "content": "hi"}], "temperature": 0, "model": "codestral", "user": "ci"}
+    assert cache_key("v1/chat/completions", body) == cache_key("/v1/chat/completions", reordered)
+    assert cache_key("v1/chat/completions", dict(body, stream=True)) != cache_key("v1/chat/completions", body)
+    assert cache_key("v1/chat/completions", dict(body, temperature=0.7)) is None
+    assert cache_key("v1/embeddings", body) is None
+
+
+def test_memory_tier_evicts_least_recently_used():
+    async def run():
+        cache = ResponseCache(max_bytes=10)
+        await cache.put("a", CachedResponse(200, "application/json", [b"aaaa"]))
+        await cache.put("b", CachedResponse(200, "application/json", [b"bbbb"]))
+        await cache.get("a")
+        await cache.put("c", CachedResponse(200, "application/json", [b"cccc"]))
+        return [await cache.get(k) is not None for k in "abc"], cache.stats()
+
+    present, stats = asyncio.run(run())
+    assert present == [True, False, True]
+    assert stats["memory_evictions"] == 1
+    assert stats["misses"] == 1
+
+
+def test_disk_tier_survives_restart_and_keeps_chunking(tmp_path):
+    db = tmp_path / "cache.sqlite"
+    chunks = [b"data: {\"a\": 1}\n\n", b"data: [DONE]\n\n"]
+
+    async def store():
+        cache = ResponseCache(max_bytes=1024, disk_path=db)
+        await cache.put("k", CachedResponse(200, "text/event-stream", chunks))
+        cache.close()
+
+    async def load():
+        cache = ResponseCache(max_bytes=1024, disk_path=db)
+        entry = await cache.get("k")
+        stats = cache.stats()
+        cache.close()
+        return entry, stats
+
+    asyncio.run(store())
+    entry, stats = asyncio.run(load())
+    assert entry.chunks == chunks
+    assert entry.content_type == "text/event-stream"
+    assert stats["disk_hits"] == 1
@@ -0,0 +1,51 @@
+import json
+import time
+
+from router_metrics import RouterMetrics
+
+
+def test_observer_records_ttft_itl_and_usage():
+    metrics = RouterMetrics()
+    observer = metrics.observe("qwen-0.5", time.perf_counter())
+    observer.response(200)
+    observer.chunk(b'data: {"choices": [{"delta": {"content": "a"}}]}\n\n')
+    observer.chunk(b'data: {"choices": [{"delta": {"content": "b"}}]}\n\n')
+    observer.chunk(b'data: {"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": 2}}\n\ndata: [DONE]\n\n')
+    observer.finish(True, 4)
+
+    text = "\n".join(metrics.render())
+    assert 'router_requests_total{model="qwen-0.5",code="200"} 1' in text
+    assert 'router_prompt_tokens_total{model="qwen-0.5"} 12' in text
+    assert 'router_completion_tokens_total{model="qwen-0.5"} 2' in text
+    assert 'router_time_to_first_token_seconds_count{model="qwen-0.5"} 1' in text
+    assert 'router_inter_token_latency_seconds_count{model="qwen-0.5"} 2' in text
+    assert 'router_time_to_first_token_seconds_bucket{model="qwen-0.5",le="+Inf"} 1' in text
+
+
+def test_aborted_stream_without_usage_counts_events():
+    metrics = RouterMetrics()
+    observer = metrics.observe("qwq-32b", time.perf_counter())
+    observer.response(200)
+    for _ in range(5):
+        observer.chunk(b"data: {}\n\n")
+    observer.finish(False, 5)
+
+    text = "\n".join(metrics.render())
+    assert 'router_requests_aborted_total{model="qwq-32b"} 1' in text
+    assert 'router_completion_tokens_total{model="qwq-32b"} 4' in text
+
+
+def test_combined_adds_up_other_workers_series():
+    local, other = RouterMetrics(), RouterMetrics()
+    for metrics, code in ((local, "200"), (other, "200"), (other, "429")):
+        observer = metrics.observe("m", time.perf_counter())
+        observer.response(int(code))
+        observer.chunk(b"data: {}\n\n")
+        observer.finish(True, 1)
+    # Through JSON, as published between router workers
+    export = json.loads(json.dumps(other.export()))
+    text = "\n".join(local.combined([export]).render())
+    assert 'router_requests_total{model="m",code="200"} 2' in text
+    assert 'router_requests_total{model="m",code="429"} 1' in text
+    assert 'router_time_to_first_token_seconds_count{model="m"} 3' in text
+    assert 'router_requests_total{model="m",code="200"} 1' in "\n".join(local.render())
@@ -0,0 +1,27 @@
+import threading
+
+from sampling_profiler import SamplingProfiler
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profile_of_a_busy_thread():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,))
+    worker.start()
+    try:
+        profiler = SamplingProfiler(worker.ident, hz=200)
+        profiler.run(0.2)
+    finally:
+        stop.set()
+        worker.join()
+    assert profiler.samples > 5
+    lines = profiler.folded().splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert "busy_loop (test_sampling_profiler.py:" in stack
+    # Outermost frame first
+    assert stack.split(";")[0].startswith("_bootstrap ")
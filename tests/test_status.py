@@ -0,0 +1,39 @@
+from status import parse_ps, parse_tokens_per_second, render, tree_rss
+
+
+def test_process_tree_rss():
+    # bash wrapper 501 -> python 502 -> engine core 503
+    table = parse_ps("  501     1   2000\n  502   501 400000\n  503   502 900000\n  900     1  50\n")
+    children = {}
+    for pid, (ppid, _) in table.items():
+        children.setdefault(ppid, []).append(pid)
+    assert tree_rss(table, children, 501) == 1302000
+    assert tree_rss(table, children, 4242) is None
+
+
+def test_tokens_per_second_from_metrics():
+    metrics = (
+        'router_completion_tokens_per_second_bucket{model="qwen-0.5",le="+Inf"} 2\n'
+        'router_completion_tokens_per_second_sum{model="qwen-0.5"} 90.0\n'
+        'router_completion_tokens_per_second_count{model="qwen-0.5"} 2\n'
+    )
+    assert parse_tokens_per_second(metrics) == {"qwen-0.5": 45.0}
+    assert parse_tokens_per_second(None) == {}
+
+
+def test_render_includes_router_line():
+    snapshot = {
+        "router": {"status": "RUNNING", "pid": 10, "reachable": True, "rss_kb": 60 * 1024},
+        "models": {
+            "qwen-0.5": {
+                "status": "RUNNING", "pid": 501, "port": 8011, "rss_kb": 1302000, "est_ram": "1 GB",
+                "params": "0.5B", "downloaded": "YES", "health": {"localhost:8011": "up"},
+                "in_flight": 3, "tokens_per_second": 45.0,
+            },
+        },
+    }
+    lines = render(snapshot)
+    assert "qwen-0.5" in lines[2] and "up" in lines[2] and "45.0" in lines[2] and "1.2 GB" in lines[2]
+    snapshot["models"]["qwen-0.5"]["sizing"] = {"fits": True, "max_model_len": 32768, "max_num_seqs": 96}
+    assert "32768   96" in render(snapshot)[2]
+    assert lines[-1].startswith("router")
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import sys
+
+import prefetch
+import supervisor
+from supervisor import LaunchdBackend, NativeBackend, RotatingLog, ServiceRunner, service_spec
+
+
+def test_log_rotation(tmp_path):
+    log = RotatingLog(tmp_path / "m.log", max_bytes=10, backups=2)
+    for chunk in (b"aaaaaaaa", b"bbbbbbbb", b"cccccccc", b"dddddddd"):
+        log.write(chunk)
+    log.close()
+    assert (tmp_path / "m.log").read_bytes() == b"dddddddd"
+    assert (tmp_path / "m.log.1").read_bytes() == b"cccccccc"
+    assert (tmp_path / "m.log.2").read_bytes() == b"bbbbbbbb"
+    assert not (tmp_path / "m.log.3").exists()
+
+
+def test_service_spec_runs_vllm_directly(tmp_path, monkeypatch):
+    monkeypatch.setattr(prefetch, "MODELS_DIR", tmp_path)
+    monkeypatch.setitem(supervisor.MODELS, "tiny", {"repo_id": "org/tiny", "port": 8099, "vllm_args": ["--max-model-len", "2048"]})
+    spec = service_spec("tiny")
+    assert "bash" not in spec["argv"][0]
+    assert spec["argv"][1:3] == ["-m", "vllm.entrypoints.openai.api_server"]
+    assert spec["argv"][-2:] == ["--max-model-len", "2048"]
+    assert spec["download"][-2:] == [str(supervisor.PROJECT_ROOT / "scripts" / "prefetch.py"), "tiny"]
+
+    # A complete manifest means no download step
+    (tmp_path / "org_tiny").mkdir()
+    (tmp_path / "org_tiny" / "config.json").write_text("{}")
+    prefetch.write_manifest(tmp_path / "org_tiny", {
+        "repo_id": "org/tiny", "complete": True, "files": {"config.json": {"size": 2, "sha256": "x"}},
+    })
+    assert service_spec("tiny")["download"] is None
+
+
+def test_runner_restarts_crashing_service(tmp_path, monkeypatch):
+    monkeypatch.setattr(supervisor, "RESTART_INITIAL_DELAY", 0.01)
+    marker = tmp_path / "attempts"
+    # Fails twice, then exits cleanly
+    script = (
+        "import pathlib, sys; p = pathlib.Path(sys.argv[1]); n = len(p.read_text()) if p.exists() else 0; "
+        "p.write_text('x' * (n + 1)); print('attempt', n + 1); sys.exit(1 if n < 2 else 0)"
+    )
+    monkeypatch.setattr(supervisor, "service_spec", lambda name: {"argv": [sys.executable, "-c", script, str(marker)], "download": None})
+    log = RotatingLog(tmp_path / "svc.log")
+    runner = ServiceRunner("svc", log)
+    asyncio.run(runner.run())
+    log.close()
+    assert runner.restarts == 2
+    output = (tmp_path / "svc.log").read_text()
+    assert "attempt 3" in output
+    assert "exited cleanly" in output
+
+
+def test_launchctl_list_parsing():
+    services = LaunchdBackend.parse_list(
+        "PID\tStatus\tLabel\n"
+        "501\t0\tcom.jowest.vllm.qwen-0.5\n"
+        "-\t0\tcom.jowest.vllm.mixtral\n"
+        "77\t0\tcom.apple.something\n"
+    )
+    assert services == {"qwen-0.5": 501}
+
+
+def test_native_pid_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(supervisor, "RUN_DIR", tmp_path)
+    (tmp_path / "router.pid").write_text(str(os.getpid()))
+    # A runner that died without cleaning up
+    (tmp_path / "qwen-0.5.pid").write_text("999999999")
+    assert NativeBackend().running() == {"router": os.getpid()}
+    assert not (tmp_path / "qwen-0.5.pid").exists()
+
+
+def test_native_stop_of_runner_that_just_exited(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(supervisor, "RUN_DIR", tmp_path)
+    (tmp_path / "qwen-0.5.pid").write_text("999999999")
+    # Seen running, but gone by the time it is signalled
+    monkeypatch.setattr(NativeBackend, "running", lambda self: {"qwen-0.5": 999999999})
+    NativeBackend().stop(["qwen-0.5"])
+    assert "Stopped qwen-0.5" in capsys.readouterr().out
+    assert not (tmp_path / "qwen-0.5.pid").exists()
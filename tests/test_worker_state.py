@@ -0,0 +1,58 @@
+import asyncio
+import json
+import time
+
+import httpx
+
+from worker_state import CoordinatorForwarding, WorkerState
+
+
+def test_workers_see_each_others_snapshots(tmp_path):
+    refreshed = []
+    first = WorkerState(lambda: {"in_flight": {"m": 2}}, refreshed.append, worker_id=0, workers=3, directory=tmp_path)
+    second = WorkerState(lambda: {"in_flight": {"m": 3}}, worker_id=1, workers=3, directory=tmp_path)
+    second.publish()
+    # Worker 2 died long ago
+    (tmp_path / "worker-2.json").write_text(json.dumps({"in_flight": {"m": 50}, "published_at": time.time() - 60}))
+    first.refresh()
+    assert list(first.peers) == [1]
+    assert first.peer_sum("in_flight", "m") == 3
+    assert first.peer_sum("in_flight", "other") == 0
+    assert refreshed == [first.peers]
+    second.refresh()
+    assert second.peers[0]["in_flight"] == {"m": 2}
+
+
+def test_forwarding_relays_prefixed_paths():
+    seen = []
+
+    class FakeCoordinator:
+        async def request(self, method, path, headers=None, content=None, timeout=30.0):
+            seen.append((method, path, content, timeout))
+            return httpx.Response(201, json={"id": "batch_1"})
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"local"})
+
+    async def call(middleware, path):
+        sent = []
+        messages = [{"type": "http.request", "body": b"{", "more_body": True},
+                    {"type": "http.request", "body": b"}", "more_body": False}]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": path, "query_string": b"limit=2", "headers": []}
+        await middleware(scope, receive, send)
+        return sent[0]["status"], sent[1]["body"]
+
+    middleware = CoordinatorForwarding(app, ("/v1/batches", "/v1/files"), FakeCoordinator(),
+                                       timeouts={"/v1/files": 600.0})
+    assert asyncio.run(call(middleware, "/v1/batches")) == (201, b'{"id":"batch_1"}')
+    assert asyncio.run(call(middleware, "/v1/models")) == (200, b"local")
+    assert asyncio.run(call(middleware, "/v1/files"))[0] == 201
+    assert seen == [("POST", "/v1/batches?limit=2", b"{}", 30.0), ("POST", "/v1/files?limit=2", b"{}", 600.0)]